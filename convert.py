@@ -0,0 +1,257 @@
+"""
+各配列ごとの n-gram 頻度ファイル（TSV/CSV の方言がそれぞれ違う）を
+1 つのスクリプトでまとめて JSON（またはバイナリの gram 表）に変換する。
+
+tsukimiso1-4preprocess.py, emojinarabeasobi2/3preprocess.py, singeta2preprocess.py,
+wiki/wikikanapreprocess.py の置き換え。
+
+- 行の形式ごとにパーサ関数を PARSERS に登録し、JOBS で入力・パーサ・出力を対応付ける。
+- 入力はストリームで読み、同じ gram が複数回出てきたら頻度を合計する
+  （emojinarabeasobi3preprocess.py と同じ扱い）。CHUNK_ENTRIES 件を超えたら
+  gram 順の一時ファイルに書き出してマージするので、入力全体を dict に載せない。
+- 出力は gram 順の compact JSON（indent なし）か、prindex.write_table の gram 表（.bin）。
+- 各ジョブは別プロセスで並列に処理する。
+
+使い方:
+  python convert.py                      # 全ジョブを JSON で出力
+  python convert.py --format both        # JSON と .bin の両方
+  python convert.py --only tsukimiso3 --only wikikana3
+"""
+import argparse
+import heapq
+import json
+import os
+import re
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from prindex import write_table
+
+# --- 設定 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHUNK_ENTRIES = 2_000_000   # これを超えたら一時ファイルに書き出す（異なり gram 数）
+WORKERS = os.cpu_count() or 1
+# -------------
+
+
+def _int(s):
+    """頻度欄を整数にする。余分な文字がついていれば数字部分だけを使う"""
+    try:
+        return int(s)
+    except ValueError:
+        m = re.search(r'\d+', s)
+        return int(m.group(0)) if m else None
+
+
+def parse_count_gram(line):
+    """"頻度<TAB>gram"（emojinarabeasobi, wikipedia.hiragana-asis, singeta1）"""
+    parts = line.split('\t')
+    if len(parts) < 2:
+        return None
+    count = _int(parts[0])
+    return (parts[1], count) if count is not None else None
+
+
+def parse_count_chars(line):
+    """"頻度<TAB>文字1<TAB>文字2..."（singeta2.csv）"""
+    parts = line.split('\t')
+    if len(parts) < 2:
+        return None
+    count = _int(parts[0])
+    return (''.join(parts[1:]), count) if count is not None else None
+
+
+def parse_chars_count(line):
+    """"文字1<TAB>文字2...<TAB>頻度"（tsukimiso4）"""
+    parts = line.split('\t')
+    if len(parts) < 2:
+        return None
+    count = _int(parts[-1])
+    return (''.join(parts[:-1]), count) if count is not None else None
+
+
+def parse_pair_count(line):
+    """"文字1<TAB>文字2<TAB>頻度[<TAB>...]"（tsukimiso2。後ろに余分な列がつく行がある）"""
+    parts = line.split('\t')
+    if len(parts) < 3:
+        return None
+    count = _int(parts[2])
+    return (parts[0] + parts[1], count) if count is not None else None
+
+
+def parse_ws_gram_count(line):
+    """"gram 頻度"（空白区切り、tsukimiso1）"""
+    parts = line.split()
+    if len(parts) < 2:
+        return None
+    count = _int(parts[1])
+    return (parts[0], count) if count is not None else None
+
+
+_QUOTED_RE = re.compile(r'"([^"]+)"\s*"(\d+)[^"]*"')
+
+
+def parse_quoted(line):
+    """'"gram<TAB>"<TAB>"頻度<TAB>"'（tsukimiso3）"""
+    m = _QUOTED_RE.match(line)
+    if not m:
+        return None
+    return m.group(1).replace('\t', ''), int(m.group(2))
+
+
+PARSERS = {
+    'count_gram': parse_count_gram,
+    'count_chars': parse_count_chars,
+    'chars_count': parse_chars_count,
+    'pair_count': parse_pair_count,
+    'ws_gram_count': parse_ws_gram_count,
+    'quoted': parse_quoted,
+}
+
+# (名前, 入力, パーサ, 出力（拡張子なし）) ※パスは BASE_DIR からの相対
+JOBS = [
+    ('tsukimiso1', 'tsukimiso/tsukimiso1gram.txt', 'ws_gram_count', 'tsukimiso/tsukimiso1gram'),
+    ('tsukimiso2', 'tsukimiso/tsukimiso2gram.txt', 'pair_count', 'tsukimiso/tsukimiso2gram'),
+    ('tsukimiso3', 'tsukimiso/tsukimiso3gram.txt', 'quoted', 'tsukimiso/tsukimiso3gram'),
+    ('tsukimiso4', 'tsukimiso/tsukimiso4gram.txt', 'chars_count', 'tsukimiso/tsukimiso4gram'),
+    ('emojinarabeasobi2', 'emojinarabeasobi/emojinarabeasobi2gram.txt', 'count_gram', 'emojinarabeasobi/emojinarabeasobi2gram'),
+    ('emojinarabeasobi3', 'emojinarabeasobi/emojinarabeasobi3gram.txt', 'count_gram', 'emojinarabeasobi/emojinarabeasobi3gram'),
+    ('singeta1', 'singeta/singeta1.csv', 'count_gram', 'singeta/singeta1gram'),
+    ('singeta2', 'singeta/singeta2.csv', 'count_chars', 'singeta/singeta2gram'),
+    ('wikikana1', 'wiki/wikipedia.hiragana-asis.1gram.txt', 'count_gram', 'wiki/wikikana1gram'),
+    ('wikikana2', 'wiki/wikipedia.hiragana-asis.2gram.txt', 'count_gram', 'wiki/wikikana2gram'),
+    ('wikikana3', 'wiki/wikipedia.hiragana-asis.3gram.txt', 'count_gram', 'wiki/wikikana3gram'),
+]
+
+
+def iter_records(path, parser):
+    """入力を 1 行ずつパースして (gram, count) を返す（パースできない行は None）"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('//'):
+                continue
+            rec = parser(line)
+            if rec is None or not rec[0]:
+                yield None
+                continue
+            yield rec
+
+
+def _spill(counter, tmp_dir, runs):
+    path = os.path.join(tmp_dir, f"run{len(runs):04d}.tsv")
+    with open(path, 'w', encoding='utf-8') as f:
+        for gram, count in sorted(counter.items()):
+            f.write(f"{gram}\t{count}\n")
+    runs.append(path)
+    counter.clear()
+
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for ln in f:
+            gram, count = ln.rstrip('\n').rsplit('\t', 1)
+            yield gram, int(count)
+
+
+def aggregate(records, tmp_dir, chunk_entries=CHUNK_ENTRIES):
+    """(gram, count) の列を gram ごとに合計し、gram 順に返す。戻りは (行の iterator, 統計)"""
+    counter = Counter()
+    runs = []
+    stats = {'lines': 0, 'errors': 0, 'duplicates': 0}
+    for rec in records:
+        if rec is None:
+            stats['errors'] += 1
+            continue
+        stats['lines'] += 1
+        gram, count = rec
+        if gram in counter:
+            stats['duplicates'] += 1
+        counter[gram] += count
+        if len(counter) >= chunk_entries:
+            _spill(counter, tmp_dir, runs)
+    if not runs:
+        return iter(sorted(counter.items())), stats
+    if counter:
+        _spill(counter, tmp_dir, runs)
+
+    def merged():
+        cur, acc = None, 0
+        for gram, count in heapq.merge(*(_read_run(p) for p in runs), key=lambda x: x[0]):
+            if gram == cur:
+                stats['duplicates'] += 1
+                acc += count
+                continue
+            if cur is not None:
+                yield cur, acc
+            cur, acc = gram, count
+        if cur is not None:
+            yield cur, acc
+
+    return merged(), stats
+
+
+def json_tee(path, rows):
+    """行をそのまま流しながら、compact な JSON オブジェクトとして path に書く（全体を dict にしない）"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        first = True
+        for gram, count in rows:
+            if not first:
+                f.write(',')
+            first = False
+            f.write(json.dumps(gram, ensure_ascii=False))
+            f.write(f':{count}')
+            yield gram, count
+        f.write('}')
+
+
+def run_job(name, src, parser_name, dst, fmt):
+    src_path = os.path.join(BASE_DIR, src)
+    dst_base = os.path.join(BASE_DIR, dst)
+    if not os.path.exists(src_path):
+        return name, None, f"入力ファイルがありません: {src_path}"
+    parser = PARSERS[parser_name]
+    with tempfile.TemporaryDirectory(prefix=f"convert_{name}_") as tmp_dir:
+        rows, stats = aggregate(iter_records(src_path, parser), tmp_dir)
+        if fmt == 'json':
+            n = sum(1 for _ in json_tee(dst_base + '.json', rows))
+        elif fmt == 'bin':
+            n = write_table(dst_base + '.bin', rows)
+        else:
+            # 両方書くときは JSON を書きながら同じ行を .bin にも流す
+            n = write_table(dst_base + '.bin', json_tee(dst_base + '.json', rows))
+    stats['entries'] = n
+    return name, stats, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="配列ごとの n-gram 頻度ファイルを JSON / gram 表に変換する")
+    parser.add_argument('--format', choices=['json', 'bin', 'both'], default='json', help="出力形式（既定: json）")
+    parser.add_argument('--only', action='append', help="処理するジョブ名（複数指定可）")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="並列プロセス数")
+    args = parser.parse_args()
+
+    jobs = [j for j in JOBS if not args.only or j[0] in args.only]
+    if not jobs:
+        print("対象ジョブがありません:", ", ".join(j[0] for j in JOBS), file=sys.stderr)
+        sys.exit(1)
+
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(jobs)))) as ex:
+        futures = [ex.submit(run_job, *job, args.format) for job in jobs]
+        for fut in as_completed(futures):
+            try:
+                name, stats, err = fut.result()
+            except Exception as e:
+                print(f"エラーが発生しました: {e}", file=sys.stderr)
+                continue
+            if err:
+                print(f"スキップ {name}: {err}")
+                continue
+            print(f"{name}: {stats['entries']} 件 (行数 {stats['lines']}, 重複 {stats['duplicates']}, 不正 {stats['errors']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+コーパスの文字 1..7-gram を形態素解析なしで集計する（nwc2010/char と比べられる表を作る）。
+
+- 入力をコードポイントの uint32 配列（UTF-32）にし、SCRIPTS で選んだ文字だけを残す。
+  対象外の文字（改行・空白・他の文字種）の位置で n-gram を切るので、n-gram は
+  行や空白をまたがない。
+- 残った文字をブロックごとに密な ID に振り直し、npcount.py（sliding_window_view +
+  np.unique）でまとめて数える。
+- ファイルはおよそ GROUP_MB ずつのグループに分け、プロセスプールで並列に数える。
+  各グループはチャンク（gram 昇順の TSV）を書き、マージ・出現頻度順の外部ソート・
+  分割出力・git push は engine.py と同じ ngramio.py の流れを使う。
+
+出力: <出力先>/{n}<name>0000.txt ...（"文 字 列<TAB>頻度"、頻度降順。gram の文字は空白区切り）
+
+使い方:
+  python chars.py                       # hplt の purif8
+  python chars.py --corpus wiki --workers 8
+  python chars.py --corpus livedoor --script ja+ascii --min-count 2
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+import npcount
+from ngramio import merge_and_export, get_git_root, git_add_commit_push
+
+# --- 設定 ---
+# コーパスごとの入力・出力。skip_lines は各ファイル先頭の読み飛ばす行数（livedoor の URL と日付）
+CORPORA = {
+    "hplt": {"in_dir": Path(r"D:\gramdata\hplt\purif8"), "pattern": "purif*.txt",
+             "out_dir": Path(r"D:\gramdata\hplt\char"), "skip_lines": 0, "name": "hpltchar"},
+    "wiki": {"in_dir": Path(r"D:\gramdata\wiki\data"), "pattern": "wiki40b-ja_*.txt",
+             "out_dir": Path(r"D:\gramdata\wiki\char"), "skip_lines": 0, "name": "wikichar"},
+    "livedoor": {"in_dir": Path(r"D:\gramdata\livedoor\text"), "pattern": "*/*-[0-9]*.txt",
+                 "out_dir": Path(r"D:\gramdata\livedoor\char"), "skip_lines": 2, "name": "livedoorchar"},
+}
+NGRAM_MAX = 7
+MIN_COUNT = 10            # 出力に含める最低頻度
+SIZE_MB = 50              # 最終出力ファイルの分割サイズ（MB）
+GROUP_MB = 64             # 1 つのワーカーにまとめて渡すファイルの合計サイズ（MB）
+BLOCK_CHARS = 16_000_000  # 一度に配列にする文字数の目安（行の途中では切らない）
+WORKERS = os.cpu_count() or 1
+SCRIPT = "ja"
+
+# 数える文字種（コードポイントの範囲）。どれでも空白・制御文字は数えない
+SCRIPTS = {
+    # engine.py の is_japanese_token と同じ範囲
+    "ja": [(0x3040, 0x309F), (0x30A0, 0x30FF), (0x4E00, 0x9FFF), (0x3000, 0x303F),
+           (0xFF00, 0xFFEF), (0x2010, 0x2015)],
+    "ja+ascii": [(0x3040, 0x309F), (0x30A0, 0x30FF), (0x4E00, 0x9FFF), (0x3000, 0x303F),
+                 (0xFF00, 0xFFEF), (0x2010, 0x2015), (0x21, 0x7E)],
+    "all": [(0x21, 0x7E), (0xA0, 0x10FFFF)],
+}
+
+# Git push 関連
+ENABLE_GIT = True
+N_FILES_PER_PUSH = 5
+GIT_COMMIT_MESSAGE_PREFIX = "add char ngram files"
+# -------------
+
+
+@lru_cache(maxsize=None)
+def allowed_table(script: str):
+    """コードポイントで引く bool 配列（数える文字なら True）"""
+    table = np.zeros(0x110000, dtype=bool)
+    for lo, hi in SCRIPTS[script]:
+        table[lo:hi + 1] = True
+    table[0xD800:0xE000] = False
+    for c in range(0x3001):
+        if chr(c).isspace():
+            table[c] = False
+    return table
+
+
+def count_block(text: str, table, ngram_max: int):
+    """text の文字 n-gram を数える。(n, ID の行列, 回数) の iterator と語彙（vocab_codepoints の形）を返す"""
+    cp = np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+    ok = table[cp]
+    # 対象の文字の連続（ラン）ごとに区間にする
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], ok.view(np.int8), [0]))))
+    lengths = edges[1::2] - edges[0::2]
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    uniq, seq = np.unique(cp[ok], return_inverse=True)
+    vocab = npcount.vocab_codepoints([chr(c) for c in uniq.tolist()])
+    results = npcount.count_ngrams(seq.astype(np.uint32), bounds[:-1], bounds[1:], ngram_max, len(uniq))
+    return results, vocab
+
+
+def iter_blocks(paths, skip_lines: int, block_chars: int = BLOCK_CHARS):
+    """ファイル群を行単位で読み、block_chars 程度の文字列にまとめて返す"""
+    buf = []
+    size = 0
+    for path in paths:
+        with Path(path).open("r", encoding="utf-8", errors="replace") as f:
+            for i, line in enumerate(f):
+                if i < skip_lines:
+                    continue
+                buf.append(line)
+                size += len(line)
+                if size >= block_chars:
+                    yield "".join(buf)
+                    buf = []
+                    size = 0
+        # ファイルの最後の行に改行がなくても次のファイルとつながらないようにする
+        if buf and not buf[-1].endswith("\n"):
+            buf.append("\n")
+    if buf:
+        yield "".join(buf)
+
+
+def count_group(task: int, paths, skip_lines: int, script: str, ngram_max: int, chunks_dir: str):
+    """ファイルのグループを数えてチャンクを書く（プロセスプールから呼ぶ）。戻りは ({n: [チャンク]}, 文字数)"""
+    table = allowed_table(script)
+    chunks_dir = Path(chunks_dir)
+    chunks = {n: [] for n in range(1, ngram_max + 1)}
+    chars = 0
+    k = 0
+    for text in iter_blocks(paths, skip_lines):
+        chars += len(text)
+        results, vocab = count_block(text, table, ngram_max)
+        for n, rows, counts in results:
+            path = chunks_dir / f"{n}chunk{task:05d}_{k:04d}.tsv"
+            chunks[n].append(str(npcount.write_chunk(rows, counts, vocab, path)))
+            k += 1
+    return chunks, chars
+
+
+def group_files(files, group_mb: int = GROUP_MB):
+    """ファイルを合計 group_mb 程度のグループに分ける"""
+    target = group_mb * 1024 * 1024
+    groups = []
+    cur = []
+    size = 0
+    for p in files:
+        cur.append(p)
+        size += p.stat().st_size
+        if size >= target:
+            groups.append(cur)
+            cur = []
+            size = 0
+    if cur:
+        groups.append(cur)
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文字 n-gram を集計する")
+    parser.add_argument("--corpus", choices=sorted(CORPORA), default="hplt")
+    parser.add_argument("--in-dir", type=Path, default=None, help="入力ディレクトリ（既定: コーパスの設定）")
+    parser.add_argument("--pattern", default=None, help="入力の glob パターン")
+    parser.add_argument("--out", type=Path, default=None, help="出力先ディレクトリ")
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default=SCRIPT, help="数える文字種")
+    parser.add_argument("--ngram-max", type=int, default=NGRAM_MAX)
+    parser.add_argument("--min-count", type=int, default=MIN_COUNT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--no-git", action="store_true", help="git add/commit/push をしない")
+    args = parser.parse_args()
+
+    corpus = CORPORA[args.corpus]
+    in_dir = args.in_dir or corpus["in_dir"]
+    out_dir = args.out or corpus["out_dir"]
+    chunks_dir = out_dir / "chunks"
+    if not in_dir.exists():
+        print("入力ディレクトリが存在しません:", in_dir, file=sys.stderr)
+        sys.exit(1)
+    files = sorted(p for p in in_dir.glob(args.pattern or corpus["pattern"]) if p.is_file())
+    if not files:
+        print("処理対象ファイルが見つかりません。", file=sys.stderr)
+        sys.exit(1)
+    chunks_dir.mkdir(parents=True, exist_ok=True)
+
+    groups = group_files(files)
+    print(f"{len(files)} ファイルを {len(groups)} グループで数えます（{args.workers} プロセス）")
+    chunk_paths = {n: [] for n in range(1, args.ngram_max + 1)}
+    total_chars = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(groups)))) as ex:
+        futures = {ex.submit(count_group, i, [str(p) for p in g], corpus["skip_lines"], args.script,
+                             args.ngram_max, str(chunks_dir)): g for i, g in enumerate(groups)}
+        for fut in as_completed(futures):
+            g = futures[fut]
+            try:
+                chunks, chars = fut.result()
+            except Exception as e:
+                print(f"error processing {g[0].name} ...: {e}", file=sys.stderr)
+                continue
+            for n, paths in chunks.items():
+                chunk_paths[n].extend(Path(p) for p in paths)
+            total_chars += chars
+            print(f"processed: {g[0].name} ... ({len(g)} files, {chars} chars)")
+    elapsed = time.perf_counter() - t0
+    print(f"counted {total_chars} chars in {elapsed:.1f}s ({total_chars / max(elapsed, 1e-9) / 1e6:.1f}M chars/s)")
+
+    repo_root = (get_git_root(out_dir) or get_git_root(Path.cwd())) if ENABLE_GIT and not args.no_git else None
+    push_batch = []
+    all_created = []
+    for n in range(1, args.ngram_max + 1):
+        created = merge_and_export(chunk_paths[n], n, chunks_dir, out_dir, args.min_count, SIZE_MB,
+                                   name=corpus["name"], label=f"char {n}-gram")
+        all_created.extend(created)
+        for cp in created:
+            push_batch.append(cp)
+            if len(push_batch) >= N_FILES_PER_PUSH and repo_root:
+                git_add_commit_push(push_batch, repo_root, GIT_COMMIT_MESSAGE_PREFIX)
+                push_batch = []
+    if push_batch and repo_root:
+        git_add_commit_push(push_batch, repo_root, GIT_COMMIT_MESSAGE_PREFIX)
+
+    try:
+        if chunks_dir.exists() and not any(chunks_dir.iterdir()):
+            chunks_dir.rmdir()
+    except Exception:
+        pass
+    print("done. output:", out_dir)
+    print("created files:", len(all_created))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,16 @@
 HPLT の指定ファイル (デフォルト: jpn_Jpan/10_1.jsonl.zst) の
 - リモートサイズ確認 (HEAD)
 - ダウンロード（途中からの再試行付き）
+  サーバが Range に対応していれば、N 個のバイト範囲を並列に取得して
+  事前確保したファイルに書き込む（範囲ごとに独立して再開可能）。
 - md5 検証（jpn_Jpan.md5 を取得して照合）
+  分割ダウンロード時は書き込みと同時に先頭から順に md5 を計算するので、
+  検証のためにファイル全体を読み直さない。
 
 使い方例:
   python download_jpn10.py --check-size
   python download_jpn10.py --download --verify
+  python download_jpn10.py --download --verify --segments 16
 """
 from pathlib import Path
 import argparse
@@ -18,9 +23,13 @@ import sys
 import time
 import random
 import hashlib
+import json
+import threading
 
 DEFAULT_URL = "https://data.hplt-project.org/three/sorted/jpn_Jpan/10_1.jsonl.zst"
 DEFAULT_MD5 = "https://data.hplt-project.org/three/sorted/jpn_Jpan.md5"
+DEFAULT_SEGMENTS = 8
+STATE_SAVE_INTERVAL = 5  # 分割ダウンロードの進捗を .part.json に保存する間隔（秒）
 
 def get_remote_size(url, timeout=15):
     try:
@@ -35,6 +44,18 @@ def get_remote_size(url, timeout=15):
     except Exception as e:
         return None, str(e)
 
+def probe_remote(url, timeout=15):
+    """(size, Range 対応か, err) を返す"""
+    try:
+        r = requests.head(url, allow_redirects=True, timeout=timeout)
+        if r.status_code >= 400:
+            return None, False, f"HEAD returned {r.status_code}"
+        cl = r.headers.get("Content-Length")
+        accepts = r.headers.get("Accept-Ranges", "").lower() == "bytes"
+        return (int(cl) if cl else None), accepts, None
+    except Exception as e:
+        return None, False, str(e)
+
 def fetch_md5_map(md5_url, timeout=30):
     """md5 ファイルを取得して {filename: md5} の dict を返す。
        md5 ファイルの形式は一般的に: "<md5>  <path>" の行を想定。
@@ -109,6 +130,159 @@ def download_with_retries(url, dest_path: Path, retries=6, timeout=60, chunk_siz
             time.sleep(wait)
     return False, f"ダウンロードに失敗しました（{retries} 回）"
 
+class InlineMD5:
+    """分割ダウンロード中に先頭から順に md5 を計算する。
+
+    先頭（frontier）を書いているセグメントのデータはそのまま hash に流し、
+    先に届いた後ろのセグメントは frontier が追いついた時点で読み戻す
+    （書いたばかりなのでページキャッシュから読める）。
+    """
+
+    def __init__(self, path: Path, segments):
+        self.path = path
+        self.segments = segments  # [[start, end, done], ...] start 昇順
+        self.md5 = hashlib.md5()
+        self.frontier = 0
+        self.busy = False
+        self.lock = threading.Lock()
+
+    def _available(self, pos):
+        """pos から連続してディスク上にある範囲の終端を返す"""
+        for start, end, done in self.segments:
+            if start <= pos < end:
+                return start + done
+        return pos
+
+    def feed(self, seg, offset, data):
+        with self.lock:
+            seg[2] += len(data)
+            if not self.busy and offset == self.frontier:
+                self.md5.update(data)
+                self.frontier += len(data)
+        self.catch_up()
+
+    def catch_up(self, chunk=8*1024*1024):
+        while True:
+            with self.lock:
+                if self.busy:
+                    return
+                lo = self.frontier
+                hi = self._available(lo)
+                if hi <= lo:
+                    return
+                self.busy = True
+            try:
+                with open(self.path, "rb") as fh:
+                    fh.seek(lo)
+                    remaining = hi - lo
+                    while remaining > 0:
+                        b = fh.read(min(chunk, remaining))
+                        if not b:
+                            break
+                        self.md5.update(b)
+                        remaining -= len(b)
+                        lo += len(b)
+            finally:
+                with self.lock:
+                    self.frontier = lo
+                    self.busy = False
+
+    def hexdigest(self):
+        return self.md5.hexdigest()
+
+def _plan_segments(size, n):
+    step = -(-size // n)
+    return [[s, min(s + step, size), 0] for s in range(0, size, step)]
+
+def _load_state(state_path: Path, url, size):
+    try:
+        st = json.loads(state_path.read_text(encoding="utf-8"))
+        if st.get("url") == url and st.get("size") == size:
+            return st["segments"]
+    except Exception:
+        pass
+    return None
+
+def download_segmented(url, dest_path: Path, size, segments=DEFAULT_SEGMENTS, retries=6, timeout=60,
+                       chunk_size=1024*1024):
+    """size バイトのファイルを segments 個の Range に分けて並列取得する。戻りは (ok, err, md5hex)"""
+    tmp = dest_path.with_suffix(dest_path.suffix + ".part")
+    state_path = tmp.with_suffix(tmp.suffix + ".json")
+    segs = None
+    if tmp.exists() and tmp.stat().st_size == size:
+        segs = _load_state(state_path, url, size)
+    if segs is None:
+        segs = _plan_segments(size, max(1, segments))
+        with open(tmp, "wb") as fh:
+            fh.truncate(size)  # 事前確保
+    else:
+        done = sum(d for _, _, d in segs)
+        print(f"再開: {done:,} / {size:,} bytes 取得済み")
+    state_lock = threading.Lock()
+
+    def save_state():
+        with state_lock:
+            state_path.write_text(json.dumps({"url": url, "size": size, "segments": segs}), encoding="utf-8")
+
+    save_state()
+    hasher = InlineMD5(tmp, segs)
+    errors = []
+    session = requests.Session()
+
+    def worker(seg):
+        start, end, _ = seg
+        attempt = 0
+        while seg[2] < end - start:
+            pos = start + seg[2]
+            try:
+                headers = {"Range": f"bytes={pos}-{end - 1}"}
+                with session.get(url, stream=True, timeout=timeout, headers=headers) as r:
+                    if r.status_code != 206:
+                        raise RuntimeError(f"Range 非対応の応答: HTTP {r.status_code}")
+                    with open(tmp, "r+b", buffering=0) as fh:
+                        fh.seek(pos)
+                        for chunk in r.iter_content(chunk_size=chunk_size):
+                            if not chunk:
+                                continue
+                            chunk = chunk[:end - pos]
+                            fh.write(chunk)
+                            hasher.feed(seg, pos, chunk)
+                            pos += len(chunk)
+                            if pos >= end:
+                                break
+                attempt = 0
+            except Exception as e:
+                attempt += 1
+                if attempt >= retries:
+                    errors.append(f"{start}-{end}: {e}")
+                    return
+                wait = min((2 ** attempt) + random.random()*3, 300)
+                print(f"セグメント {start:,}- 失敗: 試行 {attempt}/{retries} -> {e}. {wait:.1f}s 後に再試行します...",
+                      file=sys.stderr)
+                time.sleep(wait)
+
+    threads = [threading.Thread(target=worker, args=(seg,), daemon=True) for seg in segs if seg[2] < seg[1] - seg[0]]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=STATE_SAVE_INTERVAL)
+        save_state()
+        downloaded = sum(d for _, _, d in segs)
+        print(f"ダウンロード: {downloaded:,} / {size:,} bytes ({downloaded * 100 / size:.1f}%)")
+    save_state()
+    if errors:
+        return False, "セグメントの取得に失敗しました: " + "; ".join(errors), None
+    hasher.catch_up()
+    if hasher.frontier != size:
+        return False, f"md5 計算が途中で止まりました ({hasher.frontier} / {size})", None
+    tmp.replace(dest_path)
+    try:
+        state_path.unlink()
+    except Exception:
+        pass
+    return True, None, hasher.hexdigest()
+
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--url", default=DEFAULT_URL, help="ダウンロード対象の URL")
@@ -117,6 +291,8 @@ def main():
     p.add_argument("--check-size", action="store_true", help="リモートの Content-Length を確認して表示するだけ")
     p.add_argument("--download", action="store_true", help="ダウンロードを実行する")
     p.add_argument("--verify", action="store_true", help="ダウンロード後に md5 検証を行う")
+    p.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS,
+                   help="並列に取得するバイト範囲の数（Range 非対応なら 1 本で取得）")
     args = p.parse_args()
 
     url = args.url
@@ -124,7 +300,7 @@ def main():
     out_root = Path(args.out)
 
     # リモートサイズ確認
-    size, err = get_remote_size(url)
+    size, accepts_ranges, err = probe_remote(url)
     if err:
         print(f"HEAD エラー: {err}", file=sys.stderr)
     if size is None:
@@ -142,7 +318,11 @@ def main():
     dest_path.parent.mkdir(parents=True, exist_ok=True)
 
     if args.download:
-        ok, err = download_with_retries(url, dest_path)
+        digest = None
+        if size and accepts_ranges and args.segments >= 1:
+            ok, err, digest = download_segmented(url, dest_path, size, segments=args.segments)
+        else:
+            ok, err = download_with_retries(url, dest_path)
         if not ok:
             print(f"ダウンロード失敗: {err}", file=sys.stderr)
             sys.exit(1)
@@ -161,7 +341,7 @@ def main():
                 print("md5 エントリが見つかりません（md5 マップにファイル名がない）", file=sys.stderr)
                 print("取得した md5map のキー例:", list(md5map.keys())[:10])
                 sys.exit(3)
-            actual = md5_of(dest_path)
+            actual = digest or md5_of(dest_path)
             if actual.lower() == chksum.lower():
                 print("md5 OK")
             else:
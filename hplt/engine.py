@@ -0,0 +1,574 @@
+"""
+トークナイザ（toklib.py）によらない n-gram 集計のエンジン。
+sudachi.py / mecab.py は設定とトークナイザを選ぶだけで、数える処理はすべてここを通る。
+
+ファイルごと（WORKERS > 1 ならプロセスプールで並列）に:
+  文書を読む（read_docs）→ 文に分ける（split_sentences のトークナイザだけ。MAX_SENTENCE_CHARS
+  で区切り、解析に失敗した片は半分に分けてやり直す）→ tokenizer.tokenize
+  → 解析結果のキャッシュ（tokcache.py。入力の内容と解析の設定が同じなら次回は解析しない）
+  → 表層形に token_filter をかける → n-gram を数えてチャンクに書く
+     （backend "numpy": npcount.py でキャッシュの ID 配列をまとめて / "counter": Counter。
+     Counter は RSS が memory_budget_mb を超えたら出現回数の少ないものから書き出す）
+最後に (ストリーム, n) ごとにチャンクをマージ → 出現頻度順に外部ソート → 分割出力 → git push
+（ngramio.py）。
+
+ストリームはトークナイザが出す (単位, ビュー) の組（Sudachi なら ("B", "reading") など）。
+sentence_markers が True なら文ごとに BOS/EOS をつけて数え、n-gram が文をまたがない。
+gram_filter（gramfilter.py）があれば、条件に合わないトークンの位置で n-gram を切り、
+max_chars より長い gram はチャンクに書かない（出力で絞るより前に、数える量を減らす）。
+
+vocab_min_count > 0 なら 2 回に分けて数える: まず 1-gram だけを数えて出力し（vocab_from_output
+なら前回の 1-gram の出力をそのまま使う）、出現回数が vocab_min_count 以上のトークンを語彙にする。
+次に語彙にないトークンを unk（数字なら num）に置き換えて 2-gram 以上を数える。名前・数字・
+誤字などのまれなトークンで高次の n-gram の表がふくらむのを抑える（言語モデル向け）。
+"""
+from pathlib import Path
+from collections import Counter
+from itertools import accumulate
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import json
+import re
+import sys
+
+import numpy as np
+
+import npcount
+import tokcache
+from memwatch import MemoryBudget, spill_low_counts
+from ngramio import flush_counter_to_chunk, merge_and_export, get_git_root, git_add_commit_push
+
+# 数字だけのトークン（全角を含む。桁区切り・小数点つきも）
+_NUM_RE = re.compile(r'[0-9\uFF10-\uFF19]+([.,\uFF0C\uFF0E][0-9\uFF10-\uFF19]+)*')
+
+# 日本語判定
+_JP_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u3000-\u303F\uFF00-\uFFEF\u2010-\u2015]')
+def is_japanese_token(s: str) -> bool:
+    return bool(_JP_RE.search(s))
+
+# -----------------------
+# 入力の読み方（1 文書ずつ文字列を返す）
+# -----------------------
+def iter_lines(path: Path):
+    """1 行 = 1 文書のテキスト（purif8 など）"""
+    with Path(path).open("r", encoding="utf-8", errors="replace") as rf:
+        for line in rf:
+            text = line.rstrip("\n")
+            if text:
+                yield text
+
+def iter_jsonl_texts(path: Path):
+    """JSONL の "text"（なければ "body" / "content"）。壊れた行は "text" を正規表現で拾う"""
+    txt_re = re.compile(r'"text"\s*:\s*"')
+    for raw in Path(path).open("r", encoding="utf-8", errors="replace"):
+        line = raw.rstrip("\n")
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+            if isinstance(obj, dict):
+                t = obj.get("text") or obj.get("body") or obj.get("content")
+                if t:
+                    yield t
+                    continue
+        except Exception:
+            m = txt_re.search(line)
+            if m:
+                try:
+                    m2 = re.search(r'"text"\s*:\s*"((?:\\.|[^"\\])*)"', line)
+                    if m2:
+                        rawtxt = m2.group(1)
+                        # JSON のエスケープを戻す
+                        t = bytes(rawtxt, "utf-8").decode("unicode_escape")
+                        yield t
+                        continue
+                except Exception:
+                    pass
+            continue
+
+# -----------------------
+# 文分割
+# -----------------------
+_SENTENCE_RE = re.compile(r'[^。！？!?．]+(?:[。！？!?．]+[」』）)]*)?|[。！？!?．]+[」』）)]*')
+_SOFT_BREAK_RE = re.compile(r'[、，,\s]')
+
+def iter_sentences(text: str, max_chars: int = 1000):
+    """text を文に分けて返す。max_chars を超える文は最後の読点・空白の後ろ（なければその長さ）で切る"""
+    for m in _SENTENCE_RE.finditer(text):
+        sent = m.group(0)
+        while len(sent) > max_chars:
+            cut = max_chars
+            for b in _SOFT_BREAK_RE.finditer(sent, max_chars // 2, max_chars):
+                cut = b.end()
+            yield sent[:cut]
+            sent = sent[cut:]
+        if sent.strip():
+            yield sent
+
+def tokenize_bounded(tokenize, text: str, stats, min_retry_chars: int = 16):
+    """tokenize(text) の結果のリストを返す。失敗したら半分に分けてやり直す"""
+    try:
+        return [tokenize(text)]
+    except Exception:
+        if len(text) <= min_retry_chars:
+            stats["lost_chars"] += len(text)
+            return []
+        stats["retries"] += 1
+        mid = len(text) // 2
+        return tokenize_bounded(tokenize, text[:mid], stats, min_retry_chars) + \
+            tokenize_bounded(tokenize, text[mid:], stats, min_retry_chars)
+
+class _CounterSink:
+    """counter バックエンド: (ストリーム, n) ごとの Counter。RSS が memory_budget_mb を超えたら
+    出現回数の少ないエントリからチャンクに書き出し、頻出する gram はメモリに残す（memwatch.py）"""
+
+    def __init__(self, engine, task):
+        self.engine = engine
+        self.task = task
+        self.keys = [(st, n) for st in engine.streams for n in range(engine.n_min, engine.ngram_max + 1)]
+        self.counters = {k: Counter() for k in self.keys}
+        self.chunk_idx = {k: 0 for k in self.keys}
+        self.chunks = {k: [] for k in self.keys}
+        self.memory = MemoryBudget(engine.memory_budget_mb)
+
+    def _flush(self, key, counter):
+        st, n = key
+        p = flush_counter_to_chunk(counter, n, self.engine.chunks_dirs[st], self.chunk_idx[key], self.task)
+        self.chunks[key].append(p)
+        self.chunk_idx[key] += 1
+
+    def _check_memory(self):
+        keep = self.memory.target(sum(len(c) for c in self.counters.values()))
+        if keep is None:
+            return
+        for key, low in spill_low_counts(self.counters, keep).items():
+            self._flush(key, low)
+
+    def count_tokens(self, st, tokens, max_chars=None):
+        L = len(tokens)
+        if max_chars is not None:
+            ends = list(accumulate((len(t) for t in tokens), initial=0))
+        counted = 0
+        for n in range(self.engine.n_min, min(self.engine.ngram_max, L)+1):
+            c = self.counters[(st, n)]
+            for i in range(0, L-n+1):
+                if max_chars is not None and ends[i+n] - ends[i] > max_chars:
+                    continue
+                gram = " ".join(tokens[i:i+n])
+                c[gram] += 1
+            counted += L-n+1
+        if self.memory.tick(counted):
+            self._check_memory()
+
+    def count_doc(self, doc):
+        """doc: {ストリーム: [フィルタ済みの文ごとのトークン列]}"""
+        e = self.engine
+        markers = (e.bos, e.eos) if e.sentence_markers else ()
+        for st, sents in doc.items():
+            sents = [t for t in sents if t]
+            if e.sentence_markers:
+                seqs = [[e.bos] + tokens + [e.eos] for tokens in sents]
+            else:
+                seqs = [[t for tokens in sents for t in tokens]] if sents else []
+            gf = e.gram_filter if e.gram_filter is not None and e.gram_filter.applies(st) else None
+            if gf is not None:
+                # 条件に合わないトークンで切る
+                seqs = [run for tokens in seqs for run in gf.split(tokens, markers)]
+            if e.vocab is not None:
+                keep = e.vocab[st]
+                seqs = [[t if t in keep or t in markers else e.token_class(t) for t in tokens] for tokens in seqs]
+            for tokens in seqs:
+                self.count_tokens(st, tokens, gf.max_chars if gf is not None else None)
+
+    def close(self):
+        for key in self.keys:
+            if self.counters[key]:
+                self._flush(key, self.counters[key])
+                self.counters[key] = Counter()
+        return self.chunks
+
+
+class NgramEngine:
+    def __init__(self, tokenizer, *, out_dirs, chunks_dirs, views=None, labels=None, read_docs=iter_lines,
+                 ngram_max=7, min_count=10, memory_budget_mb=4096, chunk_sort_mb=200, size_mb=50,
+                 max_open_files=100, sentence_markers=False, bos="<s>", eos="</s>",
+                 max_sentence_chars=1000, min_retry_chars=16, token_filter=None,
+                 use_token_cache=True, token_cache_dir=None, backend="numpy", workers=1,
+                 output_name="hplt", git=True, n_files_per_push=5, git_message_prefix="add ngram files",
+                 server=None, server_authkey=None, vocab_min_count=0, vocab_from_output=False,
+                 unk="<UNK>", num="<NUM>", gram_filter=None):
+        self.tokenizer = tokenizer
+        # キャッシュには全ストリームを入れ、数えるのは views のものだけ
+        self.cache_streams = list(tokenizer.streams)
+        self.streams = [st for st in self.cache_streams if views is None or st[1] in views]
+        self.units = list(dict.fromkeys(u for u, _ in self.cache_streams))
+        self.out_dirs = out_dirs
+        self.chunks_dirs = chunks_dirs
+        self.labels = labels or {st: f"{st[0]}_{st[1]}" for st in self.streams}
+        self.read_docs = read_docs
+        self.ngram_max = ngram_max
+        self.min_count = min_count
+        self.memory_budget_mb = memory_budget_mb
+        self.chunk_sort_mb = chunk_sort_mb
+        self.size_mb = size_mb
+        self.max_open_files = max_open_files
+        self.sentence_markers = sentence_markers
+        self.bos, self.eos = bos, eos
+        self.max_sentence_chars = max_sentence_chars
+        self.min_retry_chars = min_retry_chars
+        self.token_filter = token_filter
+        self.use_token_cache = use_token_cache
+        self.token_cache_dir = token_cache_dir
+        self.backend = backend
+        self.workers = workers
+        self.output_name = output_name
+        self.git = git
+        self.n_files_per_push = n_files_per_push
+        self.git_message_prefix = git_message_prefix
+        # tokserver.py のアドレス。あればファイルごとの解析・集計をサーバーに任せる
+        # （server_authkey が None なら tokserver の鍵ファイルか環境変数から読む）
+        self.server = server
+        self.server_authkey = server_authkey
+        # 語彙を切り詰めるモード: 1-gram で vocab_min_count 未満のトークンは 2-gram 以上で unk/num に置き換える
+        self.vocab_min_count = vocab_min_count
+        self.vocab_from_output = vocab_from_output
+        self.unk, self.num = unk, num
+        self.vocab = None       # {ストリーム: 残すトークンの集合}（2 回目の集計のときだけ）
+        self.n_min = 1          # いま数えている n の下限
+        # gramfilter.GramFilter。合わないトークンの位置で n-gram を切り、長すぎる gram は書かない
+        self.gram_filter = gram_filter
+
+    def check(self):
+        """設定の誤りがあればメッセージを返す"""
+        err = self.tokenizer.check()
+        if err:
+            return err
+        if not self.streams:
+            return "数えるストリームがありません"
+        if self.backend not in ("numpy", "counter"):
+            return f"COUNT_BACKEND は numpy か counter にしてください: {self.backend}"
+        if self.use_token_cache and self.token_cache_dir is None:
+            return "token_cache_dir を指定してください"
+        if self.vocab_min_count and self.vocab_min_count <= self.min_count:
+            # min_count 未満のトークンを含む gram はもともと出力されないので、置き換えても意味がない
+            return f"VOCAB_MIN_COUNT は MIN_COUNT（{self.min_count}）より大きくしてください"
+        return None
+
+    def cache_config(self):
+        config = dict(self.tokenizer.config())
+        config["max_sentence_chars"] = self.max_sentence_chars
+        config["min_retry_chars"] = self.min_retry_chars
+        return config
+
+    # --- 解析 ---
+    def tokenize_docs(self, src: Path, stats):
+        """src を解析して、文書ごとに {ストリーム: [文ごとのトークン列]}（フィルタ前）を返す"""
+        tok = self.tokenizer
+        tok.load()
+        for text in self.read_docs(src):
+            stats["docs"] += 1
+            doc = {st: [] for st in self.cache_streams}
+            sents = iter_sentences(text, self.max_sentence_chars) if tok.split_sentences else [text]
+            for sent in sents:
+                stats["sentences"] += 1
+                sent_tokens = {st: [] for st in self.cache_streams}
+                for part in tokenize_bounded(tok.tokenize, sent, stats, self.min_retry_chars):
+                    for st, tokens in part.items():
+                        sent_tokens[st].extend(tokens)
+                for st, tokens in sent_tokens.items():
+                    doc[st].append(tokens)
+            yield doc
+
+    def _keep(self, token):
+        return self.token_filter is None or self.token_filter(token)
+
+    def filter_doc(self, doc):
+        """フィルタ前の文書から、表層形が token_filter を通るトークンだけを残す"""
+        out = {}
+        for unit in self.units:
+            keeps = [[self._keep(t) for t in tokens] for tokens in doc[(unit, "surface")]]
+            for st in self.streams:
+                if st[0] == unit:
+                    out[st] = [[t for t, k in zip(tokens, keep) if k]
+                               for tokens, keep in zip(doc[st], keeps)]
+        return out
+
+    def _vocab_mask(self, entry):
+        if self.token_filter is None:
+            return np.ones(len(entry.vocab), dtype=bool)
+        return entry.vocab_mask(self.token_filter)
+
+    def iter_cached_docs(self, entry):
+        """キャッシュから文書ごとにフィルタ済みのトークン列を返す（フィルタは語彙のマスクでかける）"""
+        mask = self._vocab_mask(entry)
+        vocab = entry.vocab
+        for lo, hi in entry.iter_docs():
+            out = {}
+            for unit in self.units:
+                sent = entry.sent[(unit, "surface")]
+                bounds = np.asarray(sent[lo:hi+1], dtype=np.int64)
+                start, stop = int(bounds[0]), int(bounds[-1])
+                keep = mask[entry.ids[(unit, "surface")][start:stop]]
+                kept_bounds = np.concatenate(([0], np.cumsum(keep)))[bounds - start].tolist()
+                for st in self.streams:
+                    if st[0] != unit:
+                        continue
+                    sb = np.asarray(entry.sent[st][lo:hi+1], dtype=np.int64)
+                    ids = entry.ids[st][int(sb[0]):int(sb[-1])][keep].tolist()
+                    tokens = [vocab[i] for i in ids]
+                    out[st] = [tokens[a:b] for a, b in zip(kept_bounds, kept_bounds[1:])]
+            yield out
+
+    # --- 語彙の切り詰め ---
+    def token_class(self, token):
+        """語彙にないトークンの置き換え先"""
+        return self.num if _NUM_RE.fullmatch(token) else self.unk
+
+    def _vocab_remaps(self, vocab):
+        """ストリームごとに、語彙にない ID を unk/num の ID に置き換える配列。vocab に unk/num を足す"""
+        index = {t: i for i, t in enumerate(vocab)}
+        for t in (self.unk, self.num):
+            if t not in index:
+                index[t] = len(vocab)
+                vocab.append(t)
+        classes = np.fromiter((index[self.token_class(t)] for t in vocab), dtype=np.uint32, count=len(vocab))
+        specials = {self.bos, self.eos, self.unk, self.num}
+        remaps = {}
+        for st in self.streams:
+            keep = self.vocab[st]
+            known = np.fromiter((t in keep or t in specials for t in vocab), dtype=bool, count=len(vocab))
+            remaps[st] = np.where(known, np.arange(len(vocab), dtype=np.uint32), classes)
+        return remaps
+
+    def load_vocab(self, st):
+        """st の 1-gram の出力から、出現回数が vocab_min_count 以上のトークンの集合を読む"""
+        keep = set()
+        for p in sorted(self.out_dirs[st].glob(f"1{self.output_name}[0-9][0-9][0-9][0-9].txt")):
+            with p.open("r", encoding="utf-8", errors="replace") as f:
+                for ln in f:
+                    gram, cnt = ln.rstrip("\n").rsplit("\t", 1)
+                    if int(cnt) < self.vocab_min_count:
+                        # 出力は出現頻度の降順なので、ここから先はすべて足りない
+                        return frozenset(keep)
+                    keep.add(gram)
+        return frozenset(keep)
+
+    def _has_unigram_output(self):
+        return all(any(self.out_dirs[st].glob(f"1{self.output_name}[0-9][0-9][0-9][0-9].txt"))
+                   for st in self.streams)
+
+    # --- 数える ---
+    def count_entry(self, entry, task):
+        """キャッシュのトークン ID 配列を npcount でまとめて数え、チャンクを直接書く"""
+        chunks = {}
+        mask = self._vocab_mask(entry)
+        vocab = list(entry.vocab)
+        bos = eos = None
+        if self.sentence_markers:
+            bos, eos = len(vocab), len(vocab) + 1
+            vocab += [self.bos, self.eos]
+        remaps = self._vocab_remaps(vocab) if self.vocab is not None else None
+        vocab_cps = npcount.vocab_codepoints(vocab)
+        gf = self.gram_filter
+        token_ok = gf.vocab_ok(vocab, vocab_cps, always={self.bos, self.eos}) if gf is not None else None
+        docs = np.asarray(entry.docs, dtype=np.int64)
+        for unit in self.units:
+            surface = np.asarray(entry.ids[(unit, "surface")])
+            keep = mask[surface]
+            kept = np.concatenate(([0], np.cumsum(keep)))
+            sent = np.asarray(entry.sent[(unit, "surface")], dtype=np.int64)
+            # 数える区間: マーカーありなら文、なしなら文書（フィルタ後の位置で）
+            bounds = kept[sent] if self.sentence_markers else kept[sent[docs]]
+            for st in self.streams:
+                if st[0] != unit:
+                    continue
+                ids = np.asarray(entry.ids[st])[keep]
+                seq, starts, ends = npcount.segment_sequence(ids, bounds, bos, eos)
+                max_chars = None
+                if gf is not None and gf.applies(st):
+                    # 条件に合わないトークンの位置で区間を切る
+                    seq, starts, ends = npcount.break_segments(seq, starts, ends, token_ok[seq])
+                    max_chars = gf.max_chars
+                if remaps is not None:
+                    seq = remaps[st][seq]
+                k = 0
+                for n, rows, counts in npcount.count_ngrams(seq, starts, ends, self.ngram_max, len(vocab),
+                                                            n_min=self.n_min):
+                    if max_chars is not None:
+                        short = vocab_cps[2][rows].sum(axis=1) <= max_chars
+                        rows, counts = rows[short], counts[short]
+                        if not len(counts):
+                            continue
+                    path = self.chunks_dirs[st] / f"{n}chunk{task:05d}_{k:04d}.tsv"
+                    chunks.setdefault((st, n), []).append(npcount.write_chunk(rows, counts, vocab_cps, path))
+                    k += 1
+        return chunks
+
+    def count_file(self, task: int, src: Path):
+        """1 ファイルを解析（またはキャッシュから読み）して数える。戻りは ({(ストリーム, n): [チャンク]}, 統計)"""
+        src = Path(src)
+        stats = {"docs": 0, "sentences": 0, "retries": 0, "lost_chars": 0, "cache": ""}
+        entry = None
+        if self.use_token_cache:
+            config = self.cache_config()
+            content_hash = tokcache.file_digest(src)
+            entry = tokcache.lookup(self.token_cache_dir, content_hash, config)
+            if entry is not None:
+                stats["cache"] = f"hit {entry.dir.name}"
+                stats["docs"] = entry.meta["docs"]
+                stats["sentences"] = entry.meta["sentences"]
+            else:
+                entry = tokcache.build(self.token_cache_dir, src, content_hash, config,
+                                       self.cache_streams, self.tokenize_docs(src, stats))
+                stats["cache"] = f"written {entry.dir.name}"
+        if entry is not None and self.backend == "numpy":
+            return self.count_entry(entry, task), stats
+        sink = _CounterSink(self, task)
+        if entry is not None:
+            docs = self.iter_cached_docs(entry)
+        else:
+            docs = (self.filter_doc(doc) for doc in self.tokenize_docs(src, stats))
+        for doc in docs:
+            sink.count_doc(doc)
+        return sink.close(), stats
+
+    # --- 全体 ---
+    def run(self, files):
+        err = self.check()
+        if err:
+            print(err, file=sys.stderr)
+            return []
+        if self.backend == "numpy" and not self.use_token_cache:
+            print("COUNT_BACKEND = numpy には USE_TOKEN_CACHE が必要です。counter で数えます。", file=sys.stderr)
+            self.backend = "counter"
+        if not self.vocab_min_count:
+            return self._count_files(files)
+
+        created = []
+        ngram_max = self.ngram_max
+        try:
+            # 1 回目: 1-gram だけ数えて出力する（vocab_from_output なら前回の 1-gram の出力を使う）
+            if not (self.vocab_from_output and self._has_unigram_output()):
+                self.ngram_max = 1
+                created += self._count_files(files)
+                self.ngram_max = ngram_max
+            self.vocab = {st: self.load_vocab(st) for st in self.streams}
+            for st in self.streams:
+                print(f"vocab {self.labels[st]}: {len(self.vocab[st])} tokens (count >= {self.vocab_min_count})")
+            # 2 回目: 語彙にないトークンを unk/num に置き換えて 2-gram 以上を数える
+            self.n_min = 2
+            created += self._count_files(files)
+        finally:
+            self.ngram_max, self.n_min, self.vocab = ngram_max, 1, None
+        return created
+
+    def _count_files(self, files):
+        chunk_paths = {(st, n): [] for st in self.streams for n in range(self.n_min, self.ngram_max + 1)}
+
+        def collect(src, result):
+            chunks, stats = result
+            for key, paths in chunks.items():
+                chunk_paths[key].extend(paths)
+            if stats["cache"]:
+                print(f"  token cache {stats['cache']}")
+            # NOTE: do NOT delete source file; keep original files intact
+            print(f"processed (kept): {src.name} (docs {stats['docs']}, sentences {stats['sentences']}, "
+                  f"retries {stats['retries']}, lost chars {stats['lost_chars']})")
+
+        if not (self.server and self._count_on_server(files, collect)):
+            self._count_local(files, collect)
+        return self._export(chunk_paths)
+
+    def _count_local(self, files, collect):
+        if self.workers <= 1:
+            for task, src in enumerate(files):
+                print("processing", src.name)
+                try:
+                    collect(src, self.count_file(task, src))
+                except Exception as e:
+                    print(f"error processing {src.name}: {e}", file=sys.stderr)
+            return
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self,)) as ex:
+            futures = {ex.submit(_count_file_worker, task, str(src)): src for task, src in enumerate(files)}
+            for fut in as_completed(futures):
+                src = futures[fut]
+                try:
+                    collect(src, fut.result())
+                except Exception as e:
+                    print(f"error processing {src.name}: {e}", file=sys.stderr)
+
+    def _count_on_server(self, files, collect):
+        """tokserver に count ジョブを投げる（同時に workers 本まで）。つながらなければ False"""
+        from multiprocessing import AuthenticationError
+        from tokserver import TokenClient, load_authkey
+        authkey = self.server_authkey or load_authkey(self.server)
+        try:
+            with TokenClient(self.server, authkey) as c:
+                config = c.ping()
+        except (OSError, AuthenticationError) as e:
+            print(f"tokserver {self.server} につながりません（{e}）。自分で解析します。", file=sys.stderr)
+            return False
+        if config != self.tokenizer.config():
+            print("tokserver のトークナイザと設定が違います。自分で解析します。", file=sys.stderr)
+            return False
+        print(f"tokserver {self.server} で数えます")
+
+        def job(task, src):
+            with TokenClient(self.server, authkey) as c:
+                return c.count_file(self, task, src)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as ex:
+            futures = {ex.submit(job, task, src): src for task, src in enumerate(files)}
+            for fut in as_completed(futures):
+                src = futures[fut]
+                try:
+                    collect(src, fut.result())
+                except Exception as e:
+                    print(f"error processing {src.name}: {e}", file=sys.stderr)
+        return True
+
+    def _export(self, chunk_paths):
+        # merge chunks per (stream, n), sort by count desc, export, and git-push in batches
+        first_out = self.out_dirs[self.streams[0]]
+        repo_root = (get_git_root(first_out) or get_git_root(Path.cwd())) if self.git else None
+        push_batch = []
+        all_created = []
+        for st in self.streams:
+            for n in range(self.n_min, self.ngram_max + 1):
+                created = merge_and_export(chunk_paths[(st, n)], n, self.chunks_dirs[st], self.out_dirs[st],
+                                           self.min_count, self.size_mb, self.chunk_sort_mb,
+                                           name=self.output_name, label=f"{self.labels[st]} {n}-gram",
+                                           max_open=self.max_open_files)
+                all_created.extend(created)
+                # git batching
+                for cp in created:
+                    push_batch.append(cp)
+                    if len(push_batch) >= self.n_files_per_push and repo_root:
+                        git_add_commit_push(push_batch, repo_root, self.git_message_prefix)
+                        push_batch = []
+        # push remaining files
+        if push_batch and repo_root:
+            git_add_commit_push(push_batch, repo_root, self.git_message_prefix)
+
+        # cleanup chunks dirs if empty (深いものから)
+        for d in sorted({self.chunks_dirs[st] for st in self.streams}, key=lambda p: len(p.parts), reverse=True):
+            try:
+                if d.exists() and not any(d.iterdir()):
+                    d.rmdir()
+            except Exception:
+                pass
+
+        print("done. outputs:", ", ".join(str(self.out_dirs[st]) for st in self.streams))
+        print("created files:", len(all_created))
+        return all_created
+
+
+# ワーカープロセスごとに 1 つのエンジン（トークナイザの load() も 1 回だけ）
+_worker_engine = None
+
+def _init_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
+
+def _count_file_worker(task, src):
+    return _worker_engine.count_file(task, Path(src))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+HPLT の md5 マニフェスト（jpn_Jpan.md5）に載っているシャードを
+パターンまたは合計バイト数の予算で選び、ジョブキューで並列にダウンロードする。
+
+検証（md5）が済んだシャードから順に unpack.py の split_zst_jsonl に渡して
+約 SIZE_MB ごとの .jsonl に展開するので、ダウンロードと展開が重なって進む。
+展開結果（OUT_DIR）はそのまま purif.py の入力になる。
+
+使い方例:
+  python fetch.py --pattern "10_*" --list
+  python fetch.py --pattern "10_*" --jobs 2 --segments 8
+  python fetch.py --budget-gb 200 --remove-zst
+"""
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import argparse
+import fnmatch
+import queue
+import sys
+import threading
+
+import requests
+
+from dl import (DEFAULT_MD5, DEFAULT_SEGMENTS, download_segmented, download_with_retries,
+                md5_of, probe_remote)
+
+# --- 設定 ---
+DL_DIR = Path(".")            # ダウンロード先ルート（URL のパス構造を再現）
+OUT_DIR = Path("data")        # 展開先（purif.py の IN_DIR）
+SIZE_MB = 50                  # 展開後の分割サイズ（MB）
+JOBS = 2                      # 同時にダウンロードするシャード数
+PROBE_WORKERS = 16            # サイズ確認（HEAD）の並列数
+# -------------
+
+
+def fetch_manifest(md5_url, timeout=30):
+    """md5 ファイルを読み、マニフェスト順に [(url, md5)] を返す"""
+    r = requests.get(md5_url, timeout=timeout)
+    r.raise_for_status()
+    base = md5_url[:-len(".md5")] if md5_url.endswith(".md5") else md5_url.rsplit("/", 1)[0]
+    shards = []
+    seen = set()
+    for line in r.text.splitlines():
+        parts = line.strip().split()
+        if len(parts) < 2 or parts[0].startswith("#"):
+            continue
+        name = Path(parts[-1]).name
+        if name in seen:
+            continue
+        seen.add(name)
+        shards.append((f"{base.rstrip('/')}/{name}", parts[0]))
+    return shards
+
+
+def select_shards(shards, patterns=None, budget_bytes=None):
+    """パターンで絞り込み、予算があればサイズを確認してマニフェスト順に予算内まで選ぶ。
+
+    戻りは [(url, md5, size, accepts_ranges)]。
+    """
+    if patterns:
+        shards = [s for s in shards if any(fnmatch.fnmatch(Path(urlparse(s[0]).path).name, p) for p in patterns)]
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as ex:
+        probes = list(ex.map(lambda s: probe_remote(s[0]), shards))
+    selected = []
+    total = 0
+    for (url, md5), (size, accepts, err) in zip(shards, probes):
+        if err:
+            print(f"HEAD エラー: {url} -> {err}", file=sys.stderr)
+        if budget_bytes is not None:
+            if size is None:
+                print(f"サイズ不明のため予算選択から除外: {url}", file=sys.stderr)
+                continue
+            if total + size > budget_bytes:
+                continue
+        total += size or 0
+        selected.append((url, md5, size, accepts))
+    return selected, total
+
+
+def fetch_one(url, md5, size, accepts, dl_root: Path, segments):
+    """1 シャードを取得して md5 を検証する。戻りは検証済みのパス（失敗時は例外）"""
+    dest = (dl_root / urlparse(url).path.lstrip("/")).resolve()
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    digest = None
+    if dest.exists() and (size is None or dest.stat().st_size == size):
+        print(f"既存ファイルを検証: {dest.name}")
+    elif size and accepts:
+        ok, err, digest = download_segmented(url, dest, size, segments=segments)
+        if not ok:
+            raise RuntimeError(err)
+    else:
+        ok, err = download_with_retries(url, dest)
+        if not ok:
+            raise RuntimeError(err)
+    actual = digest or md5_of(dest)
+    if actual.lower() != md5.lower():
+        raise RuntimeError(f"md5 mismatch: expected {md5} actual {actual}")
+    return dest
+
+
+def unpack_worker(q: queue.Queue, out_dir: Path, size_mb: int, remove_zst: bool, results):
+    """検証済みシャードを受け取って順に展開する（None で終了）"""
+    # unpack は zstandard がないと import 時に終了するので、展開するときだけ読み込む
+    from unpack import split_zst_jsonl
+    while True:
+        path = q.get()
+        if path is None:
+            return
+        try:
+            files = split_zst_jsonl(path, out_dir, size_mb=size_mb)
+            results.append((path, len(files)))
+            if remove_zst:
+                path.unlink()
+                print(f"removed: {path.name}")
+        except Exception as e:
+            print(f"展開失敗: {path} -> {e}", file=sys.stderr)
+
+
+def main():
+    p = argparse.ArgumentParser(description="md5 マニフェストから HPLT シャードを選んで並列取得・展開する")
+    p.add_argument("--md5", default=DEFAULT_MD5, help="言語 md5 ファイルの URL")
+    p.add_argument("--pattern", action="append", help="シャード名の glob（例: '10_*'、複数指定可）")
+    p.add_argument("--budget-gb", type=float, default=None, help="合計ダウンロードサイズの上限（GB）")
+    p.add_argument("--jobs", type=int, default=JOBS, help="同時にダウンロードするシャード数")
+    p.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS, help="シャードあたりの並列 Range 数")
+    p.add_argument("--dl-dir", default=str(DL_DIR), help="ダウンロード先ルート")
+    p.add_argument("--out", default=str(OUT_DIR), help="展開先ディレクトリ")
+    p.add_argument("--size-mb", type=int, default=SIZE_MB, help="展開後の分割サイズ（MB）")
+    p.add_argument("--no-unpack", action="store_true", help="ダウンロードと検証だけ行う")
+    p.add_argument("--remove-zst", action="store_true", help="展開が済んだ .zst を削除する")
+    p.add_argument("--list", action="store_true", help="選ばれるシャードを表示するだけ")
+    args = p.parse_args()
+
+    try:
+        shards = fetch_manifest(args.md5)
+    except Exception as e:
+        print(f"md5 リスト取得失敗: {e}", file=sys.stderr)
+        sys.exit(2)
+    budget = int(args.budget_gb * 1024 ** 3) if args.budget_gb is not None else None
+    selected, total = select_shards(shards, args.pattern, budget)
+    print(f"マニフェスト {len(shards)} 件中 {len(selected)} 件を選択 (合計 {total / 1024 ** 3:.2f} GB)")
+    if args.list or not selected:
+        for url, md5, size, _ in selected:
+            print(f"  {url}  {size if size is not None else '?'} bytes  {md5}")
+        return
+
+    q = queue.Queue()
+    results = []
+    consumer = None
+    if not args.no_unpack:
+        # zstandard がなければダウンロードを始める前にここで終了する
+        import unpack  # noqa: F401
+        consumer = threading.Thread(target=unpack_worker,
+                                    args=(q, Path(args.out), args.size_mb, args.remove_zst, results))
+        consumer.start()
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+        futures = {ex.submit(fetch_one, url, md5, size, accepts, Path(args.dl_dir), args.segments): url
+                   for url, md5, size, accepts in selected}
+        for fut in as_completed(futures):
+            url = futures[fut]
+            try:
+                path = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"取得失敗: {url} -> {e}", file=sys.stderr)
+                continue
+            print(f"md5 OK: {path.name}")
+            if consumer is not None:
+                q.put(path)
+
+    if consumer is not None:
+        q.put(None)
+        consumer.join()
+        print(f"展開済み: {len(results)} シャード -> {args.out}")
+    print(f"完了: 成功={len(selected) - failed} 失敗={failed}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
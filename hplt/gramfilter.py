@@ -0,0 +1,127 @@
+"""
+数える n-gram の条件（文字・文字種・トークンの正規表現・長さ）。
+
+出力を後から絞るのではなく、数える前にかける:
+- 文字の条件はコードポイントで引く bool 配列（char_table）にまとめておき、キャッシュの
+  語彙ごとに 1 度だけ評価して ID で引くマスクにする（vocab_ok）。Counter で数えるときは
+  トークンごとに評価してメモしておく（token_ok）。
+- 条件に合わないトークンは取り除くのではなく、そこで n-gram を切る（合わないトークンを
+  含む gram は数えない。前後のトークンが隣り合った gram にもならない）。
+- max_chars は gram の文字数（区切りの空白は数えない）の上限。チャンクに書く前に落とす。
+
+例:
+  GramFilter(chars=Path("kana.txt"), views=["reading"])   # 読みが kana.txt の文字だけの gram
+  GramFilter(exclude=["digit", "latin"])                   # 数字・ラテン文字を含まない gram
+"""
+import re
+from pathlib import Path
+
+import numpy as np
+
+# 文字種（コードポイントの範囲）
+CHAR_CLASSES = {
+    "hiragana": [(0x3040, 0x309F)],
+    "katakana": [(0x30A0, 0x30FF), (0x31F0, 0x31FF), (0xFF66, 0xFF9F)],
+    "kanji": [(0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF)],
+    "digit": [(0x30, 0x39), (0xFF10, 0xFF19)],
+    "latin": [(0x41, 0x5A), (0x61, 0x7A), (0xFF21, 0xFF3A), (0xFF41, 0xFF5A)],
+    "symbol": [(0x3000, 0x303F), (0x2010, 0x2015)],
+    # engine.py の is_japanese_token と同じ範囲
+    "ja": [(0x3040, 0x309F), (0x30A0, 0x30FF), (0x4E00, 0x9FFF), (0x3000, 0x303F),
+           (0xFF00, 0xFFEF), (0x2010, 0x2015)],
+}
+
+
+def read_chars(chars):
+    """文字列、またはファイル（kana.txt など。空行と // で始まる行は無視）の文字の集合"""
+    if isinstance(chars, Path):
+        lines = chars.read_text(encoding="utf-8").splitlines()
+        chars = "".join(ln for ln in lines if not ln.startswith("//"))
+    return {c for c in chars if not c.isspace()}
+
+
+def char_table(chars=None, classes=None, exclude=None):
+    """使ってよい文字なら True の、コードポイントで引く bool 配列。
+    chars と classes のどちらもなければすべての文字を許し、exclude の文字種を除く"""
+    if chars is None and not classes:
+        table = np.ones(0x110000, dtype=bool)
+    else:
+        table = np.zeros(0x110000, dtype=bool)
+        if chars is not None:
+            table[[ord(c) for c in read_chars(chars)]] = True
+        for name in classes or ():
+            for lo, hi in CHAR_CLASSES[name]:
+                table[lo:hi + 1] = True
+    for name in exclude or ():
+        for lo, hi in CHAR_CLASSES[name]:
+            table[lo:hi + 1] = False
+    return table
+
+
+class GramFilter:
+    def __init__(self, chars=None, classes=None, exclude=None, token_regex=None, max_chars=None, views=None):
+        unknown = [c for c in list(classes or ()) + list(exclude or ()) if c not in CHAR_CLASSES]
+        if unknown:
+            raise ValueError(f"未知の文字種: {unknown}（{', '.join(CHAR_CLASSES)} から選んでください）")
+        has_chars = chars is not None or classes or exclude
+        self.table = char_table(chars, classes, exclude) if has_chars else None
+        self.token_regex = re.compile(token_regex) if token_regex else None
+        self.max_chars = max_chars
+        self.views = set(views) if views else None
+        self._memo = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_memo"] = {}
+        return state
+
+    def applies(self, stream):
+        """stream（(単位, ビュー)）に条件をかけるか"""
+        return self.views is None or stream[1] in self.views
+
+    def token_ok(self, token):
+        ok = self._memo.get(token)
+        if ok is None:
+            ok = (self.table is None or bool(self.table[[ord(c) for c in token]].all())) and \
+                 (self.token_regex is None or self.token_regex.fullmatch(token) is not None)
+            self._memo[token] = ok
+        return ok
+
+    def vocab_ok(self, vocab, vocab_cps, always=()):
+        """語彙ごとに条件に合うかの bool 配列（ID で引く）。vocab_cps は npcount.vocab_codepoints の戻り。
+        always のトークン（BOS/EOS など）は常に True"""
+        flat, _, lens = vocab_cps
+        ok = np.ones(len(vocab), dtype=bool)
+        if self.table is not None:
+            # 使えない文字をトークンごとに数える
+            bad = ~self.table[flat]
+            owner = np.repeat(np.arange(len(vocab)), lens)
+            ok &= np.bincount(owner[bad], minlength=len(vocab)) == 0
+        if self.token_regex is not None:
+            ok &= np.fromiter((self.token_regex.fullmatch(t) is not None for t in vocab), dtype=bool,
+                              count=len(vocab))
+        for i, t in enumerate(vocab):
+            if t in always:
+                ok[i] = True
+        return ok
+
+    def split(self, tokens, always=()):
+        """条件に合わないトークンの位置で tokens を切った列のリスト"""
+        runs = []
+        run = []
+        for t in tokens:
+            if t in always or self.token_ok(t):
+                run.append(t)
+            elif run:
+                runs.append(run)
+                run = []
+        if run:
+            runs.append(run)
+        return runs
+
+
+def make_filter(chars=None, classes=None, exclude=None, token_regex=None, max_chars=None, views=None):
+    """条件が 1 つでもあれば GramFilter、なければ None（設定の定数をそのまま渡す用）"""
+    if chars is None and not classes and not exclude and not token_regex and max_chars is None:
+        return None
+    return GramFilter(chars, classes, exclude, token_regex, max_chars, views)
@@ -4,200 +4,81 @@ JSONL ("10_*.jsonl") を MeCab で解析して 1-7 形態素 n-gram を集計・
 - 実行: d:\gramdata\hplt で python mecab.py
 - 出力先: OUT_DIR 配下（デフォルト: data）
 - 5 ファイル生成ごとに自動で git add/commit/push を行います（ENABLE_GIT を False にすると無効化）
+
+数える処理は sudachi.py と同じ engine.py を使う（解析は toklib.MecabTokenizer）。
+チャンク → マージ → 出現頻度順ソート → SIZE_MB ごとの分割出力なので、同じ gram が
+複数の出力ファイルに分かれることはない。解析結果のキャッシュ・numpy での集計・
+ファイルごとの並列処理も sudachi.py と同じ設定で使える。
 """
-from pathlib import Path
-import json
 import sys
-import re
-import time
-import random
-import subprocess
-from collections import Counter
+from pathlib import Path
 
-try:
-    import MeCab
-except Exception:
-    print("mecab-python3 が必要です: pip install mecab-python3", file=sys.stderr)
-    raise SystemExit(1)
+from engine import NgramEngine, iter_jsonl_texts
+from gramfilter import make_filter
+from toklib import MecabTokenizer
 
 # --- 設定（ここを直接変更してください） ---
 IN_DIR = Path(".")             # 入力ディレクトリ（実行場所に合わせる）
 PATTERN = "10_*.jsonl"        # 処理するファイルパターン
 OUT_DIR = Path("data")         # 出力先（gramdata/hplt/data）
+CHUNKS_DIR = OUT_DIR / "chunks"
 SIZE_MB = 50                   # 目標ファイルサイズ（MB）
 ENABLE_GIT = True              # True のとき自動で git add/commit/push を行う
 GIT_BATCH = 5                  # 何ファイルごとに git push するか
 NGRAM_MAX = 7                  # 何グラムまで作るか
-GIT_RETRIES = 6                # git push のリトライ回数
+MIN_COUNT = 1                  # 出力に含める最低頻度
+MECAB_ARGS = "-Owakati"
+MEMORY_BUDGET_MB = 4096        # counter バックエンドのプロセスあたりのメモリ予算（RSS、MB）
+USE_TOKEN_CACHE = True         # 解析結果を tokcache.py のキャッシュに保存する
+TOKEN_CACHE_DIR = Path("tokcache_mecab")
+COUNT_BACKEND = "numpy"        # "numpy"（USE_TOKEN_CACHE が必要）か "counter"
+WORKERS = 1                    # 並列に処理するファイル数
+VOCAB_MIN_COUNT = 0            # >0 なら 1-gram がこれ未満のトークンを 2-gram 以上で <UNK>/<NUM> に置き換える
+VOCAB_FROM_OUTPUT = False      # True なら出力先にある前回の 1-gram の出力から語彙を作る
+GRAM_CHARS = None              # 使ってよい文字（文字列か kana.txt などの Path。gramfilter.py）
+GRAM_EXCLUDE = None            # 使わない文字種（例: ["digit", "latin"]）
+GRAM_MAX_CHARS = None          # gram の文字数の上限
+TOKEN_SERVER = None            # tokserver.py --tokenizer mecab のアドレス（例: ("127.0.0.1", 50917)）
+GIT_COMMIT_MESSAGE_PREFIX = "add mecab ngram files"
 # ------------------------------------------------
 
-_pending_files = []
-_repo_root = None
-
-def get_git_root(start_path: Path):
-    try:
-        p = subprocess.run(["git", "rev-parse", "--show-toplevel"],
-                           cwd=str(start_path), check=True, capture_output=True, text=True)
-        return Path(p.stdout.strip())
-    except subprocess.CalledProcessError:
-        return None
-
-def commit_and_push(files, repo_root: Path, retries=GIT_RETRIES):
-    if not files:
-        return True
-    rel_paths = []
-    for f in files:
-        try:
-            rel = Path(f).resolve().relative_to(repo_root.resolve())
-            rel_paths.append(str(rel).replace("\\", "/"))
-        except Exception:
-            rel_paths.append(str(Path(f).resolve()))
-    msg_paths = ", ".join(f"({p})" for p in rel_paths)
-    msg = f"{msg_paths} を追加"
-    attempt = 0
-    while attempt < retries:
-        attempt += 1
-        try:
-            subprocess.run(["git", "add", "--"] + rel_paths, cwd=str(repo_root), check=True)
-            diff = subprocess.run(["git", "diff", "--cached", "--name-only"],
-                                  cwd=str(repo_root), check=True, capture_output=True, text=True)
-            if not diff.stdout.strip():
-                print("コミットする差分がありません、スキップします。")
-                return True
-            subprocess.run(["git", "commit", "-m", msg], cwd=str(repo_root), check=True)
-            subprocess.run(["git", "push"], cwd=str(repo_root), check=True)
-            print(f"git push 成功: {len(files)} 件 -> {msg}")
-            return True
-        except subprocess.CalledProcessError as e:
-            stderr = (e.stderr or "").strip()
-            stdout = (e.stdout or "").strip()
-            print(f"git 操作失敗 (試行 {attempt}/{retries}): stdout={stdout} stderr={stderr}", file=sys.stderr)
-            backoff = min((2 ** attempt) + random.uniform(0, 3), 300)
-            print(f"{backoff:.1f}s 後に再試行します...", file=sys.stderr)
-            time.sleep(backoff)
-    print("git push が最大試行回数で失敗しました。手動で確認してください。", file=sys.stderr)
-    return False
-
-def _maybe_flush_pending():
-    global _pending_files, _repo_root
-    if not ENABLE_GIT or _repo_root is None:
-        return
-    if len(_pending_files) >= GIT_BATCH:
-        to_commit = _pending_files[:]
-        _pending_files = []
-        commit_and_push(to_commit, _repo_root)
-
-def jsonl_iter_texts(path: Path):
-    txt_re = re.compile(r'"text"\s*:\s*"')
-    for raw in path.open("r", encoding="utf-8", errors="replace"):
-        line = raw.rstrip("\n")
-        if not line:
-            continue
-        try:
-            obj = json.loads(line)
-            if isinstance(obj, dict):
-                t = obj.get("text") or obj.get("body") or obj.get("content")
-                if t:
-                    yield t
-                    continue
-        except Exception:
-            m = txt_re.search(line)
-            if m:
-                try:
-                    m2 = re.search(r'"text"\s*:\s*"((?:\\.|[^"\\])*)"', line)
-                    if m2:
-                        rawtxt = m2.group(1)
-                        # JSON のエスケープを戻す
-                        t = bytes(rawtxt, "utf-8").decode("unicode_escape")
-                        yield t
-                        continue
-                except Exception:
-                    pass
-            continue
-
-def tokenize_wakati(text, tagger):
-    s = tagger.parse(text)
-    if not s:
-        return []
-    tokens = s.strip().split()
-    return tokens
-
-def write_counter_to_file(counter: Counter, out_dir: Path, n: int, index: int):
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir / f"{n}hplt{index:04d}.txt"
-    with out_path.open("w", encoding="utf-8") as f:
-        for gram, cnt in counter.most_common():
-            f.write(f"{gram}\t{cnt}\n")
-    return out_path
-
-def estimate_counter_size_bytes(counter: Counter):
-    total = 0
-    for k, v in counter.items():
-        total += len(k.encode("utf-8")) + 1 + len(str(v)) + 1
-    return total
-
 def process_files():
-    global _repo_root, _pending_files
     in_dir = IN_DIR.resolve()
     out_dir = OUT_DIR.resolve()
-    target_bytes = SIZE_MB * 1024 * 1024
-
     if not in_dir.exists():
         print("入力ディレクトリが存在しません。", file=sys.stderr)
         return
-
-    if ENABLE_GIT:
-        _repo_root = get_git_root(out_dir) or get_git_root(in_dir) or get_git_root(Path.cwd())
-        if _repo_root is None:
-            print("警告: git リポジトリが見つかりません。自動コミットは無効になります。", file=sys.stderr)
-
-    tagger = MeCab.Tagger("-Owakati")
-    counters = {n: Counter() for n in range(1, NGRAM_MAX+1)}
-    indexes = {n: 0 for n in range(1, NGRAM_MAX+1)}
-    sizes = {n: 0 for n in range(1, NGRAM_MAX+1)}
-
     files = sorted(in_dir.glob(PATTERN))
     if not files:
         print("処理対象ファイルが見つかりません。", file=sys.stderr)
         return
 
-    for src in files:
-        print(f"処理中: {src.name}")
-        for text in jsonl_iter_texts(src):
-            tokens = tokenize_wakati(text, tagger)
-            if not tokens:
-                continue
-            L = len(tokens)
-            for n in range(1, min(NGRAM_MAX, L)+1):
-                c = counters[n]
-                for i in range(0, L - n + 1):
-                    gram = " ".join(tokens[i:i+n])
-                    c[gram] += 1
-                sizes[n] = estimate_counter_size_bytes(c)
-            for n in range(1, NGRAM_MAX+1):
-                if sizes[n] >= target_bytes and counters[n]:
-                    p = write_counter_to_file(counters[n], out_dir, n, indexes[n])
-                    indexes[n] += 1
-                    _pending_files.append(str(p))
-                    counters[n].clear()
-                    sizes[n] = 0
-                    _maybe_flush_pending()
-
-    # final flush
-    for n in range(1, NGRAM_MAX+1):
-        if counters[n]:
-            p = write_counter_to_file(counters[n], out_dir, n, indexes[n])
-            indexes[n] += 1
-            _pending_files.append(str(p))
-            counters[n].clear()
-            _maybe_flush_pending()
-
-    # final git push for leftovers
-    if ENABLE_GIT and _repo_root is not None and _pending_files:
-        to_commit = _pending_files[:]
-        _pending_files = []
-        commit_and_push(to_commit, _repo_root)
-
+    tokenizer = MecabTokenizer(MECAB_ARGS)
+    st = tokenizer.streams[0]
+    engine = NgramEngine(
+        tokenizer,
+        out_dirs={st: out_dir},
+        chunks_dirs={st: CHUNKS_DIR.resolve()},
+        labels={st: "mecab"},
+        read_docs=iter_jsonl_texts,
+        ngram_max=NGRAM_MAX,
+        min_count=MIN_COUNT,
+        memory_budget_mb=MEMORY_BUDGET_MB,
+        size_mb=SIZE_MB,
+        use_token_cache=USE_TOKEN_CACHE,
+        token_cache_dir=TOKEN_CACHE_DIR.resolve(),
+        backend=COUNT_BACKEND,
+        workers=WORKERS,
+        output_name="hplt",
+        git=ENABLE_GIT,
+        n_files_per_push=GIT_BATCH,
+        git_message_prefix=GIT_COMMIT_MESSAGE_PREFIX,
+        server=TOKEN_SERVER,
+        vocab_min_count=VOCAB_MIN_COUNT,
+        vocab_from_output=VOCAB_FROM_OUTPUT,
+        gram_filter=make_filter(GRAM_CHARS, exclude=GRAM_EXCLUDE, max_chars=GRAM_MAX_CHARS),
+    )
+    engine.run(files)
     print("完了。")
 
 if __name__ == "__main__":
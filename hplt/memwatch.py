@@ -0,0 +1,107 @@
+"""
+プロセスの実メモリ（RSS）を見て、インメモリの Counter をいつ・どこまで書き出すかを決める。
+
+Counter のキーのバイト数から見積もる方法は、Python のオブジェクトの大きさを大きく
+見誤るうえ、書き出すたびに Counter を丸ごと空にするので、頻出する gram もすぐに
+入れ直されて全部のチャンクに出てくる。ここでは:
+
+- RSS は psutil があればそれで、なければ /proc/self/statm で測る（どちらもなければ
+  エントリ数 × ENTRY_BYTES で見積もる）。測るのは check_every 回に 1 度だけ。
+- RSS が予算を超えたら、その時点の (RSS - 起動時の RSS) / エントリ数 から 1 エントリ
+  あたりのバイト数を出し、予算に収まるエントリ数の上限を決める。消したエントリの
+  メモリは Python が再利用するだけで RSS は減らないので、以後は測り直すまでこの
+  上限（エントリ数）で判断する。
+- 書き出すときは LOW_WATER × 上限まで減らす。出現回数の少ないものから書き出し、
+  頻出する gram はメモリに残す（spill_low_counts）。
+"""
+import os
+from collections import Counter
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# --- 設定 ---
+CHECK_EVERY = 200_000     # 何回数えるごとに RSS を測るか
+LOW_WATER = 0.6           # 書き出したあとに残すエントリ数（上限に対する割合）
+ENTRY_BYTES = 200         # RSS が測れないときの 1 エントリあたりの見積もり（バイト）
+MIN_ENTRIES = 10_000      # 上限がこれより小さくならないようにする
+# -------------
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """このプロセスの RSS（バイト）。測れなければ None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryBudget:
+    """RSS が budget_mb を超えないように、Counter のエントリ数の上限を決める"""
+
+    def __init__(self, budget_mb, check_every=CHECK_EVERY, low_water=LOW_WATER):
+        self.budget = budget_mb * 1024 * 1024
+        self.check_every = check_every
+        self.low_water = low_water
+        base = rss_bytes()
+        self.measured = base is not None
+        self.base = base or 0
+        self.limit = None       # エントリ数の上限（RSS が予算を超えるまでは決めない）
+        self.peak = 0           # これまでに持っていた最大のエントリ数
+        self.pending = 0
+
+    def tick(self, k=1):
+        """k 回数えたことを記録する。RSS を測る頃合いなら True"""
+        self.pending += k
+        if self.pending < self.check_every:
+            return False
+        self.pending = 0
+        return True
+
+    def target(self, entries):
+        """いまのエントリ数で書き出しが要るなら、残すエントリ数を返す。要らなければ None"""
+        self.peak = max(self.peak, entries)
+        rss = rss_bytes() if self.measured else self.base + self.peak * ENTRY_BYTES
+        if rss is not None and rss >= self.budget:
+            # 消したエントリのメモリは再利用されるだけなので、RSS は最大のエントリ数で割る
+            per_entry = max((rss - self.base) / max(self.peak, 1), 1)
+            self.limit = max(int((self.budget - self.base) / per_entry), MIN_ENTRIES)
+        if self.limit is None or entries <= self.limit:
+            return None
+        return int(self.limit * self.low_water)
+
+
+def spill_low_counts(counters, keep):
+    """counters（Counter の dict）のエントリが合わせて keep 個以下になるまで、出現回数の
+    少ないものから取り出す。戻りは {キー: 取り出した Counter}（空のものは含めない）"""
+    total = sum(len(c) for c in counters.values())
+    excess = total - keep
+    if excess <= 0:
+        return {}
+    hist = Counter()
+    for c in counters.values():
+        hist.update(c.values())
+    # 出現回数が threshold 以下のものを全部書き出せば excess 個以上になる最小の threshold
+    threshold = 0
+    acc = 0
+    for cnt in sorted(hist):
+        threshold = cnt
+        acc += hist[cnt]
+        if acc >= excess:
+            break
+    out = {}
+    for key, c in counters.items():
+        low = Counter({g: v for g, v in c.items() if v <= threshold})
+        if not low:
+            continue
+        for g in low:
+            del c[g]
+        out[key] = low
+    return out
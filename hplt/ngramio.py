@@ -0,0 +1,313 @@
+"""
+n-gram 集計の後半（チャンク → マージ → 出現頻度順の外部ソート → 分割出力 → git push）。
+
+engine.py（sudachi.py / mecab.py の形態素 n-gram）と chars.py（文字 n-gram）で共通に使う。
+チャンクは "gram\tcount" を gram 昇順に並べた TSV で、同じ gram が複数のチャンクに
+あってもよい（マージで合算する）。
+"""
+from pathlib import Path
+from collections import Counter
+import heapq
+import random
+import subprocess
+import time
+
+MAX_OPEN_FILES = 100      # マージ時の同時オープンするチャンク数の目安
+CHUNK_SORT_MB = 200       # 集計済ファイルを出現頻度で外部ソートするときのチャンクサイズ（MB）
+GIT_COMMIT_MESSAGE_PREFIX = "add ngram files"
+
+
+def flush_counter_to_chunk(counter: Counter, n: int, chunks_dir: Path, idx: int, task: int = None):
+    """counter を gram 順にチャンクへ書く。task（並列に数えるときの番号）があればファイル名に入れる"""
+    chunks_dir.mkdir(parents=True, exist_ok=True)
+    name = f"{n}chunk{idx:04d}.tsv" if task is None else f"{n}chunk{task:05d}_{idx:04d}.tsv"
+    path = chunks_dir / name
+    with path.open("w", encoding="utf-8") as wf:
+        for gram, cnt in sorted(counter.items()):
+            wf.write(f"{gram}\t{cnt}\n")
+    return path
+
+def merge_sorted_files(file_paths, out_path):
+    """複数のキー（gram）ソート済みチャンクをマージして合算済みファイルを作る（gram順）"""
+    iters = []
+    files = []
+    try:
+        for p in file_paths:
+            f = Path(p).open("r", encoding="utf-8", errors="replace")
+            files.append(f)
+            def gen(fh):
+                for ln in fh:
+                    ln = ln.rstrip("\n")
+                    if not ln:
+                        continue
+                    g, c = ln.rsplit("\t", 1)
+                    yield (g, int(c))
+            iters.append(gen(f))
+        merged = heapq.merge(*iters, key=lambda x: x[0])
+        with out_path.open("w", encoding="utf-8") as wf:
+            cur_g = None
+            cur_sum = 0
+            for g, c in merged:
+                if cur_g is None:
+                    cur_g = g; cur_sum = c
+                elif g == cur_g:
+                    cur_sum += c
+                else:
+                    wf.write(f"{cur_g}\t{cur_sum}\n")
+                    cur_g = g; cur_sum = c
+            if cur_g is not None:
+                wf.write(f"{cur_g}\t{cur_sum}\n")
+    finally:
+        for f in files:
+            try:
+                f.close()
+            except Exception:
+                pass
+
+def multi_pass_merge(paths, chunks_dir: Path, max_open: int = MAX_OPEN_FILES):
+    """paths をバッチに分けて順次マージし、最終的に一つの合算ファイルを返す（Path）"""
+    if not paths:
+        return None
+    cur_list = [Path(p) for p in paths]
+    round_idx = 0
+    while len(cur_list) > 1:
+        new_list = []
+        for i in range(0, len(cur_list), max_open):
+            batch = cur_list[i:i+max_open]
+            tmp = chunks_dir / f"merge_r{round_idx}_{i:04d}.tsv"
+            merge_sorted_files(batch, tmp)
+            new_list.append(tmp)
+            for p in batch:
+                try:
+                    p.unlink()
+                except Exception:
+                    pass
+        cur_list = new_list
+        round_idx += 1
+    return cur_list[0]
+
+# -----------------------
+# 出現頻度での外部ソート（メモリに乗らない場合に対応）
+# -----------------------
+def external_sort_agg_by_count(agg_path: Path, out_sorted_path: Path, temp_dir: Path, chunk_mb: int):
+    """
+    agg_path (gram\tcount\n のファイル) を "count desc, gram asc" でソートして out_sorted_path に書く。
+    アルゴリズム: 入力を chunk_mb 毎に読み込んでメモリソート -> チャンクを書き出し -> k-way マージ。
+    """
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    chunk_limit = chunk_mb * 1024 * 1024
+    chunk_paths = []
+    buf = []
+    buf_bytes = 0
+    idx = 0
+
+    with agg_path.open("r", encoding="utf-8", errors="replace") as rf:
+        for ln in rf:
+            ln = ln.rstrip("\n")
+            if not ln:
+                continue
+            try:
+                gram, cnts = ln.rsplit("\t", 1)
+                cnt = int(cnts)
+            except Exception:
+                continue
+            entry = (cnt, gram)
+            buf.append(entry)
+            buf_bytes += len(ln.encode("utf-8")) + 8
+            if buf_bytes >= chunk_limit:
+                # sort chunk by (-count, gram)
+                buf.sort(key=lambda x: (-x[0], x[1]))
+                cp = temp_dir / f"sort_chunk_{idx:04d}.tsv"
+                with cp.open("w", encoding="utf-8") as wf:
+                    for c, g in buf:
+                        wf.write(f"{c}\t{g}\n")
+                chunk_paths.append(cp)
+                idx += 1
+                buf = []
+                buf_bytes = 0
+    # flush remaining
+    if buf:
+        buf.sort(key=lambda x: (-x[0], x[1]))
+        cp = temp_dir / f"sort_chunk_{idx:04d}.tsv"
+        with cp.open("w", encoding="utf-8") as wf:
+            for c, g in buf:
+                wf.write(f"{c}\t{g}\n")
+        chunk_paths.append(cp)
+        idx += 1
+        buf = []
+    # 単一チャンクなら変換して終わり
+    if not chunk_paths:
+        # nothing to do
+        out_sorted_path.unlink(missing_ok=True)
+        agg_path.replace(out_sorted_path)
+        return out_sorted_path
+    if len(chunk_paths) == 1:
+        # read chunk and write as gram\tcount
+        with chunk_paths[0].open("r", encoding="utf-8", errors="replace") as rf, \
+             out_sorted_path.open("w", encoding="utf-8") as wf:
+            for ln in rf:
+                ln = ln.rstrip("\n")
+                if not ln:
+                    continue
+                c, g = ln.split("\t", 1)
+                wf.write(f"{g}\t{c}\n")
+        try:
+            chunk_paths[0].unlink()
+            temp_dir.rmdir()
+        except Exception:
+            pass
+        return out_sorted_path
+
+    # k-way merge chunk_paths (each line: count\tgram), merge by (-count, gram)
+    files = []
+    heap = []
+    try:
+        for i, p in enumerate(chunk_paths):
+            f = p.open("r", encoding="utf-8", errors="replace")
+            files.append(f)
+            ln = f.readline()
+            if not ln:
+                continue
+            ln = ln.rstrip("\n")
+            c_str, g = ln.split("\t", 1)
+            c = int(c_str)
+            heapq.heappush(heap, (-c, g, i))
+        with out_sorted_path.open("w", encoding="utf-8") as wf:
+            while heap:
+                negc, g, i = heapq.heappop(heap)
+                c = -negc
+                wf.write(f"{g}\t{c}\n")
+                fh = files[i]
+                ln = fh.readline()
+                if ln:
+                    ln = ln.rstrip("\n")
+                    c_str, g2 = ln.split("\t", 1)
+                    c2 = int(c_str)
+                    heapq.heappush(heap, (-c2, g2, i))
+    finally:
+        for f in files:
+            try:
+                f.close()
+            except Exception:
+                pass
+        # cleanup chunks
+        for p in chunk_paths:
+            try:
+                p.unlink()
+            except Exception:
+                pass
+        try:
+            temp_dir.rmdir()
+        except Exception:
+            pass
+    return out_sorted_path
+
+def export_sorted_to_outputs(sorted_agg_path: Path, n: int, out_dir: Path, min_count: int, size_mb: int,
+                             name: str = "hplt"):
+    """
+    sorted_agg_path: gram\tcount lines sorted by count desc then gram asc.
+    出力を size_mb ごとに分割して {n}{name}0000.txt, ... に書く。戻りは生成したファイルのリスト。
+    """
+    created = []
+    target = size_mb * 1024 * 1024
+    idx = 0
+    f = None
+    bytes_written = 0
+    with sorted_agg_path.open("r", encoding="utf-8", errors="replace") as rf:
+        for ln in rf:
+            ln = ln.rstrip("\n")
+            if not ln:
+                continue
+            gram, cnts = ln.rsplit("\t", 1)
+            cnt = int(cnts)
+            if cnt < min_count:
+                continue
+            line = f"{gram}\t{cnt}\n"
+            b = len(line.encode("utf-8"))
+            if f is None:
+                path = out_dir / f"{n}{name}{idx:04d}.txt"
+                f = path.open("w", encoding="utf-8")
+                bytes_written = 0
+            if bytes_written + b > target and bytes_written > 0:
+                f.close()
+                created.append(path)
+                idx += 1
+                path = out_dir / f"{n}{name}{idx:04d}.txt"
+                f = path.open("w", encoding="utf-8")
+                bytes_written = 0
+            f.write(line)
+            bytes_written += b
+    if f is not None:
+        f.close()
+        created.append(out_dir / f"{n}{name}{idx:04d}.txt")
+    return created
+
+
+def merge_and_export(paths, n: int, chunks_dir: Path, out_dir: Path, min_count: int, size_mb: int,
+                     sort_mb: int = CHUNK_SORT_MB, name: str = "hplt", label: str = None,
+                     max_open: int = MAX_OPEN_FILES):
+    """gram 順のチャンク群をマージ → 出現頻度で外部ソート → 分割出力。戻りは生成したファイルのリスト"""
+    label = label or f"{n}-gram"
+    paths = [Path(p) for p in paths if Path(p).exists()]
+    if not paths:
+        print(f"no chunks for {label}")
+        return []
+    out_dir.mkdir(parents=True, exist_ok=True)
+    print(f"merging {len(paths)} chunks for {label} ...")
+    merged = multi_pass_merge(paths, chunks_dir, max_open)
+    if merged is None:
+        return []
+    # external sort by count (creates sorted_agg file)
+    sorted_dir = chunks_dir / f"sort_n{n}"
+    sorted_dir.mkdir(parents=True, exist_ok=True)
+    sorted_agg = chunks_dir / f"merged_n{n}_sorted.tsv"
+    print(f"sorting aggregated counts by frequency for {label} ...")
+    external_sort_agg_by_count(Path(merged), sorted_agg, sorted_dir, sort_mb)
+    try:
+        Path(merged).unlink()
+    except Exception:
+        pass
+    # export frequency-sorted aggregated results to final outputs
+    print(f"exporting final files for {label} ...")
+    created = export_sorted_to_outputs(sorted_agg, n, out_dir, min_count, size_mb, name)
+    # remove sorted aggregated file
+    try:
+        Path(sorted_agg).unlink()
+    except Exception:
+        pass
+    return created
+
+# Git helpers
+def get_git_root(start_path: Path):
+    try:
+        p = subprocess.run(["git", "rev-parse", "--show-toplevel"],
+                           cwd=str(start_path), check=True, capture_output=True, text=True)
+        return Path(p.stdout.strip())
+    except Exception:
+        return None
+
+def git_add_commit_push(files, repo_root: Path, message_prefix: str = GIT_COMMIT_MESSAGE_PREFIX):
+    rels = []
+    for f in files:
+        try:
+            rel = Path(f).resolve().relative_to(repo_root.resolve())
+            rels.append(str(rel).replace("\\", "/"))
+        except Exception:
+            rels.append(str(Path(f).resolve()))
+    msg = f"{message_prefix}: " + ", ".join(rels)
+    attempt = 0
+    while attempt < 6:
+        attempt += 1
+        try:
+            subprocess.run(["git", "add", "--"] + rels, cwd=str(repo_root), check=True)
+            diff = subprocess.run(["git", "diff", "--cached", "--name-only"], cwd=str(repo_root),
+                                  check=True, capture_output=True, text=True)
+            if not diff.stdout.strip():
+                return True
+            subprocess.run(["git", "commit", "-m", msg], cwd=str(repo_root), check=True)
+            subprocess.run(["git", "push"], cwd=str(repo_root), check=True)
+            return True
+        except subprocess.CalledProcessError:
+            time.sleep(min((2 ** attempt) + random.random(), 60))
+    return False
+
@@ -0,0 +1,216 @@
+"""
+トークン ID 配列（tokcache.py のキャッシュや chars.py のコードポイント列）から n-gram を NumPy で数える。
+
+トークン 1 つごとの Python ループを使わず、
+  1. 数える ID 列を 1 本の配列にまとめ、各位置が属する区間（文書または文）の終わりを求める
+  2. sliding_window_view で長さ n の窓を作り、区間をまたぐ窓を除く
+  3. 窓を uint64 に詰める（語彙のビット数 × n が 64 以下のとき）か、
+     n 個の uint32 をまとめた void 型にして np.unique(return_counts=True) で数える
+  4. 異なり n-gram だけを UCS-4 の行列に並べてまとめて文字列に戻し、gram 順に並べる
+という流れで数える。結果は ngramio.flush_counter_to_chunk と同じ形式
+（gram\\tcount、gram 昇順）のチャンクとして書くので、そのままマージに回せる。
+"""
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+BATCH_TOKENS = 8_000_000   # 一度に窓を作るトークン数の目安（区間の途中では切らない）
+BLOCK_ROWS = 1 << 16       # gram を文字列にするときに一度に扱う行数
+
+
+def segment_sequence(ids, bounds, bos=None, eos=None):
+    """ids を bounds（区間の開始位置、最後は全長）で区切った列にする。
+
+    bos/eos が与えられれば空でない区間の前後に挟む。空の区間は捨てる。
+    戻りは (列, 区間ごとの開始位置, 区間ごとの終了位置)。
+    """
+    bounds = np.asarray(bounds, dtype=np.int64)
+    starts, ends = bounds[:-1], bounds[1:]
+    nonempty = ends > starts
+    starts, ends = starts[nonempty], ends[nonempty]
+    lengths = ends - starts
+    if bos is None and eos is None:
+        seq = np.asarray(ids)
+        return seq, starts, ends
+    pad = (bos is not None) + (eos is not None)
+    s = len(lengths)
+    out_starts = np.concatenate(([0], np.cumsum(lengths + pad)[:-1])).astype(np.int64) if s else np.zeros(0, np.int64)
+    out = np.empty(int(lengths.sum()) + pad * s, dtype=np.uint32)
+    seg = np.repeat(np.arange(s), lengths)
+    within = np.arange(len(seg)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    offset = 1 if bos is not None else 0
+    out[out_starts[seg] + offset + within] = np.asarray(ids)[np.repeat(starts, lengths) + within]
+    if bos is not None:
+        out[out_starts] = bos
+    if eos is not None:
+        out[out_starts + offset + lengths] = eos
+    return out, out_starts, out_starts + lengths + pad
+
+
+def break_segments(seq, seg_starts, seg_ends, ok):
+    """ok が False の位置を取り除き、そこで区間を切る（区間は隙間なく並んでいること）。
+    戻りは segment_sequence と同じ (列, 区間ごとの開始位置, 区間ごとの終了位置)"""
+    ok = np.asarray(ok, dtype=bool)
+    begins = np.zeros(len(seq), dtype=bool)
+    begins[np.asarray(seg_starts, dtype=np.int64)] = True
+    # 取り除いた位置の次からは新しい区間
+    begins[1:] |= ~ok[:-1]
+    new_pos = np.cumsum(ok) - 1
+    starts = new_pos[begins & ok].astype(np.int64)
+    out = np.asarray(seq)[ok]
+    ends = np.append(starts[1:], len(out)).astype(np.int64) if len(starts) else starts
+    return out, starts, ends
+
+
+def _count_windows(seq, seg_end, n, bits):
+    """seq の長さ n の窓のうち区間をまたがないものを数える。戻りは (ID の行列 [k, n], 回数)"""
+    if len(seq) < n:
+        return np.zeros((0, n), dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    m = len(seq) - n + 1
+    valid = np.flatnonzero(np.arange(m) + n <= seg_end[:m])
+    if len(valid) == 0:
+        return np.zeros((0, n), dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    win = sliding_window_view(seq, n)[valid]
+    if bits * n <= 64:
+        key = np.zeros(len(win), dtype=np.uint64)
+        for j in range(n):
+            key <<= np.uint64(bits)
+            key |= win[:, j].astype(np.uint64)
+        uniq, counts = np.unique(key, return_counts=True)
+        rows = np.empty((len(uniq), n), dtype=np.uint32)
+        mask = np.uint64((1 << bits) - 1)
+        for j in range(n - 1, -1, -1):
+            rows[:, j] = (uniq & mask).astype(np.uint32)
+            uniq = uniq >> np.uint64(bits)
+        return rows, counts
+    # ビッグエンディアンにしておくとバイト順の並びが ID 列の辞書順と一致する
+    win = np.ascontiguousarray(win, dtype=">u4")
+    void = win.view(np.dtype((np.void, 4 * n))).ravel()
+    uniq, counts = np.unique(void, return_counts=True)
+    return uniq.view(">u4").reshape(-1, n).astype(np.uint32), counts
+
+
+def count_ngrams(seq, seg_starts, seg_ends, n_max, vocab_size, batch_tokens=BATCH_TOKENS, n_min=1):
+    """区間に分かれた ID 列（segment_sequence の戻り）の n_min..n_max-gram を数える。
+
+    batch_tokens 程度ずつ（区間の途中では切らない）数え、バッチと n ごとに
+    (n, ID の行列, 回数) を返す。同じ n-gram が別のバッチに出ることはある。
+    """
+    bits = max(1, int(vocab_size - 1).bit_length())
+    seg_starts = np.asarray(seg_starts, dtype=np.int64)
+    seg_ends = np.asarray(seg_ends, dtype=np.int64)
+    i = 0
+    while i < len(seg_starts):
+        lo = seg_starts[i]
+        j = max(int(np.searchsorted(seg_ends, lo + batch_tokens, side="right")), i + 1)
+        sub = seq[lo:seg_ends[j - 1]]
+        # 各位置が属する区間の終わり（区間は隙間なく並んでいる）
+        seg_end = np.repeat(seg_ends[i:j] - lo, seg_ends[i:j] - seg_starts[i:j])
+        for n in range(n_min, n_max + 1):
+            rows, counts = _count_windows(sub, seg_end, n, bits)
+            if len(counts):
+                yield n, rows, counts
+        i = j
+
+
+def vocab_codepoints(vocab):
+    """語彙を (全トークンのコードポイントをつなげた配列, 各トークンの開始位置, 長さ) にする（_render 用）。
+    長さをそろえた行列にしないので、長いトークンが 1 つあっても語彙数 × 最大の長さの領域は使わない"""
+    lens = np.fromiter((len(t) for t in vocab), dtype=np.int64, count=len(vocab))
+    flat = np.frombuffer("".join(vocab).encode("utf-32-le"), dtype="<u4")
+    starts = np.cumsum(lens) - lens
+    return flat, starts, lens
+
+
+def _render(rows, vocab_cps, counts=None):
+    """ID の行列を文字列にする。
+
+    gram ごとの文字を UCS-4 の行列（幅はこのブロックでいちばん長い行）に並べてから
+    一度に str にするので、gram ごとの文字列連結をしない。counts がなければ gram の
+    リスト、あれば "gram\tcount\n" をつなげた 1 つの文字列を返す。
+    """
+    flat, starts, lens = vocab_cps
+    k, n = rows.shape
+    tl = lens[rows]
+    off = np.cumsum(tl + 1, axis=1) - (tl + 1)      # 各トークンの開始位置
+    gram_len = off[:, -1] + tl[:, -1]
+    if counts is None:
+        line_len = gram_len
+    else:
+        ndig = np.ones(k, dtype=np.int64)
+        p = 10
+        while (counts >= p).any():
+            ndig += counts >= p
+            p *= 10
+        line_len = gram_len + ndig + 2
+    width = max(int(line_len.max()) if k else 0, 1)
+    out = np.zeros((k, width), dtype=np.uint32)
+    rr = np.arange(k)
+    if n > 1:
+        out[rr[:, None], off[:, 1:] - 1] = 0x20
+    if (tl == 1).all():
+        # 1 文字ずつ（文字 n-gram など）は位置が固定
+        out[:, 0:2 * n - 1:2] = flat[starts[rows]]
+    else:
+        # 各トークンの文字を、つなげた配列から行列の位置へまとめて写す
+        tl_flat = tl.ravel()
+        within = np.arange(int(tl_flat.sum())) - np.repeat(np.cumsum(tl_flat) - tl_flat, tl_flat)
+        src = np.repeat(starts[rows].ravel(), tl_flat) + within
+        dst_row = np.repeat(np.repeat(rr, n), tl_flat)
+        dst_col = np.repeat(off.ravel(), tl_flat) + within
+        out[dst_row, dst_col] = flat[src]
+    if counts is None:
+        return out.view(f"<U{width}").ravel().tolist()
+    out[rr, gram_len] = 0x09
+    for d in range(int(ndig.max()) if k else 0):
+        sel = ndig > d
+        out[rr[sel], gram_len[sel] + 1 + d] = 0x30 + (counts[sel] // 10 ** (ndig[sel] - 1 - d)) % 10
+    out[rr, line_len - 1] = 0x0A
+    return out[np.arange(width) < line_len[:, None]].tobytes().decode("utf-32-le")
+
+
+def _is_char_order(rows, vocab_cps):
+    """語彙がすべて 1 文字で文字順に ID が振られ、rows が ID 列の辞書順なら、そのまま gram 順"""
+    flat, _, lens = vocab_cps
+    if (lens != 1).any() or (np.diff(flat.astype(np.int64)) <= 0).any():
+        return False
+    diff = rows[1:] != rows[:-1]
+    col = diff.argmax(axis=1)
+    i = np.arange(len(col))
+    return bool(diff[i, col].all() and (rows[1:][i, col] > rows[:-1][i, col]).all())
+
+
+def sort_rows(rows, counts, vocab_cps, block_rows=BLOCK_ROWS):
+    """ID の行列を gram（" " 区切りの文字列）の順に並べ替える。戻りは (rows, counts)
+
+    語彙に空白を含むトークンがあると別の ID 列が同じ文字列になりうるので、それは合算する。
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if len(rows) < 2:
+        return rows, counts
+    if _is_char_order(rows, vocab_cps):
+        return rows, counts
+    grams = np.empty(len(rows), dtype=object)
+    for b in range(0, len(rows), block_rows):
+        grams[b:b + block_rows] = _render(rows[b:b + block_rows], vocab_cps)
+    if not (grams[1:] >= grams[:-1]).all():
+        order = np.argsort(grams, kind="stable")
+        grams, rows, counts = grams[order], rows[order], counts[order]
+    first = np.concatenate(([True], grams[1:] != grams[:-1]))
+    if not first.all():
+        starts = np.flatnonzero(first)
+        rows = rows[starts]
+        counts = np.add.reduceat(counts, starts)
+    return rows, counts
+
+
+def write_chunk(rows, counts, vocab, path: Path, block_rows=BLOCK_ROWS):
+    """flush_counter_to_chunk と同じ形式（gram\tcount、gram 昇順）で書く。vocab は語彙のリストか vocab_codepoints の戻り"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    vocab_cps = vocab if isinstance(vocab, tuple) else vocab_codepoints(vocab)
+    rows, counts = sort_rows(rows, counts, vocab_cps, block_rows)
+    with path.open("w", encoding="utf-8") as wf:
+        for b in range(0, len(rows), block_rows):
+            wf.write(_render(rows[b:b + block_rows], vocab_cps, counts[b:b + block_rows]))
+    return path
@@ -0,0 +1,85 @@
+"""
+toklib.py のトークナイザの速さを同じ入力で比べる。
+
+入力の先頭 --docs 文書を engine と同じように文に分けて解析し、読み込み時間と
+文書/秒・文字/秒・トークン/秒（最初のストリームのトークン数）を表示する。
+使えないトークナイザ（MeCab が入っていないなど）は理由を出して飛ばす。
+
+使い方:
+  python tokbench.py D:\\gramdata\\hplt\\purif8\\purif0.txt
+  python tokbench.py 10_0000.jsonl --jsonl --docs 2000 --tokenizers mecab char
+"""
+import argparse
+import sys
+import time
+from itertools import islice
+
+from engine import iter_jsonl_texts, iter_lines, iter_sentences, tokenize_bounded
+from toklib import TOKENIZERS, SudachiTokenizer
+
+DOCS = 1000
+
+
+def make_tokenizer(name, sudachi_res, modes):
+    if name == "sudachi":
+        return SudachiTokenizer(sudachi_res, modes=modes)
+    return TOKENIZERS[name]()
+
+
+def bench(tok, docs, max_sentence_chars=1000):
+    """戻りは (読み込み秒, 解析秒, 文字数, トークン数, 統計)"""
+    t0 = time.perf_counter()
+    tok.load()
+    load = time.perf_counter() - t0
+    first = tok.streams[0]
+    stats = {"retries": 0, "lost_chars": 0}
+    chars = tokens = 0
+    t0 = time.perf_counter()
+    for text in docs:
+        chars += len(text)
+        sents = iter_sentences(text, max_sentence_chars) if tok.split_sentences else [text]
+        for sent in sents:
+            for part in tokenize_bounded(tok.tokenize, sent, stats):
+                tokens += len(part[first])
+    return load, time.perf_counter() - t0, chars, tokens, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="トークナイザの速さを比べる")
+    parser.add_argument("file", help="入力（1 行 1 文書のテキスト、--jsonl なら JSONL）")
+    parser.add_argument("--jsonl", action="store_true")
+    parser.add_argument("--docs", type=int, default=DOCS, help="使う文書数")
+    parser.add_argument("--tokenizers", nargs="+", default=list(TOKENIZERS), choices=list(TOKENIZERS))
+    parser.add_argument("--sudachi-res", default=None, help="Sudachi 辞書の resources（既定: sudachi.py の設定）")
+    parser.add_argument("--modes", nargs="+", default=["B"], help="Sudachi の分割単位")
+    args = parser.parse_args()
+
+    reader = iter_jsonl_texts if args.jsonl else iter_lines
+    docs = list(islice(reader(args.file), args.docs))
+    if not docs:
+        print("文書がありません:", args.file, file=sys.stderr)
+        sys.exit(1)
+    sudachi_res = args.sudachi_res
+    if sudachi_res is None and "sudachi" in args.tokenizers:
+        from sudachi import SUDACHI_FULL_RES
+        sudachi_res = SUDACHI_FULL_RES
+    print(f"{len(docs)} 文書, {sum(map(len, docs))} 文字")
+    print(f"{'tokenizer':<12}{'load s':>8}{'docs/s':>10}{'chars/s':>12}{'tokens/s':>12}{'retries':>9}")
+    for name in args.tokenizers:
+        tok = make_tokenizer(name, sudachi_res, args.modes)
+        err = tok.check()
+        if err:
+            print(f"{name:<12}スキップ: {err}")
+            continue
+        try:
+            load, secs, chars, tokens, stats = bench(tok, docs)
+        except Exception as e:
+            print(f"{name:<12}エラー: {e}")
+            continue
+        secs = max(secs, 1e-9)
+        print(f"{name:<12}{load:>8.2f}{len(docs) / secs:>10.0f}{chars / secs:>12.0f}{tokens / secs:>12.0f}"
+              f"{stats['retries']:>9}")
+
+
+if __name__ == "__main__":
+    main()
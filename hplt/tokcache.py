@@ -0,0 +1,186 @@
+"""
+形態素解析の結果を入力ファイルごとにキャッシュする（engine.py から使う）。
+
+NGRAM_MAX や MIN_COUNT、フィルタを変えて数え直すたびに Sudachi で全コーパスを
+解析し直さなくて済むよう、解析結果をトークン ID の配列として保存しておく。
+フィルタ（is_japanese_token など）は保存時ではなく数えるときに語彙のマスクでかけるので、
+フィルタを変えてもキャッシュはそのまま使える。
+
+キャッシュのキーは「入力ファイルの内容ハッシュ + 解析の設定（辞書、分割単位、ビュー、
+文分割の設定など）」。どちらかが変われば別のエントリになる。
+
+エントリの中身（CACHE_DIR/<キー>/）:
+  meta.json          : 入力名、内容ハッシュ、設定、ストリーム一覧、文書数・文数
+  vocab.txt          : 語彙（1 行 1 トークン、行番号 = ID）
+  <stream>.ids.u32   : ストリームごとのトークン ID（uint32、全文を連結）
+  <stream>.sent.u64  : 各文の開始位置（uint64、文数 + 1 個）
+  docs.u64           : 各文書の最初の文の番号（uint64、文書数 + 1 個）
+ストリーム名は "<分割単位>_<ビュー>"（例: B_surface）。配列は np.memmap で読む。
+meta.json は最後に書くので、書きかけのエントリは使われない。
+"""
+from array import array
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+FORMAT_VERSION = 1
+_FLUSH_TOKENS = 1 << 20     # この数のトークンがたまったらファイルに書き出す
+
+
+def file_digest(path: Path):
+    h = hashlib.sha1()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def entry_key(content_hash: str, config: dict):
+    blob = json.dumps([FORMAT_VERSION, content_hash, config], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def stream_name(stream):
+    mode, view = stream
+    return f"{mode}_{view}"
+
+
+class CacheWriter:
+    """文書を 1 つずつ受け取り、トークン ID の配列を書き出す"""
+
+    def __init__(self, entry_dir: Path, streams):
+        self.dir = Path(entry_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.streams = list(streams)
+        self.vocab = {}
+        self.ids = {st: array("I") for st in self.streams}
+        self.ids_files = {st: (self.dir / f"{stream_name(st)}.ids.u32").open("wb") for st in self.streams}
+        self.sent = {st: array("Q", [0]) for st in self.streams}
+        self.written = {st: 0 for st in self.streams}
+        self.docs = array("Q", [0])
+
+    def _id(self, token):
+        i = self.vocab.get(token)
+        if i is None:
+            i = len(self.vocab)
+            self.vocab[token] = i
+        return i
+
+    def add_doc(self, doc):
+        """doc: {stream: [文ごとのトークン列]}。どのストリームも文の数は同じであること"""
+        n_sent = None
+        for st in self.streams:
+            sents = doc[st]
+            if n_sent is None:
+                n_sent = len(sents)
+            elif n_sent != len(sents):
+                raise ValueError("ストリーム間で文の数が違います")
+            ids = self.ids[st]
+            sent = self.sent[st]
+            for tokens in sents:
+                ids.extend(self._id(t) for t in tokens)
+                sent.append(self.written[st] + len(ids))
+            if len(ids) >= _FLUSH_TOKENS:
+                self._flush(st)
+        self.docs.append(self.docs[-1] + (n_sent or 0))
+
+    def _flush(self, st):
+        ids = self.ids[st]
+        ids.tofile(self.ids_files[st])
+        self.written[st] += len(ids)
+        self.ids[st] = array("I")
+
+    def close(self, meta: dict):
+        for st in self.streams:
+            self._flush(st)
+            self.ids_files[st].close()
+            with (self.dir / f"{stream_name(st)}.sent.u64").open("wb") as f:
+                self.sent[st].tofile(f)
+        with (self.dir / "docs.u64").open("wb") as f:
+            self.docs.tofile(f)
+        with (self.dir / "vocab.txt").open("w", encoding="utf-8", newline="\n") as f:
+            for token in self.vocab:
+                f.write(token.replace("\n", " ") + "\n")
+        meta = dict(meta)
+        meta.update({
+            "format": FORMAT_VERSION,
+            "streams": [stream_name(st) for st in self.streams],
+            "docs": len(self.docs) - 1,
+            "sentences": len(self.sent[self.streams[0]]) - 1 if self.streams else 0,
+            "vocab": len(self.vocab),
+        })
+        tmp = self.dir / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self.dir / "meta.json")
+
+
+class CacheEntry:
+    """書き終わったエントリを読む。ids / sent は {stream: np.memmap}"""
+
+    def __init__(self, entry_dir: Path):
+        self.dir = Path(entry_dir)
+        self.meta = json.loads((self.dir / "meta.json").read_text(encoding="utf-8"))
+        with (self.dir / "vocab.txt").open("r", encoding="utf-8", newline="\n") as f:
+            self.vocab = f.read().split("\n")[:-1]
+        self.ids = {}
+        self.sent = {}
+        for name in self.meta["streams"]:
+            mode, view = name.split("_", 1)
+            st = (mode, view)
+            self.ids[st] = _memmap(self.dir / f"{name}.ids.u32", np.uint32)
+            self.sent[st] = _memmap(self.dir / f"{name}.sent.u64", np.uint64)
+        self.docs = _memmap(self.dir / "docs.u64", np.uint64)
+
+    @property
+    def streams(self):
+        return list(self.ids)
+
+    def vocab_mask(self, predicate):
+        """語彙ごとに predicate を評価した bool 配列（ID で引くフィルタ）"""
+        return np.fromiter((bool(predicate(t)) for t in self.vocab), dtype=bool, count=len(self.vocab))
+
+    def iter_docs(self):
+        """文書ごとに (最初の文の番号, 最後の文の番号 + 1) を返す"""
+        docs = self.docs
+        for d in range(len(docs) - 1):
+            yield int(docs[d]), int(docs[d + 1])
+
+    def sentence(self, stream, i):
+        sent = self.sent[stream]
+        return self.ids[stream][int(sent[i]):int(sent[i + 1])]
+
+
+def _memmap(path: Path, dtype):
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def lookup(cache_dir: Path, content_hash: str, config: dict):
+    """キャッシュがあれば CacheEntry、なければ None"""
+    entry_dir = Path(cache_dir) / entry_key(content_hash, config)
+    if not (entry_dir / "meta.json").exists():
+        return None
+    try:
+        return CacheEntry(entry_dir)
+    except Exception:
+        return None
+
+
+def build(cache_dir: Path, src: Path, content_hash: str, config: dict, streams, docs):
+    """docs（{stream: [文ごとのトークン列]} の iterator）を書き出して CacheEntry を返す"""
+    key = entry_key(content_hash, config)
+    final = Path(cache_dir) / key
+    tmp = Path(cache_dir) / f"{key}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    writer = CacheWriter(tmp, streams)
+    for doc in docs:
+        writer.add_doc(doc)
+    writer.close({"source": Path(src).name, "content_hash": content_hash, "config": config})
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+    return CacheEntry(final)
@@ -0,0 +1,256 @@
+"""
+engine.py から使うトークナイザ。
+
+どれも同じ形で使う:
+  tok.check()        : 使えなければエラーメッセージ（str）、使えれば None
+  tok.load()         : 辞書などの重い初期化（ワーカープロセスの中で 1 回だけ呼ばれる）
+  tok.streams        : 出すストリーム (単位, ビュー) のリスト。単位ごとに "surface" を必ず含む
+  tok.config()       : 解析結果のキャッシュのキーに入れる設定（dict）
+  tok.tokenize(text) : 1 文を解析して {ストリーム: トークン列} を返す。失敗したら例外
+
+load() するまでは設定しか持たないので、オブジェクトのままワーカーに渡せる（pickle できる）。
+split_sentences が True のトークナイザには、engine が文に分けた片を渡す。
+"""
+import json
+import os
+import tempfile
+from pathlib import Path
+
+_KATA_TO_HIRA = str.maketrans({chr(c): chr(c - 0x60) for c in range(0x30A1, 0x30F7)})
+
+
+class Tokenizer:
+    name = "base"
+    split_sentences = True
+
+    def check(self):
+        return None
+
+    def load(self):
+        pass
+
+    @property
+    def streams(self):
+        raise NotImplementedError
+
+    def config(self):
+        return {"tokenizer": self.name}
+
+    def tokenize(self, text: str):
+        raise NotImplementedError
+
+
+# -----------------------
+# Sudachi
+# -----------------------
+def _reading(m):
+    return m.reading_form().translate(_KATA_TO_HIRA)
+
+# 形態素 → ビューの文字列。空になる場合（記号の読みなど）は表層形を使う
+VIEW_FUNCS = {
+    "surface": lambda m: m.surface(),
+    "dictionary_form": lambda m: m.dictionary_form(),
+    "normalized_form": lambda m: m.normalized_form(),
+    "reading": _reading,
+}
+
+_MODE_ORDER = "ABC"
+
+
+class SudachiTokenizer(Tokenizer):
+    """Sudachi。分割単位（A/B/C）とビュー（VIEW_FUNCS）ごとにストリームを出す。
+
+    指定の中で最も長い単位のモードで 1 回だけ解析し、短い単位は Morpheme.split で作る。
+    """
+    name = "sudachi"
+
+    def __init__(self, resources, modes=("B",), views=("surface",)):
+        self.resources = str(resources)
+        self.modes = [m for m in _MODE_ORDER if m in modes]
+        self.requested_modes = list(modes)
+        self.views = list(dict.fromkeys(["surface"] + list(views)))
+        self._tok = None
+
+    def check(self):
+        res_path = Path(self.resources)
+        if not res_path.is_dir() or not (res_path / "system.dic").exists():
+            return f"辞書 resources が見つからないか system.dic がありません: {res_path}"
+        unknown = [v for v in self.views if v not in VIEW_FUNCS]
+        if unknown:
+            return "未知のビュー: " + ", ".join(unknown)
+        if not self.modes or len(self.modes) != len(set(self.requested_modes)):
+            return f"分割単位は A/B/C から選んでください: {self.requested_modes}"
+        return None
+
+    @property
+    def streams(self):
+        return [(mode, v) for mode in self.modes for v in self.views]
+
+    def config(self):
+        # 以前の sudachi.py のキャッシュと同じキーになるよう "tokenizer" は入れない
+        res_path = Path(self.resources)
+        return {
+            "dict": str(res_path.resolve()),
+            "dict_size": (res_path / "system.dic").stat().st_size,
+            "modes": self.modes,
+            "views": self.views,
+        }
+
+    def load(self):
+        if self._tok is not None:
+            return
+        os.environ["SUDACHIPY_DICT"] = self.resources
+        try:
+            from sudachipy import dictionary, tokenizer
+        except Exception as e:
+            raise RuntimeError(f"SudachiPy import error; 辞書の設定を確認してください: {e}")
+        self._tok = _create_sudachi(dictionary, Path(self.resources))
+        self._base_mode = self.modes[-1]
+        self._split_mode = getattr(tokenizer.Tokenizer.SplitMode, self._base_mode)
+        self._sub_modes = {m: getattr(tokenizer.Tokenizer.SplitMode, m) for m in self.modes}
+        self._view_funcs = [(v, VIEW_FUNCS[v]) for v in self.views]
+
+    def split_units(self, ms):
+        """base_mode で解析した形態素列から、各分割単位の形態素列を作る"""
+        units = {}
+        for mode in self.modes:
+            if mode == self._base_mode:
+                units[mode] = list(ms)
+                continue
+            sm = self._sub_modes[mode]
+            out = []
+            for m in ms:
+                parts = m.split(sm)
+                # 分割されない形態素は空のリストが返る版があるので、そのときは自分自身を使う
+                if len(parts) == 0:
+                    out.append(m)
+                else:
+                    out.extend(parts)
+            units[mode] = out
+        return units
+
+    def __getstate__(self):
+        # 解析器は pickle できないので設定だけ渡し、ワーカーで load() し直す
+        state = {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+        state["_tok"] = None
+        return state
+
+    def tokenize(self, text):
+        ms = self._tok.tokenize(text, self._split_mode)
+        out = {}
+        for mode, units in self.split_units(ms).items():
+            for view, func in self._view_funcs:
+                tokens = []
+                for m in units:
+                    t = func(m)
+                    tokens.append(t if t else m.surface())
+                out[(mode, view)] = tokens
+        return out
+
+
+def _create_sudachi(dictionary, res_path: Path):
+    try:
+        return dictionary.Dictionary().create()
+    except Exception:
+        pass
+    sudachi_json = res_path / "sudachi.json"
+    system_dic = res_path / "system.dic"
+    if sudachi_json.exists() and system_dic.exists():
+        import importlib
+        try:
+            tpl = json.loads(sudachi_json.read_text(encoding="utf-8"))
+        except Exception:
+            tpl = {}
+        tpl["systemDict"] = str(system_dic.resolve())
+        if "characterDefinitionFile" not in tpl:
+            tpl["characterDefinitionFile"] = "char.def"
+        tf = tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False, encoding="utf-8")
+        try:
+            json.dump(tpl, tf, ensure_ascii=False, indent=2)
+            tf.flush(); tf.close()
+            try:
+                return dictionary.Dictionary(str(tf.name)).create()
+            except Exception:
+                importlib.reload(dictionary)
+                return dictionary.Dictionary(str(tf.name)).create()
+        finally:
+            try:
+                os.unlink(tf.name)
+            except Exception:
+                pass
+    raise RuntimeError("Sudachi dictionary init failed; check sudachidict_full resources")
+
+
+# -----------------------
+# MeCab
+# -----------------------
+class MecabTokenizer(Tokenizer):
+    """MeCab の分かち書き（-Owakati）。ストリームは ("mecab", "surface") だけ"""
+    name = "mecab"
+
+    def __init__(self, args="-Owakati"):
+        self.args = args
+        self._tagger = None
+
+    def check(self):
+        try:
+            import MeCab  # noqa: F401
+        except Exception:
+            return "mecab-python3 が必要です: pip install mecab-python3"
+        return None
+
+    @property
+    def streams(self):
+        return [("mecab", "surface")]
+
+    def config(self):
+        import MeCab
+        return {"tokenizer": self.name, "args": self.args, "version": getattr(MeCab, "VERSION", "")}
+
+    def load(self):
+        if self._tagger is None:
+            import MeCab
+            self._tagger = MeCab.Tagger(self.args)
+
+    def __getstate__(self):
+        return {"args": self.args, "_tagger": None}
+
+    def tokenize(self, text):
+        s = self._tagger.parse(text)
+        return {("mecab", "surface"): s.split() if s else []}
+
+
+# -----------------------
+# 解析しないもの
+# -----------------------
+class CharTokenizer(Tokenizer):
+    """1 文字 = 1 トークン（空白は捨てる）。大量に数えるなら chars.py のほうが速い"""
+    name = "char"
+
+    @property
+    def streams(self):
+        return [("char", "surface")]
+
+    def tokenize(self, text):
+        return {("char", "surface"): [ch for ch in text if not ch.isspace()]}
+
+
+class WhitespaceTokenizer(Tokenizer):
+    """分かち書き済みの入力（空白区切り）をそのまま使う。文には分けない"""
+    name = "whitespace"
+    split_sentences = False
+
+    @property
+    def streams(self):
+        return [("ws", "surface")]
+
+    def tokenize(self, text):
+        return {("ws", "surface"): text.split()}
+
+
+TOKENIZERS = {
+    "sudachi": SudachiTokenizer,
+    "mecab": MecabTokenizer,
+    "char": CharTokenizer,
+    "whitespace": WhitespaceTokenizer,
+}
@@ -0,0 +1,261 @@
+"""
+辞書を 1 度だけ読み込んで常駐する解析サーバー。
+
+Sudachi（sudachidict_full）の辞書の読み込みと、そのための一時 sudachi.json の作成は
+起動のたびに数秒かかる。短いジョブを何度も走らせたり、ワーカーを何本も立てたりすると
+その時間が支配的になるので、このサーバーを立てておき、解析と数える仕事を
+ローカルのソケット（multiprocessing.connection、authkey 付き）で受け付ける。
+
+- 起動時に親プロセスで辞書を読み込んでから、fork でワーカープールを作る。
+  ワーカーは読み込み済みの辞書を copy-on-write で共有する（fork できない Windows では
+  ワーカーごとに起動時に 1 度だけ読み込む。どちらにしてもジョブごとには読み込まない）。
+- ジョブ（conn.send で dict を送り、conn.recv で結果を受け取る）:
+    {"op": "ping"}                                 → トークナイザの設定
+    {"op": "tokenize", "texts": [...]}             → 文書ごとの {ストリーム: [文ごとのトークン列]}
+    {"op": "count", "engine": e, "task": i, "src": p} → e.count_file(i, p) の結果
+    {"op": "shutdown"}
+  count の engine はクライアントの NgramEngine（トークナイザは設定だけ）。サーバーの
+  トークナイザと設定が同じときだけ、読み込み済みのものに差し替えて数える。
+- engine.py の NgramEngine(server=...) はこのサーバーに count を投げる（sudachi.py の
+  TOKEN_SERVER）。サーバーにつながらなければ自分で解析する。
+- ジョブは pickle で受け取り、count ではクライアントのエンジンをそのまま動かすので、
+  authkey を知っている人はサーバーのユーザーとしてコードを動かせる。authkey は起動の
+  たびに乱数で作り、本人だけが読める鍵ファイル（~/.gramdata/tokserver-<ポート>.key）に
+  書く。クライアントはそこから読む。環境変数 GRAMDATA_TOKSERVER_KEY（16 進）があれば
+  サーバーもクライアントもそちらを使う（別のユーザー・マシンから使うとき）。
+  Windows ではファイルの権限を変えられないので、ホームディレクトリの権限に頼る。
+
+使い方:
+  python tokserver.py                      # sudachi.py の設定（辞書・分割単位・ビュー）で起動
+  python tokserver.py --tokenizer mecab --workers 4
+  python tokserver.py --stop
+"""
+import argparse
+import multiprocessing as mp
+import os
+import secrets
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+from engine import NgramEngine, iter_sentences, tokenize_bounded
+from toklib import MecabTokenizer, SudachiTokenizer
+
+# --- 設定 ---
+ADDRESS = ("127.0.0.1", 50917)
+KEY_DIR = Path.home() / ".gramdata"      # 鍵ファイルの置き場所
+KEY_ENV = "GRAMDATA_TOKSERVER_KEY"       # 鍵を渡す環境変数（16 進）
+WORKERS = mp.cpu_count() or 1
+# -------------
+
+_tokenizer = None       # 読み込み済みのトークナイザ（親で読み込み、fork でワーカーに引き継ぐ）
+
+
+def key_file(address):
+    return KEY_DIR / f"tokserver-{address[1]}.key"
+
+
+def create_authkey(address):
+    """起動時に authkey を作り、本人だけが読める鍵ファイルに書く（環境変数があればそれを使う）"""
+    if os.environ.get(KEY_ENV):
+        return bytes.fromhex(os.environ[KEY_ENV])
+    key = secrets.token_bytes(32)
+    KEY_DIR.mkdir(mode=0o700, exist_ok=True)
+    path = key_file(address)
+    tmp = path.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key.hex())
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, path)
+    return key
+
+
+def load_authkey(address):
+    """環境変数か鍵ファイルから authkey を読む。なければ None"""
+    if os.environ.get(KEY_ENV):
+        return bytes.fromhex(os.environ[KEY_ENV])
+    try:
+        return bytes.fromhex(key_file(address).read_text().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _init_worker(tokenizer):
+    global _tokenizer
+    if _tokenizer is None:
+        tokenizer.load()
+        _tokenizer = tokenizer
+
+
+def _tokenize_job(texts, max_sentence_chars, min_retry_chars):
+    tok = _tokenizer
+    docs = []
+    stats = {"retries": 0, "lost_chars": 0}
+    for text in texts:
+        doc = {st: [] for st in tok.streams}
+        sents = iter_sentences(text, max_sentence_chars) if tok.split_sentences else [text]
+        for sent in sents:
+            sent_tokens = {st: [] for st in tok.streams}
+            for part in tokenize_bounded(tok.tokenize, sent, stats, min_retry_chars):
+                for st, tokens in part.items():
+                    sent_tokens[st].extend(tokens)
+            for st, tokens in sent_tokens.items():
+                doc[st].append(tokens)
+        docs.append(doc)
+    return docs
+
+
+def _count_job(engine: NgramEngine, task, src):
+    if engine.tokenizer.config() != _tokenizer.config():
+        raise ValueError("サーバーのトークナイザと設定が違います")
+    engine.tokenizer = _tokenizer
+    engine.server = None
+    return engine.count_file(task, Path(src))
+
+
+class TokenServer:
+    def __init__(self, tokenizer, workers=WORKERS, address=ADDRESS, authkey=None):
+        self.tokenizer = tokenizer
+        self.workers = workers
+        self.address = address
+        self.authkey = authkey or create_authkey(address)
+        self._stop = threading.Event()
+
+    def serve(self):
+        global _tokenizer
+        if "fork" in mp.get_all_start_methods():
+            # 親で読み込んでから fork する（辞書は copy-on-write で共有）
+            self.tokenizer.load()
+            _tokenizer = self.tokenizer
+            ctx = mp.get_context("fork")
+        else:
+            ctx = mp.get_context("spawn")
+        self.pool = ctx.Pool(self.workers, initializer=_init_worker, initargs=(self.tokenizer,))
+        self.config = self.tokenizer.config()
+        listener = Listener(self.address, authkey=self.authkey)
+        print(f"tokserver: {self.tokenizer.name} ({self.workers} workers) listening on {self.address}")
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print("接続エラー:", e, file=sys.stderr)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            if not os.environ.get(KEY_ENV):
+                key_file(self.address).unlink(missing_ok=True)
+            self.pool.terminate()
+            self.pool.join()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    job = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    result = self._run(job)
+                    conn.send(("ok", result))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+                if job.get("op") == "shutdown":
+                    self._stop.set()
+                    # accept() を抜けさせるために自分につなぐ
+                    try:
+                        Client(self.address, authkey=self.authkey).close()
+                    except Exception:
+                        pass
+                    return
+
+    def _run(self, job):
+        op = job.get("op")
+        if op == "ping":
+            return self.config
+        if op == "tokenize":
+            return self.pool.apply(_tokenize_job, (job["texts"], job.get("max_sentence_chars", 1000),
+                                                   job.get("min_retry_chars", 16)))
+        if op == "count":
+            return self.pool.apply(_count_job, (job["engine"], job["task"], job["src"]))
+        if op == "shutdown":
+            return None
+        raise ValueError(f"未知のジョブ: {op}")
+
+
+class TokenClient:
+    """サーバーへの 1 本の接続。スレッドごとに別のクライアントを使うこと"""
+
+    def __init__(self, address=ADDRESS, authkey=None):
+        authkey = authkey or load_authkey(address)
+        if authkey is None:
+            raise ConnectionRefusedError(f"tokserver の鍵がありません（{key_file(address)} か {KEY_ENV}）")
+        self.conn = Client(tuple(address), authkey=authkey)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def call(self, job):
+        self.conn.send(job)
+        status, result = self.conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"tokserver: {result}")
+        return result
+
+    def ping(self):
+        return self.call({"op": "ping"})
+
+    def tokenize(self, texts, max_sentence_chars=1000, min_retry_chars=16):
+        return self.call({"op": "tokenize", "texts": list(texts), "max_sentence_chars": max_sentence_chars,
+                          "min_retry_chars": min_retry_chars})
+
+    def count_file(self, engine, task, src):
+        return self.call({"op": "count", "engine": engine, "task": task, "src": str(src)})
+
+    def shutdown(self):
+        return self.call({"op": "shutdown"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="辞書を読み込んだまま常駐する解析サーバー")
+    parser.add_argument("--tokenizer", choices=["sudachi", "mecab"], default="sudachi")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--port", type=int, default=ADDRESS[1])
+    parser.add_argument("--stop", action="store_true", help="動いているサーバーを止める")
+    args = parser.parse_args()
+    address = (ADDRESS[0], args.port)
+
+    if args.stop:
+        try:
+            with TokenClient(address) as c:
+                c.shutdown()
+            print("stopped")
+        except (OSError, mp.AuthenticationError) as e:
+            print("サーバーにつながりません:", e, file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.tokenizer == "sudachi":
+        import sudachi
+        tokenizer = SudachiTokenizer(sudachi.SUDACHI_FULL_RES, modes=sudachi.SPLIT_MODES, views=sudachi.VIEWS)
+    else:
+        import mecab
+        tokenizer = MecabTokenizer(mecab.MECAB_ARGS)
+    err = tokenizer.check()
+    if err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+    TokenServer(tokenizer, args.workers, address).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+layoutscore.py のコストを使って、仮名配列を焼きなまし法で最適化する。
+
+- 出発点の配列（{仮名: 打鍵列}）の打鍵列の集合（スロット）は固定し、
+  仮名 2 つの打鍵列を入れ替える操作で探索する。
+- 頻度が 0 でない n-gram 項（1/2/3-gram）ごとに現在のコストを持ち、仮名ごとに
+  その仮名を含む項の一覧を作っておく。仮名 p, q の入れ替えで変わるのは
+  S2 / K3 の p, q の行・列（3-gram は面）に当たる項だけなので、p か q を含む項だけを
+  計算し直して差分を出す（p, q を両方含む項は一度だけ数える）。
+  採用したときもその項の値を書き換えるだけで済む。
+- 独立な再スタートをプロセスプールで並列に走らせる。頻度行列は
+  layoutscore.load_tables が作る pr_cache/*.npy を各プロセスが mmap で読むので、
+  OS のページキャッシュを共有する。
+
+使い方:
+  python layoutopt.py layouts/qwerty_romaji.json --source wikikana --restarts 8 --iters 200000
+  python layoutopt.py layouts/qwerty_romaji.json --fix "あいうえお" --out layouts/opt.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from layoutscore import WEIGHTS, LayoutScorer, load_layout, load_tables
+
+# --- 設定 ---
+ITERATIONS = 200_000      # 1 回の再スタートで試す入れ替え回数
+RESTARTS = os.cpu_count() or 1
+WORKERS = os.cpu_count() or 1
+T_START = 0.05            # 初期温度（コスト差の尺度）
+T_END = 0.0005            # 最終温度
+RESYNC_EVERY = 50_000     # 差分の積み重ねによる誤差を消すため、この回数ごとにコストを計算し直す
+# -------------
+
+
+class _Terms:
+    """1 つの次数の n-gram 項（非零の F だけ）と、仮名ごとにそれを含む項の一覧"""
+
+    def __init__(self, cols, weights, table, codes):
+        self.cols = [np.asarray(c, dtype=np.int64) for c in cols]
+        self.w = np.asarray(weights, dtype=np.float64)
+        self.table = table
+        # codes[j][a]: 仮名 a が j 番目の位置にあるときの table 平ら添字への寄与
+        self.codes = codes
+        self.cur = self._values(self.cols)
+        a = len(codes[0])
+        m = len(self.w)
+        kana = np.concatenate(self.cols)
+        term = np.tile(np.arange(m), len(self.cols))
+        pairs = np.unique(kana * m + term)
+        kana, term = pairs // m, pairs % m
+        bounds = np.searchsorted(kana, np.arange(a + 1))
+        self.members = []
+        # overlap[q][p]: q の一覧のうち p も含む項の位置（p, q を両方含む項を二重に数えないため）
+        self.overlap = []
+        for k in range(a):
+            ids = term[bounds[k]:bounds[k + 1]]
+            cols_k = [c[ids] for c in self.cols]
+            self.members.append((ids, cols_k, self.w[ids]))
+            pos = np.tile(np.arange(len(ids)), len(cols_k))
+            other = np.concatenate(cols_k)
+            keep = other != k
+            pairs = np.unique(other[keep] * max(len(ids), 1) + pos[keep])
+            others, where = pairs // max(len(ids), 1), pairs % max(len(ids), 1)
+            cut = np.flatnonzero(np.diff(others)) + 1
+            self.overlap.append({int(g[0]): w for g, w in zip(np.split(others, cut), np.split(where, cut)) if len(g)})
+
+    def _values(self, cols):
+        idx = self.codes[0].take(cols[0])
+        for code, col in zip(self.codes[1:], cols[1:]):
+            idx += code.take(col)
+        return self.table.take(idx)
+
+    def swap_codes(self, p, q):
+        for code in self.codes:
+            code[p], code[q] = code[q], code[p]
+
+    def delta(self, p, q):
+        """codes が入れ替え済みの状態で呼ぶ。戻りは (増分, 新しい値)"""
+        ids_p, cols_p, w_p = self.members[p]
+        ids_q, cols_q, w_q = self.members[q]
+        new_p = self._values(cols_p)
+        new_q = self._values(cols_q)
+        d = (new_p - self.cur[ids_p]) @ w_p
+        diff_q = new_q - self.cur[ids_q]
+        d += diff_q @ w_q
+        # p と q の両方を含む項は p 側で数えたので q 側の分を引く
+        both = self.overlap[q].get(p)
+        if both is not None:
+            d -= diff_q[both] @ w_q[both]
+        return float(d), new_p, new_q
+
+    def commit(self, p, q, new_p, new_q):
+        self.cur[self.members[p][0]] = new_p
+        self.cur[self.members[q][0]] = new_q
+
+
+class DeltaState:
+    """1 つの配列の状態。仮名 p, q の入れ替えによるコスト差を、p か q を含む n-gram 項だけで求める"""
+
+    def __init__(self, scorer: LayoutScorer, slots, assign, weights=WEIGHTS):
+        self.scorer = scorer
+        self.slots = slots
+        self.x = np.array(assign, dtype=np.int64)
+        self.weights = weights
+        self.a = len(self.x)
+        x, s = self.x, slots
+        m = len(s.strokes)
+        self.terms = [
+            _Terms([np.arange(self.a)], scorer.w1, s.S1, [x.copy()]),
+            _Terms(scorer.i2, scorer.w2, s.S2_flat, [x * m, x.copy()]),
+            _Terms(scorer.i3, scorer.w3, s.K3_flat, [s.k3_last[x], s.k3_single[x], s.k3_first[x]]),
+        ]
+        self._pending = None
+        self.resync()
+
+    def delta(self, p, q):
+        """p と q の打鍵列を入れ替えたときのコストの増分"""
+        if p == q or self.x[p] == self.x[q]:
+            self._pending = None
+            return 0.0
+        total = 0.0
+        news = []
+        for w, terms in zip(self.weights, self.terms):
+            terms.swap_codes(p, q)
+            d, new_p, new_q = terms.delta(p, q)
+            terms.swap_codes(p, q)
+            total += w * d
+            news.append((new_p, new_q))
+        self._pending = (p, q, news)
+        return total
+
+    def apply(self, p, q, d):
+        """入れ替えを確定する（d は直前の delta(p, q) の戻り値）"""
+        if self._pending is None or self._pending[:2] != (p, q):
+            self.delta(p, q)
+            if self._pending is None:
+                return
+        news = self._pending[2]
+        self.x[p], self.x[q] = self.x[q], self.x[p]
+        for terms, (new_p, new_q) in zip(self.terms, news):
+            terms.swap_codes(p, q)
+            terms.commit(p, q, new_p, new_q)
+        self.cost += d
+        self._pending = None
+
+    def resync(self):
+        self.cost = float(self.scorer.score(self.x[None, :], self.slots)[0])
+
+
+def anneal(state: DeltaState, movable, iters, t_start, t_end, rng, resync_every=RESYNC_EVERY):
+    """焼きなまし。戻りは (最良コスト, 最良の割り当て, 試した入れ替え数)"""
+    best_cost = state.cost
+    best_x = state.x.copy()
+    movable = np.asarray(movable)
+    if len(movable) < 2 or iters <= 0:
+        return best_cost, best_x, 0
+    pairs = rng.integers(0, len(movable), size=(iters, 2))
+    coins = rng.random(iters)
+    ratio = t_end / t_start
+    for it in range(iters):
+        pi, qi = pairs[it]
+        if pi == qi:
+            continue
+        p, q = int(movable[pi]), int(movable[qi])
+        d = state.delta(p, q)
+        t = t_start * ratio ** (it / iters)
+        if d <= 0 or coins[it] < math.exp(-d / t):
+            state.apply(p, q, d)
+            if state.cost < best_cost:
+                best_cost = state.cost
+                best_x = state.x.copy()
+        if resync_every and (it + 1) % resync_every == 0:
+            state.resync()
+    return best_cost, best_x, iters
+
+
+def _restart(source, keys, fixed, seed, iters, t_start, t_end, weights):
+    """1 回の再スタート（プロセスプールから呼ぶ）"""
+    tables = load_tables(source, mmap_mode="r")
+    scorer = LayoutScorer(tables, weights=weights)
+    assign, slots = scorer.prepare([keys])
+    rng = np.random.default_rng(seed)
+    alphabet = tables["alphabet"]
+    movable = [i for i, ch in enumerate(alphabet) if ch not in fixed]
+    x = assign[0].copy()
+    # 動かせる仮名の割り当てをランダムに並べ替えてから始める
+    x[movable] = x[rng.permutation(movable)]
+    state = DeltaState(scorer, slots, x, weights)
+    start = state.cost
+    t0 = time.perf_counter()
+    best_cost, best_x, n = anneal(state, movable, iters, t_start, t_end, rng)
+    elapsed = time.perf_counter() - t0
+    best_cost = float(scorer.score(best_x[None, :], slots)[0])
+    best_keys = {ch: slots.strokes[best_x[i]] for i, ch in enumerate(alphabet) if slots.strokes[best_x[i]]}
+    return seed, start, best_cost, best_keys, n, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="焼きなまし法で仮名配列を最適化する")
+    parser.add_argument("layout", help="出発点の配列 JSON（打鍵列の集合はこの配列のものを使う）")
+    parser.add_argument("--source", default="wikikana", help="pr/ の頻度データ名")
+    parser.add_argument("--weights", type=float, nargs=3, default=WEIGHTS, metavar=("W1", "W2", "W3"))
+    parser.add_argument("--iters", type=int, default=ITERATIONS, help="1 回の再スタートの入れ替え回数")
+    parser.add_argument("--restarts", type=int, default=RESTARTS, help="独立な再スタートの回数")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="並列プロセス数")
+    parser.add_argument("--t-start", type=float, default=T_START)
+    parser.add_argument("--t-end", type=float, default=T_END)
+    parser.add_argument("--fix", default="", help="動かさない仮名（例: 'あいうえお'）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="最良の配列を書き出す JSON")
+    args = parser.parse_args()
+
+    try:
+        name, keys = load_layout(args.layout)
+        # キャッシュを先に作っておく（ワーカーは mmap で読むだけにする）
+        tables = load_tables(args.source)
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+    weights = tuple(args.weights)
+    scorer = LayoutScorer(tables, weights=weights)
+    assign, slots = scorer.prepare([keys])
+    print(f"{name}: 出発点のコスト {scorer.score(assign, slots)[0]:.4f}")
+    del tables, scorer
+
+    best = None
+    total_swaps = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, args.restarts))) as ex:
+        futures = [ex.submit(_restart, args.source, keys, set(args.fix), args.seed + k,
+                             args.iters, args.t_start, args.t_end, weights)
+                   for k in range(args.restarts)]
+        for fut in as_completed(futures):
+            try:
+                seed, start, cost, best_keys, n, elapsed = fut.result()
+            except Exception as e:
+                print(f"エラーが発生しました: {e}", file=sys.stderr)
+                continue
+            total_swaps += n
+            print(f"  seed {seed}: {start:.4f} -> {cost:.4f} ({n / elapsed:.0f} 入れ替え/秒)")
+            if best is None or cost < best[0]:
+                best = (cost, seed, best_keys)
+    elapsed = time.perf_counter() - t0
+    if best is None:
+        sys.exit(1)
+    print(f"最良: {best[0]:.4f} (seed {best[1]}), 合計 {total_swaps} 入れ替え / {elapsed:.1f} 秒 "
+          f"({total_swaps / elapsed * 60:.0f} 入れ替え/分)")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"name": f"{name}_opt", "source": args.source, "cost": best[0], "keys": best[2]},
+                      f, ensure_ascii=False, indent=2)
+        print(f"書き出し: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+pr/ の仮名 1〜3-gram 頻度から、キー配列（仮名 → 打鍵列）のコストを行列演算で計算する。
+
+- kana.txt の文字を並べたものを仮名アルファベット（A 文字）とし、
+  pr/<source>{1,2,3}gram.json を F1[A], F2[A,A], F3[A,A,A] の密行列にする。
+  アルファベット外の文字を含む gram は捨てる。各行列は合計 1 に正規化する。
+- 行列は pr_cache/<source>_{n}gram.npy に保存し、元 JSON と kana.txt の
+  ハッシュが変わらなければ次回からはそのまま読む（np.load(mmap_mode="r") 可）。
+- 配列は {仮名: "打鍵列"} の dict。打鍵列は KEY_ROWS にあるキー文字の並び
+  （例: ローマ字なら "か": "ka"、仮名直接入力なら "か": "t"）。
+  割り当てのない仮名は空の打鍵列として扱い、UNMAPPED_COST を課す。
+
+コストの分解:
+  打鍵列の 1〜3-gram に KEY_COSTS のコスト（段・指の負担、同指連続、段越え、
+  左右交互、同手の方向転換など）を与え、それを仮名単位にまとめる。
+    S1[s]      : 打鍵列 s の内部で完結する打鍵 1〜3-gram のコスト
+    S2[s,t]    : s と t の境目をまたぐ打鍵 2/3-gram のコスト
+    K3[x,y,z]  : 1 打鍵の仮名 t をはさんで s の最後と u の最初をつなぐ 3-gram のコスト
+  配列のコスト = W1 * Σ F1[a] S1[a] + W2 * Σ F2[a,b] S2[a,b] + W3 * Σ F3[a,b,c] K3[...]
+  打鍵列はすべての配列で共有する「スロット」表に登録し、配列は仮名 → スロット番号の
+  int 配列 assign[P, A] で表す。P 個の配列をまとめて gather と行列積で採点する。
+
+使い方:
+  python layoutscore.py layouts/qwerty_romaji.json --source wikikana
+  python layoutscore.py layouts/qwerty_romaji.json --source tsukimiso --bench 10000
+
+  from layoutscore import load_tables, LayoutScorer, load_layout
+  scorer = LayoutScorer(load_tables("wikikana"))
+  assign, slots = scorer.prepare([load_layout("layouts/qwerty_romaji.json")])
+  scorer.score(assign, slots)
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# --- 設定 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PR_DIR = os.path.join(BASE_DIR, "pr")
+KANA_FILE = os.path.join(BASE_DIR, "kana.txt")
+CACHE_DIR = os.path.join(BASE_DIR, "pr_cache")
+WEIGHTS = (1.0, 1.0, 1.0)   # W1, W2, W3
+CHUNK = 32                  # 一度に採点する配列数（3-gram の gather が CHUNK x 非零数 になる）
+UNMAPPED_COST = 10.0        # 配列に割り当てのない仮名 1 文字あたりのコスト
+
+# キーボードの段（0: 数字段, 1: 上段, 2: ホーム段, 3: 下段）。列 0〜4 は左手、5 以降は右手
+KEY_ROWS = ["1234567890-", "qwertyuiop@", "asdfghjkl;:", "zxcvbnm,./\\"]
+# 列 → 指（0: 小指, 1: 薬指, 2: 中指, 3: 人差し指）
+COLUMN_FINGER = [0, 1, 2, 3, 3, 3, 3, 2, 1, 0, 0]
+# 段ごとの指の負担 [小指, 薬指, 中指, 人差し指]
+ROW_EFFORT = [
+    [4.0, 3.5, 3.0, 3.0],
+    [2.5, 2.0, 1.5, 1.6],
+    [1.5, 1.2, 1.0, 1.0],
+    [2.8, 2.5, 2.0, 1.8],
+]
+KEY_COSTS = {
+    "stretch": 0.5,          # 人差し指を内側に伸ばす列（列 4, 5）
+    "outer": 0.8,            # 小指の外側の列（列 10）
+    "same_key": 0.5,         # 同じキーの連打
+    "same_finger": 3.0,      # 同じ指で別のキーを続けて打つ
+    "row_jump": 1.0,         # 同じ手で 2 段以上の移動（段差 1 につき）
+    "alternation": -0.5,     # 左右交互
+    "inward_roll": -0.3,     # 同じ手で小指側から人差し指側へ
+    "redirect": 1.0,         # 同じ手の 3 打鍵で向きが変わる
+    "skip_same_finger": 1.0, # 1 打鍵おいて同じ指で別のキー
+    "double_alternation": -0.3,  # 左右左 / 右左右
+}
+# -------------
+
+
+def read_alphabet(kana_file=KANA_FILE):
+    """kana.txt の文字を出現順に重複なしで返す（空行と // 行は無視）"""
+    alphabet = []
+    seen = set()
+    with open(kana_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+            for ch in line:
+                if ch not in seen:
+                    seen.add(ch)
+                    alphabet.append(ch)
+    return alphabet
+
+
+def _source_files(source, pr_dir):
+    """{n: path} を返す。<source>{n}gram.json がなく n == 1 なら <source>.json（dvorakjp）を使う"""
+    files = {}
+    for n in (1, 2, 3):
+        path = os.path.join(pr_dir, f"{source}{n}gram.json")
+        if not os.path.exists(path) and n == 1:
+            path = os.path.join(pr_dir, f"{source}.json")
+        if os.path.exists(path):
+            files[n] = path
+    return files
+
+
+def _file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _build_matrix(path, n, index):
+    a = len(index)
+    mat = np.zeros((a,) * n, dtype=np.float64)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for gram, freq in data.items():
+        if len(gram) != n:
+            continue
+        try:
+            pos = tuple(index[ch] for ch in gram)
+        except KeyError:
+            continue
+        mat[pos] += freq
+    total = mat.sum()
+    if total > 0:
+        mat /= total
+    return mat
+
+
+def load_tables(source, pr_dir=PR_DIR, kana_file=KANA_FILE, cache_dir=CACHE_DIR, mmap_mode=None):
+    """source の F1, F2, F3 を返す（キャッシュが古ければ作り直す）。
+
+    戻りは {"source", "alphabet", "F": [F1, F2, F3]}。ない n の行列はゼロ。
+    """
+    alphabet = read_alphabet(kana_file)
+    index = {ch: i for i, ch in enumerate(alphabet)}
+    files = _source_files(source, pr_dir)
+    if not files:
+        raise FileNotFoundError(f"{pr_dir} に {source} の n-gram JSON がありません")
+    key = {
+        "alphabet": "".join(alphabet),
+        "files": {str(n): _file_hash(p) for n, p in files.items()},
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, f"{source}.meta.json")
+    paths = {n: os.path.join(cache_dir, f"{source}_{n}gram.npy") for n in (1, 2, 3)}
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    if meta != key or not all(os.path.exists(p) for p in paths.values()):
+        a = len(alphabet)
+        for n, path in paths.items():
+            if n in files:
+                mat = _build_matrix(files[n], n, index)
+            else:
+                mat = np.zeros((a,) * n, dtype=np.float64)
+            np.save(path, mat)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(key, f, ensure_ascii=False)
+    mats = [np.load(paths[n], mmap_mode=mmap_mode) for n in (1, 2, 3)]
+    return {"source": source, "alphabet": alphabet, "F": mats}
+
+
+def load_layout(path):
+    """配列 JSON を読む。{"name": ..., "keys": {仮名: 打鍵列}} か {仮名: 打鍵列} のどちらでもよい"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get("keys"), dict):
+        return data.get("name") or os.path.splitext(os.path.basename(path))[0], data["keys"]
+    return os.path.splitext(os.path.basename(path))[0], data
+
+
+class KeyModel:
+    """キーごとの手・指・段と、打鍵 1〜3-gram のコスト表 K1, K2, K3。
+
+    最後の番号（= len(keys)）は「打鍵なし」を表し、それを含む 2/3-gram のコストは 0。
+    """
+
+    def __init__(self, rows=KEY_ROWS, costs=KEY_COSTS):
+        keys, hand, finger, row, col = [], [], [], [], []
+        for r, chars in enumerate(rows):
+            for c, ch in enumerate(chars):
+                keys.append(ch)
+                hand.append(0 if c < 5 else 1)
+                finger.append(COLUMN_FINGER[c])
+                row.append(r)
+                col.append(c)
+        self.keys = keys
+        self.index = {ch: i for i, ch in enumerate(keys)}
+        self.none = len(keys)
+        hand, finger, row, col = (np.array(v) for v in (hand, finger, row, col))
+        # 手ごとに小指 → 人差し指の向きを正とする位置
+        pos = np.where(hand == 0, col, 10 - col)
+        k = len(keys)
+
+        k1 = np.array([ROW_EFFORT[r][f] for r, f in zip(row, finger)], dtype=np.float64)
+        k1 += np.where((col == 4) | (col == 5), costs["stretch"], 0.0)
+        k1 += np.where(col == 10, costs["outer"], 0.0)
+
+        h1, h2 = hand[:, None], hand[None, :]
+        same_hand = h1 == h2
+        same_key = np.eye(k, dtype=bool)
+        same_finger = same_hand & (finger[:, None] == finger[None, :]) & ~same_key
+        jump = np.abs(row[:, None] - row[None, :])
+        k2 = np.zeros((k, k))
+        k2 += np.where(same_key, costs["same_key"], 0.0)
+        k2 += np.where(same_finger, costs["same_finger"], 0.0)
+        k2 += np.where(same_hand & (jump >= 2), costs["row_jump"] * jump, 0.0)
+        k2 += np.where(~same_hand, costs["alternation"], 0.0)
+        inward = same_hand & (finger[:, None] < finger[None, :])
+        k2 += np.where(inward, costs["inward_roll"], 0.0)
+
+        a, b, c = np.ix_(range(k), range(k), range(k))
+        all_same = (hand[a] == hand[b]) & (hand[b] == hand[c])
+        d1 = np.sign(pos[b] - pos[a])
+        d2 = np.sign(pos[c] - pos[b])
+        k3 = np.zeros((k, k, k))
+        k3 += np.where(all_same & (d1 * d2 < 0), costs["redirect"], 0.0)
+        skip = (hand[a] == hand[c]) & (finger[a] == finger[c]) & (a != c)
+        k3 += np.where(skip, costs["skip_same_finger"], 0.0)
+        alt = (hand[a] != hand[b]) & (hand[b] != hand[c])
+        k3 += np.where(alt, costs["double_alternation"], 0.0)
+
+        # 「打鍵なし」の分を 0 で足しておく
+        self.K1 = np.append(k1, 0.0)
+        self.K2 = np.pad(k2, ((0, 1), (0, 1)))
+        self.K3 = np.pad(k3, ((0, 1), (0, 1), (0, 1)))
+
+    def encode(self, strokes):
+        try:
+            return [self.index[ch] for ch in strokes]
+        except KeyError as e:
+            raise ValueError(f"キー表にない打鍵です: {e.args[0]!r} ({strokes!r})") from None
+
+
+class SlotTable:
+    """打鍵列（スロット）ごとのコスト。S1[s], S2[s,t] と、3-gram 用のキー番号を持つ"""
+
+    def __init__(self, strokes, model: KeyModel, unmapped_cost=UNMAPPED_COST):
+        self.strokes = list(strokes)
+        nk = model.none
+        seqs = [model.encode(s) for s in self.strokes]
+        m = len(seqs)
+        s1 = np.empty(m)
+        first = np.full(m, nk)
+        second = np.full(m, nk)
+        last = np.full(m, nk)
+        penult = np.full(m, nk)
+        single = np.full(m, nk)
+        for i, q in enumerate(seqs):
+            if not q:
+                s1[i] = unmapped_cost
+                continue
+            q = np.array(q)
+            s1[i] = (model.K1[q].sum() + model.K2[q[:-1], q[1:]].sum()
+                     + model.K3[q[:-2], q[1:-1], q[2:]].sum())
+            first[i], last[i] = q[0], q[-1]
+            if len(q) >= 2:
+                second[i], penult[i] = q[1], q[-2]
+            else:
+                single[i] = q[0]
+        k2, k3 = model.K2, model.K3
+        s2 = (k2[last[:, None], first[None, :]]
+              + k3[penult[:, None], last[:, None], first[None, :]]
+              + k3[last[:, None], first[None, :], second[None, :]])
+        self.S1 = s1
+        self.S2 = s2
+        self.K3 = k3
+        self.first = first
+        self.last = last
+        self.single = single
+        # 採点用: 平らにした S2, K3 と、K3 の平らな添字を足し算で作るための係数つきキー番号
+        self.S2_flat = s2.ravel()
+        self.K3_flat = k3.ravel()
+        kk = k3.shape[0]
+        self.k3_last = last * kk * kk
+        self.k3_single = single * kk
+        self.k3_first = first
+
+
+class LayoutScorer:
+    """F1/F2/F3 と KeyModel から配列をまとめて採点する"""
+
+    def __init__(self, tables, model=None, weights=WEIGHTS, unmapped_cost=UNMAPPED_COST):
+        self.alphabet = tables["alphabet"]
+        self.index = {ch: i for i, ch in enumerate(self.alphabet)}
+        self.model = model or KeyModel()
+        self.weights = weights
+        self.unmapped_cost = unmapped_cost
+        f1, f2, f3 = (np.asarray(f) for f in tables["F"])
+        self.w1 = np.asarray(f1, dtype=np.float64)
+        # 2/3-gram は非零要素だけの疎な形で持つ
+        self.i2 = np.nonzero(f2)
+        self.w2 = f2[self.i2]
+        self.i3 = np.nonzero(f3)
+        self.w3 = f3[self.i3]
+
+    def prepare(self, layouts):
+        """[(name, {仮名: 打鍵列})] または [{仮名: 打鍵列}] から (assign[P, A], SlotTable) を作る"""
+        slot_id = {"": 0}
+        assign = np.zeros((len(layouts), len(self.alphabet)), dtype=np.int32)
+        for p, layout in enumerate(layouts):
+            keys = layout[1] if isinstance(layout, tuple) else layout
+            for kana, strokes in keys.items():
+                a = self.index.get(kana)
+                if a is None:
+                    continue
+                assign[p, a] = slot_id.setdefault(strokes, len(slot_id))
+        slots = SlotTable(slot_id, self.model, self.unmapped_cost)
+        return assign, slots
+
+    def score(self, assign, slots: SlotTable, chunk=CHUNK, parts=False):
+        """assign[P, A] の各配列のコストを返す。parts=True なら [P, 3]（1/2/3-gram 別、重み適用後）"""
+        assign = np.atleast_2d(assign)
+        out = np.empty((assign.shape[0], 3))
+        a2, b2 = self.i2
+        a3, b3, c3 = self.i3
+        w1, w2, w3 = self.weights
+        m = len(slots.strokes)
+        for lo in range(0, assign.shape[0], chunk):
+            # [A, chunk] にして gram ごとの行を連続に取り出す
+            x = np.ascontiguousarray(assign[lo:lo + chunk].T)
+            out[lo:lo + chunk, 0] = w1 * (self.w1 @ slots.S1[x])
+            idx = x[a2] * m
+            idx += x[b2]
+            out[lo:lo + chunk, 1] = w2 * (self.w2 @ slots.S2_flat.take(idx))
+            idx = slots.k3_last[x][a3]
+            idx += slots.k3_single[x][b3]
+            idx += slots.k3_first[x][c3]
+            out[lo:lo + chunk, 2] = w3 * (self.w3 @ slots.K3_flat.take(idx))
+        return out if parts else out.sum(axis=1)
+
+
+def random_permutations(assign, n, rng):
+    """1 つの配列の仮名 → スロットの割り当てを n 通りランダムに入れ替えたものを返す"""
+    base = np.asarray(assign).reshape(-1)
+    order = rng.random((n, base.size)).argsort(axis=1)
+    return base[order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pr/ の n-gram 頻度でキー配列のコストを計算する")
+    parser.add_argument("layouts", nargs="+", help="配列 JSON（{仮名: 打鍵列}）")
+    parser.add_argument("--source", default="wikikana", help="pr/ の頻度データ名（wikikana, tsukimiso, ...）")
+    parser.add_argument("--weights", type=float, nargs=3, default=WEIGHTS, metavar=("W1", "W2", "W3"))
+    parser.add_argument("--bench", type=int, default=0, help="最初の配列をランダムに並べ替えた N 通りを採点して速度を測る")
+    args = parser.parse_args()
+
+    try:
+        tables = load_tables(args.source)
+        layouts = [load_layout(p) for p in args.layouts]
+        scorer = LayoutScorer(tables, weights=tuple(args.weights))
+        assign, slots = scorer.prepare(layouts)
+    except (OSError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    parts = scorer.score(assign, slots, parts=True)
+    for (name, keys), row in zip(layouts, parts):
+        missing = sum(1 for ch in scorer.alphabet if ch not in keys)
+        print(f"{name}\t{row.sum():.4f}\t(1gram {row[0]:.4f}, 2gram {row[1]:.4f}, 3gram {row[2]:.4f}, 未割り当て {missing})")
+
+    if args.bench > 0:
+        rng = np.random.default_rng(0)
+        batch = random_permutations(assign[0], args.bench, rng)
+        t0 = time.perf_counter()
+        scores = scorer.score(batch, slots)
+        dt = time.perf_counter() - t0
+        print(f"bench: {args.bench} 配列を {dt:.2f} 秒で採点 ({args.bench / dt:.0f} 配列/秒), 最小 {scores.min():.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,21 @@
 - 各 candidate file (四桁インデックス) が選ばれる確率はデフォルト 5%（GLOBAL_PROB）。
   各エントリごとに `prob` を指定するとそれが優先されます。
 - リトライ (default 3)、ストリーミングダウンロード、.part 一時ファイル→成功時にリネーム。
+- .part が残っていれば Range リクエストで続きから再開。Content-Range の開始位置や全体の
+  サイズが .part と合わなければ .part を捨てて最初から取り直す。
 - 404 等は無視して次へ。
 - ダウンロード先ディレクトリは各エントリごとに指定可能。
+- MAX_WORKERS 本のスレッドで並列にダウンロードし、接続はホストごとにプールして使い回す。
+  固定スリープの代わりに、全体のリクエストレート（MAX_REQUESTS_PER_SEC）と
+  帯域（MAX_BYTES_PER_SEC）を共有のトークンバケットで制限する。
 """
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import random
+import re
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import os
 
@@ -31,8 +40,12 @@ RANDOM_SEED = None  # 例: 42
 RETRIES = 3
 # ストリーミングチャンクサイズ
 CHUNK_SIZE = 64 * 1024
-# ダウンロード間の最小スリープ（軽い rate-limit 緩和）
-SLEEP_BETWEEN = 1
+# 同時ダウンロード数（ホストごとの接続プールの大きさも同じにする）
+MAX_WORKERS = 8
+# 全体のリクエストレート上限（リクエスト/秒、None なら無制限）
+MAX_REQUESTS_PER_SEC = 4.0
+# 全体の帯域上限（バイト/秒、None なら無制限）。例: 50 * 1024 * 1024
+MAX_BYTES_PER_SEC = None
 
 # 各対象ディレクトリの定義リスト（必要に応じて追加・編集してください）
 # remote_dir: BASE_RAW_URL の下に続くパス
@@ -157,6 +170,31 @@ TARGETS = [
 ]
 # -------------------------------------------------------------------
 
+class RateLimiter:
+    """スレッド間で共有するトークンバケット。rate=None なら何もしない"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else (rate or 0)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                # バケットより大きい要求は借り越しで通す（次の要求が待つ）
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                wait = (min(amount, self.capacity) - self.tokens) / self.rate
+            time.sleep(wait)
+
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
@@ -164,20 +202,70 @@ def build_url(remote_dir: str, filename: str) -> str:
     # BASE_RAW_URL + "/" + remote_dir + "/" + filename
     return f"{BASE_RAW_URL.rstrip('/')}/{remote_dir.strip('/')}/{filename}"
 
-def download_to(url: str, dst_path: Path, retries: int = RETRIES) -> bool:
+def make_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def parse_content_range(value):
+    """Content-Range（"bytes 100-199/1000" や "bytes */1000"）から (開始位置, 全体のサイズ) を返す。
+    分からない部分は None"""
+    m = re.match(r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)", value or "")
+    if not m:
+        return None, None
+    start = int(m.group(1)) if m.group(1) is not None else None
+    total = int(m.group(2)) if m.group(2) != "*" else None
+    return start, total
+
+def download_to(url: str, dst_path: Path, session: requests.Session,
+                req_limiter: RateLimiter, bw_limiter: RateLimiter, retries: int = RETRIES) -> bool:
     tmp = dst_path.with_suffix(dst_path.suffix + ".part")
     for attempt in range(1, retries + 1):
         try:
-            with requests.get(url, stream=True, timeout=30) as r:
-                if r.status_code == 200:
+            headers = {}
+            existing = tmp.stat().st_size if tmp.exists() else 0
+            if existing:
+                headers["Range"] = f"bytes={existing}-"
+            req_limiter.acquire()
+            with session.get(url, stream=True, timeout=30, headers=headers) as r:
+                if r.status_code in (200, 206):
+                    start, total = parse_content_range(r.headers.get("Content-Range"))
+                    if r.status_code == 206 and start != existing:
+                        # 頼んだ位置からの続きではない -> .part を捨てて最初から取り直す
+                        print(f"[WARN] {url} resumed at {start}, expected {existing}; restarting")
+                        tmp.unlink()
+                        continue
+                    if r.status_code == 200:
+                        cl = r.headers.get("Content-Length")
+                        # Content-Encoding 付きなら展開後の大きさと比べられない
+                        total = int(cl) if cl is not None and not r.headers.get("Content-Encoding") else None
                     ensure_dir(dst_path.parent)
-                    with open(tmp, "wb") as wf:
+                    # 206 なら続きを追記、200 ならサーバが Range を無視したので最初から
+                    mode = "ab" if r.status_code == 206 else "wb"
+                    with open(tmp, mode) as wf:
                         for chunk in r.iter_content(CHUNK_SIZE):
                             if chunk:
+                                bw_limiter.acquire(len(chunk))
                                 wf.write(chunk)
-                    # rename to final
-                    tmp.replace(dst_path)
-                    return True
+                    size = tmp.stat().st_size
+                    if total is not None and size != total:
+                        # 途中で切れた（.part は続きから再開する）
+                        print(f"[WARN] {url} size mismatch {size}/{total} (attempt {attempt}/{retries})")
+                    else:
+                        # rename to final
+                        tmp.replace(dst_path)
+                        return True
+                elif r.status_code == 416 and existing:
+                    # .part が既に全体を持っているときだけ完了とみなす
+                    _, total = parse_content_range(r.headers.get("Content-Range"))
+                    if total is None or total == tmp.stat().st_size:
+                        tmp.replace(dst_path)
+                        return True
+                    # サイズが合わない -> 最初から取り直す
+                    print(f"[WARN] {url} returned 416 (remote size {total}, local {existing}); restarting")
+                    tmp.unlink()
                 elif r.status_code == 404:
                     # 存在しないファイル
                     return False
@@ -188,67 +276,77 @@ def download_to(url: str, dst_path: Path, retries: int = RETRIES) -> bool:
             print(f"[WARN] download error {url} attempt {attempt}/{retries}: {e}")
         # wait a bit before retrying
         time.sleep(1 + attempt * 0.5)
-    # cleanup tmp if exists
-    try:
-        if tmp.exists():
-            tmp.unlink()
-    except Exception:
-        pass
+    # .part は次回の再開用に残す
     return False
 
+def select_jobs(cfg):
+    """設定エントリから選ばれたファイルの (idx, url, dst_path) を返す"""
+    remote_dir = cfg["remote_dir"]
+    dst_dir = Path(cfg["dst_dir"])
+    idx_min = int(cfg.get("index_min", 0))
+    idx_max = int(cfg.get("index_max", 9999))
+    pattern = cfg.get("pattern", "{idx:04d}.jsonl.gz")
+    prob = float(cfg.get("prob", GLOBAL_PROB))
+    jobs = []
+    for idx in range(idx_min, idx_max + 1):
+        if random.random() > prob:
+            continue  # not selected
+        fname = pattern.format(idx=idx)
+        jobs.append((idx, build_url(remote_dir, fname), dst_dir / fname))
+    return jobs
+
 def main():
     if RANDOM_SEED is not None:
         random.seed(RANDOM_SEED)
 
     total_selected = 0
     total_downloaded = 0
+    stats = {}
+    pending = []
 
+    # 選択は従来どおり順番に乱数を引く（RANDOM_SEED による再現性を保つ）
     for cfg in TARGETS:
         name = cfg.get("name", cfg.get("remote_dir"))
-        remote_dir = cfg["remote_dir"]
-        dst_dir = Path(cfg["dst_dir"])
-        idx_min = int(cfg.get("index_min", 0))
-        idx_max = int(cfg.get("index_max", 9999))
-        pattern = cfg.get("pattern", "{idx:04d}.jsonl.gz")
         prob = float(cfg.get("prob", GLOBAL_PROB))
-
-        print(f"[INFO] target={name} remote_dir={remote_dir} dst_dir={dst_dir} idx_range={idx_min}-{idx_max} prob={prob}")
-
-        ensure_dir(dst_dir)
-        selected_in_this = 0
-        downloaded_in_this = 0
-
-        # iterate indices
-        for idx in range(idx_min, idx_max + 1):
-            if random.random() > prob:
-                continue  # not selected
-            total_selected += 1
-            selected_in_this += 1
-
-            fname = pattern.format(idx=idx)
-            url = build_url(remote_dir, fname)
-            dst_path = dst_dir / fname
-
+        print(f"[INFO] target={name} remote_dir={cfg['remote_dir']} dst_dir={cfg['dst_dir']} "
+              f"idx_range={cfg.get('index_min', 0)}-{cfg.get('index_max', 9999)} prob={prob}")
+        ensure_dir(Path(cfg["dst_dir"]))
+        jobs = select_jobs(cfg)
+        stats[name] = {"selected": len(jobs), "downloaded": 0}
+        total_selected += len(jobs)
+        for idx, url, dst_path in jobs:
             # skip if already downloaded
             if dst_path.exists():
                 print(f"[SKIP] already exists: {dst_path}")
                 continue
+            pending.append((name, url, dst_path))
 
-            # try download
-            ok = download_to(url, dst_path)
+    print(f"[INFO] selected={total_selected} to_download={len(pending)} workers={MAX_WORKERS}")
+    session = make_session(MAX_WORKERS)
+    req_limiter = RateLimiter(MAX_REQUESTS_PER_SEC, burst=max(1.0, MAX_REQUESTS_PER_SEC or 0))
+    bw_limiter = RateLimiter(MAX_BYTES_PER_SEC)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = {ex.submit(download_to, url, dst_path, session, req_limiter, bw_limiter): (name, url, dst_path)
+                   for name, url, dst_path in pending}
+        for fut in as_completed(futures):
+            name, url, dst_path = futures[fut]
+            try:
+                ok = fut.result()
+            except Exception as e:
+                print(f"[WARN] unexpected error {url}: {e}")
+                ok = False
             if ok:
                 print(f"[OK] downloaded: {dst_path}")
                 total_downloaded += 1
-                downloaded_in_this += 1
+                stats[name]["downloaded"] += 1
             else:
                 # not found or failed
                 # for 404 we silently skip; for repeated failures we already logged warnings
                 print(f"[MISS] not available or failed: {url}")
-            # small sleep to avoid hammering server
-            time.sleep(SLEEP_BETWEEN)
 
-        print(f"[INFO] finished target={name} selected={selected_in_this} downloaded={downloaded_in_this}")
+    for name, st in stats.items():
+        print(f"[INFO] finished target={name} selected={st['selected']} downloaded={st['downloaded']}")
     print(f"[SUMMARY] total_selected={total_selected} total_downloaded={total_downloaded}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
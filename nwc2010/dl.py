@@ -4,60 +4,135 @@
 シンプルなダウンローダー:
   python dl.py filelist100morpheme
 wget -x -nH -i filelist と同様にホスト名を除いたパス構造を再現して保存します。
+
+- 複数のワーカー（--jobs）で並列にダウンロードし、keep-alive のセッションを共有します。
+- 完了したファイルのサイズと ETag を出力ルートの .dl_manifest.json に記録し、
+  再実行時はマニフェストとローカルのサイズだけで完了判定する（HEAD を送らない）。
+- 途中のファイル（.part）は Range リクエストで続きから再開します。
 """
 import argparse
+import json
 import os
+import re
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
+
+MANIFEST_NAME = ".dl_manifest.json"
+DEFAULT_JOBS = 8
 
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
-def download_url(url, dest_path, session, retries=3, chunk_size=1024*64):
+def load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"マニフェストを読めないので作り直します: {path} -> {e}", file=sys.stderr)
+        return {}
+
+def save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def _parse_content_range(value):
+    """Content-Range（"bytes 100-199/1000" や "bytes */1000"）から (開始位置, 全体のサイズ)。分からない部分は None"""
+    m = re.match(r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)", value or "")
+    if not m:
+        return None, None
+    start = int(m.group(1)) if m.group(1) is not None else None
+    total = int(m.group(2)) if m.group(2) != "*" else None
+    return start, total
+
+def download_url(url, dest_path, session, entry=None, retries=3, chunk_size=1024*64):
+    """url を dest_path に保存し、マニフェスト用の {"url", "size", "etag"} を返す（失敗時は None）。
+
+    entry はこのファイルの既存マニフェストエントリ（.part の ETag 照合に使う）。
+    マニフェストにない既存ファイルは .part と同じく Range で続きを確認するが、.part への
+    移動はサーバが続き（206）を返してからにする。失敗しても既存ファイルはそのまま残る。
+    """
     tmp_path = dest_path + ".part"
+    etag = (entry or {}).get("etag")
+    fresh = False   # True なら Range を付けずに最初から取り直す
     for attempt in range(1, retries+1):
         try:
-            # HEAD でサイズを取る（存在チェック用）
-            head = session.head(url, allow_redirects=True, timeout=10)
-            if head.status_code >= 400:
-                # fallback to GET if HEAD not allowed
-                resp = session.get(url, stream=True, timeout=30)
-            else:
-                # If file exists and sizes match, skip
-                remote_len = head.headers.get("Content-Length")
-                if os.path.exists(dest_path) and remote_len is not None:
-                    if os.path.getsize(dest_path) == int(remote_len):
+            # 続きを確認するファイル: .part があればそれ、なければマニフェストにない既存ファイル
+            part = tmp_path if os.path.exists(tmp_path) else dest_path if os.path.exists(dest_path) else None
+            if fresh:
+                part = None
+            existing = os.path.getsize(part) if part else 0
+            headers = {}
+            if existing:
+                headers["Range"] = f"bytes={existing}-"
+                if etag:
+                    # ETag が変わっていれば 200 で全体が返る
+                    headers["If-Range"] = etag
+            with session.get(url, stream=True, timeout=30, headers=headers) as resp:
+                etag = resp.headers.get("ETag") or etag
+                if resp.status_code == 416 and existing:
+                    _, total = _parse_content_range(resp.headers.get("Content-Range"))
+                    if total is None or total == existing:
+                        os.replace(part, dest_path)
                         print(f"既存のためスキップ: {dest_path}")
-                        return True
-                resp = session.get(url, stream=True, timeout=30)
-            if resp.status_code >= 400:
-                raise RuntimeError(f"HTTP {resp.status_code}")
-            ensure_dir(os.path.dirname(dest_path))
-            with open(tmp_path, "wb") as fh:
-                for chunk in resp.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        fh.write(chunk)
+                        return {"url": url, "size": existing, "etag": etag}
+                    # サイズが合わない -> 最初から取り直す（既存ファイルは取り直せるまで残す）
+                    fresh = True
+                    raise RuntimeError(f"HTTP 416 (remote size {total})")
+                if resp.status_code >= 400:
+                    raise RuntimeError(f"HTTP {resp.status_code}")
+                if resp.status_code == 206:
+                    start, total = _parse_content_range(resp.headers.get("Content-Range"))
+                    if start != existing:
+                        # 頼んだ位置からの続きではない -> 最初から取り直す
+                        fresh = True
+                        raise RuntimeError(f"HTTP 206 の開始位置が合わない: {start} / {existing}")
+                    if part != tmp_path:
+                        os.replace(part, tmp_path)
+                    mode = "ab"
+                else:
+                    mode = "wb"
+                    cl = resp.headers.get("Content-Length")
+                    total = int(cl) if cl is not None else None
+                ensure_dir(os.path.dirname(dest_path))
+                with open(tmp_path, mode) as fh:
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            fh.write(chunk)
+            size = os.path.getsize(tmp_path)
+            if total is not None and size != total:
+                raise RuntimeError(f"サイズ不一致: {size} / {total}")
             os.replace(tmp_path, dest_path)
             print(f"ダウンロード完了: {dest_path}")
-            return True
+            return {"url": url, "size": size, "etag": etag}
         except Exception as e:
             print(f"[{attempt}/{retries}] エラー: {url} -> {e}", file=sys.stderr)
             time.sleep(1 + attempt)
-    # 最終的に失敗
-    if os.path.exists(tmp_path):
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-    return False
+    # 最終的に失敗（.part は次回の再開用に残す）
+    return None
 
-def process_filelist(filelist_path, out_root):
+def make_session(pool_size):
     session = requests.Session()
     session.headers.update({"User-Agent": "python-dl/1.0"})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def process_filelist(filelist_path, out_root, jobs=DEFAULT_JOBS):
+    manifest_path = os.path.join(out_root, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
     success = 0
     fail = 0
+    skipped = 0
+    todo = []
     with open(filelist_path, "r", encoding="utf-8") as f:
         for line in f:
             url = line.strip()
@@ -71,23 +146,45 @@ def process_filelist(filelist_path, out_root):
             # wget -nH の挙動: ホスト名ディレクトリを作らず、パス部分をそのまま再現
             rel_path = p.path.lstrip("/")  # leading slash を削る
             dest_path = os.path.join(out_root, rel_path)
-            ok = download_url(url, dest_path, session)
-            if ok:
+            entry = manifest.get(rel_path)
+            if entry and entry.get("url") == url and os.path.exists(dest_path) \
+                    and os.path.getsize(dest_path) == entry.get("size"):
+                skipped += 1
+                continue
+            todo.append((url, rel_path, dest_path, entry))
+
+    if todo:
+        session = make_session(jobs)
+        with ThreadPoolExecutor(max_workers=jobs) as ex:
+            futures = {ex.submit(download_url, url, dest_path, session, entry): rel_path
+                       for url, rel_path, dest_path, entry in todo}
+            for fut in as_completed(futures):
+                rel_path = futures[fut]
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    print(f"エラー: {rel_path} -> {e}", file=sys.stderr)
+                    result = None
+                if result is None:
+                    fail += 1
+                    continue
                 success += 1
-            else:
-                fail += 1
-    print(f"完了: 成功={success} 失敗={fail}")
+                # マニフェストはこのスレッド（as_completed のループ）でだけ書くのでロックは要らない
+                manifest[rel_path] = result
+                save_manifest(manifest_path, manifest)
+    print(f"完了: 成功={success} スキップ={skipped} 失敗={fail}")
 
 def main():
     parser = argparse.ArgumentParser(description="filelist から wget -x -nH 相当でダウンロードする")
     parser.add_argument("filelist", nargs="?", default="filelist100word",
                         help="URLリストファイル（デフォルト: filelist100word）")
     parser.add_argument("-o", "--out", default=".", help="出力ルートディレクトリ（デフォルト: カレント）")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS, help=f"並列ダウンロード数（デフォルト: {DEFAULT_JOBS}）")
     args = parser.parse_args()
     if not os.path.exists(args.filelist):
         print(f"filelist が見つかりません: {args.filelist}", file=sys.stderr)
         sys.exit(1)
-    process_filelist(args.filelist, args.out)
+    process_filelist(args.filelist, args.out, max(1, args.jobs))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,308 @@
+"""
+nwc2010/{word,char}/over*/ 以下に展開済みの n-gram を、(単位, n) ごとに
+1 本の gram 順ストアへ統合するスクリプト。
+
+over9 / over99 / over999 は同じ n-gram を閾値違いで持っているだけで、
+上位の閾値は下位の部分集合になっている。そこで最も低い閾値のデータだけを
+gram 順に並べて保存し、over99 や over999 のビューは問い合わせ時に
+頻度でフィルタして作る。
+
+出力:
+  nwc2010/store/word/3gms/3gm-0000.txt, 3gm-0001.txt, ...  (gram\tcount, gram 昇順)
+  nwc2010/store/word/3gms/index.tsv                        (疎インデックス: gram\tfile\toffset)
+  nwc2010/store/word/meta.json                             (統合した閾値の一覧)
+
+例:
+  python tier.py build
+  python tier.py build --remove-sources
+  python tier.py query --unit word --n 3 --over 99 "龍 棲み 老"
+  python tier.py scan --unit char --n 7 --over 999 "鉄 道"
+"""
+from pathlib import Path
+import argparse
+import bisect
+import heapq
+import json
+import re
+import sys
+
+# --- 設定 ---
+ROOT = Path(__file__).resolve().parent
+UNITS = ["word", "char"]
+STORE_DIR = ROOT / "store"
+SIZE_MB = 50              # ストアの分割サイズ（MB）
+INDEX_EVERY = 1024        # 疎インデックスに何行ごとに 1 エントリを書くか
+# -------------
+
+_THRESHOLD_RE = re.compile(r"^over(\d+)$")
+_NGRAM_DIR_RE = re.compile(r"^(\d+)gms$")
+
+
+def find_thresholds(unit_dir: Path):
+    """unit_dir 以下の over* ディレクトリを {閾値: Path} で返す（閾値は "overN" の N）"""
+    found = {}
+    if not unit_dir.is_dir():
+        return found
+    for p in unit_dir.iterdir():
+        m = _THRESHOLD_RE.match(p.name)
+        if m and p.is_dir():
+            found[int(m.group(1))] = p
+    return dict(sorted(found.items()))
+
+
+def find_ngram_orders(threshold_dirs):
+    orders = set()
+    for d in threshold_dirs.values():
+        for p in d.iterdir():
+            m = _NGRAM_DIR_RE.match(p.name)
+            if m and p.is_dir():
+                orders.add(int(m.group(1)))
+    return sorted(orders)
+
+
+def iter_tsv(path: Path):
+    with path.open("r", encoding="utf-8", errors="replace") as rf:
+        for ln in rf:
+            ln = ln.rstrip("\n")
+            if not ln:
+                continue
+            try:
+                g, c = ln.rsplit("\t", 1)
+                yield g, int(c)
+            except ValueError:
+                continue
+
+
+def sorted_run(path: Path, tmp_dir: Path):
+    """path が gram 順に並んでいればそのまま返し、そうでなければソートした一時ファイルを返す"""
+    prev = None
+    is_sorted = True
+    for g, _ in iter_tsv(path):
+        if prev is not None and g < prev:
+            is_sorted = False
+            break
+        prev = g
+    if is_sorted:
+        return path, False
+    rows = sorted(iter_tsv(path))
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / f"{path.parent.parent.name}_{path.stem}.tsv"
+    with tmp.open("w", encoding="utf-8") as wf:
+        for g, c in rows:
+            wf.write(f"{g}\t{c}\n")
+    return tmp, True
+
+
+def merge_runs(run_paths):
+    """gram 順の run 群をマージし、同じ gram は 1 件にまとめて yield する（頻度は最大値を採用）"""
+    merged = heapq.merge(*(iter_tsv(p) for p in run_paths), key=lambda x: x[0])
+    cur_g = None
+    cur_c = 0
+    for g, c in merged:
+        if g == cur_g:
+            if c > cur_c:
+                cur_c = c
+            continue
+        if cur_g is not None:
+            yield cur_g, cur_c
+        cur_g, cur_c = g, c
+    if cur_g is not None:
+        yield cur_g, cur_c
+
+
+def write_store(rows, out_dir: Path, n: int, size_mb: int, index_every: int):
+    """rows (gram 順) を分割して書き出し、疎インデックスを作る。戻りは (行数, 生成ファイル)"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    target = size_mb * 1024 * 1024
+    idx = 0
+    f = None
+    bytes_written = 0
+    lines_in_file = 0
+    total = 0
+    created = []
+    with (out_dir / "index.tsv").open("w", encoding="utf-8") as xf:
+        for g, c in rows:
+            line = f"{g}\t{c}\n".encode("utf-8")
+            if f is None or (bytes_written + len(line) > target and bytes_written > 0):
+                if f is not None:
+                    f.close()
+                    idx += 1
+                path = out_dir / f"{n}gm-{idx:04d}.txt"
+                f = path.open("wb")
+                created.append(path)
+                bytes_written = 0
+                lines_in_file = 0
+            if lines_in_file % index_every == 0:
+                xf.write(f"{g}\t{path.name}\t{bytes_written}\n")
+            f.write(line)
+            bytes_written += len(line)
+            lines_in_file += 1
+            total += 1
+    if f is not None:
+        f.close()
+    return total, created
+
+
+def build_unit(unit: str, store_dir: Path, size_mb: int, index_every: int, remove_sources: bool):
+    thresholds = find_thresholds(ROOT / unit)
+    if not thresholds:
+        print(f"スキップ: {unit} に over* ディレクトリがありません")
+        return
+    print(f"{unit}: 閾値 {', '.join(f'over{t}' for t in thresholds)} を統合します")
+    unit_store = store_dir / unit
+    tmp_dir = unit_store / "tmp"
+    for n in find_ngram_orders(thresholds):
+        sources = []
+        for d in thresholds.values():
+            sources.extend(sorted((d / f"{n}gms").glob(f"{n}gm-*.txt")))
+        if not sources:
+            continue
+        runs = []
+        temps = []
+        for src in sources:
+            run, is_tmp = sorted_run(src, tmp_dir)
+            runs.append(run)
+            if is_tmp:
+                temps.append(run)
+        out_dir = unit_store / f"{n}gms"
+        for old in out_dir.glob(f"{n}gm-*.txt"):
+            old.unlink()
+        total, created = write_store(merge_runs(runs), out_dir, n, size_mb, index_every)
+        print(f"  {n}-gram: 入力 {len(sources)} ファイル -> {len(created)} ファイル ({total} 件)")
+        for p in temps:
+            try:
+                p.unlink()
+            except Exception:
+                pass
+        if remove_sources:
+            for src in sources:
+                try:
+                    src.unlink()
+                except Exception as e:
+                    print(f"警告: 削除できません {src}: {e}", file=sys.stderr)
+    try:
+        tmp_dir.rmdir()
+    except Exception:
+        pass
+    meta = {"unit": unit, "thresholds": list(thresholds), "base": min(thresholds)}
+    (unit_store / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+class TierStore:
+    """統合ストアの読み出し。over を指定すると count > over のものだけを返す"""
+
+    def __init__(self, unit: str, n: int, store_dir: Path = STORE_DIR):
+        self.unit_dir = store_dir / unit
+        self.dir = self.unit_dir / f"{n}gms"
+        meta_path = self.unit_dir / "meta.json"
+        if not meta_path.exists():
+            raise FileNotFoundError(f"ストアがありません（先に build してください）: {meta_path}")
+        self.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        self.keys = []
+        self.locs = []
+        index_path = self.dir / "index.tsv"
+        if index_path.exists():
+            with index_path.open("r", encoding="utf-8") as rf:
+                for ln in rf:
+                    g, fname, off = ln.rstrip("\n").split("\t")
+                    self.keys.append(g)
+                    self.locs.append((fname, int(off)))
+
+    def _check_over(self, over):
+        if over is not None and over < self.meta["base"]:
+            raise ValueError(f"over{over} はストアの最低閾値 over{self.meta['base']} より低いので表現できません")
+
+    def _scan_from(self, key: str):
+        """key 以上の最初のエントリから gram 順に (gram, count) を返す"""
+        i = bisect.bisect_right(self.keys, key) - 1
+        if i < 0:
+            i = 0
+        if not self.locs:
+            return
+        fname, off = self.locs[i]
+        files = sorted(self.dir.glob(f"{fname.split('-')[0]}-*.txt"))
+        start = [p.name for p in files].index(fname)
+        for j, p in enumerate(files[start:]):
+            with p.open("rb") as rf:
+                if j == 0:
+                    rf.seek(off)
+                for raw in rf:
+                    g, c = raw.decode("utf-8").rstrip("\n").rsplit("\t", 1)
+                    if g < key:
+                        continue
+                    yield g, int(c)
+
+    def get(self, gram: str, over=None):
+        self._check_over(over)
+        for g, c in self._scan_from(gram):
+            if g != gram:
+                return None
+            if over is not None and c <= over:
+                return None
+            return c
+        return None
+
+    def prefix(self, prefix: str, over=None):
+        self._check_over(over)
+        for g, c in self._scan_from(prefix):
+            if not g.startswith(prefix):
+                return
+            if over is None or c > over:
+                yield g, c
+
+    def __iter__(self):
+        return self.view(None)
+
+    def view(self, over=None):
+        """over 閾値のビューを gram 順に返す（over=None なら全件）"""
+        self._check_over(over)
+        for p in sorted(self.dir.glob("*gm-*.txt")):
+            for g, c in iter_tsv(p):
+                if over is None or c > over:
+                    yield g, c
+
+
+def main():
+    parser = argparse.ArgumentParser(description="nwc2010 の閾値違いツリーを 1 本の gram 順ストアに統合する")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("build", help="over* ツリーからストアを作る")
+    b.add_argument("--unit", choices=UNITS, action="append", help="対象単位（既定: word と char）")
+    b.add_argument("--store", default=str(STORE_DIR), help="ストアの出力先")
+    b.add_argument("--size-mb", type=int, default=SIZE_MB, help="分割サイズ（MB）")
+    b.add_argument("--index-every", type=int, default=INDEX_EVERY, help="疎インデックスの間隔（行）")
+    b.add_argument("--remove-sources", action="store_true", help="統合後に元の over* のテキストを削除する")
+
+    for name in ("query", "scan"):
+        q = sub.add_parser(name, help="完全一致で引く" if name == "query" else "前方一致で列挙する")
+        q.add_argument("--unit", choices=UNITS, required=True)
+        q.add_argument("--n", type=int, required=True)
+        q.add_argument("--over", type=int, default=None, help="overN ビュー（count > N のみ）")
+        q.add_argument("--store", default=str(STORE_DIR))
+        q.add_argument("gram")
+    args = parser.parse_args()
+
+    store_dir = Path(args.store)
+    if args.cmd == "build":
+        for unit in args.unit or UNITS:
+            build_unit(unit, store_dir, args.size_mb, args.index_every, args.remove_sources)
+        return
+
+    store = TierStore(args.unit, args.n, store_dir)
+    try:
+        if args.cmd == "query":
+            c = store.get(args.gram, args.over)
+            if c is None:
+                print("見つかりません", file=sys.stderr)
+                sys.exit(1)
+            print(f"{args.gram}\t{c}")
+        else:
+            for g, c in store.prefix(args.gram, args.over):
+                print(f"{g}\t{c}")
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
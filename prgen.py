@@ -1,13 +1,39 @@
+"""
+pr/ の n-gram 頻度表（<source><n>gram.json）を、ローマ字プレフィックスで引ける形にする。
+
+既定（OUTPUT_FORMAT = "bin"）ではカテゴリごとに pr_processed/<category>.prix を 1 つだけ書く。
+読み出しは prindex.PrefixIndex を使う（idx.get(prefix, n) が以前の
+<category>/<prefix>/<n>gm.json と同じ dict を返し、idx.top(prefix, n, k) で頻度順の上位 k 件）。
+プレフィックスごとの JSON ツリーが要る場合だけ OUTPUT_FORMAT を "json" か "both" にする
+（ファイル数が数万になる）。
+
+入力と設定のハッシュを .prgen_state.json に記録し、変わらないカテゴリは作り直さない。
+"""
 import os
 import json
 import re
 import glob
+import hashlib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from prindex import write_index
 
 # --- 設定 ---
 INPUT_DIR = r"d:\gramdata\pr"  # 入力JSONファイルがあるディレクトリ
 KANA_FILE = os.path.join(r"d:\gramdata", "kana.txt")
 OUTPUT_BASE_DIR = os.path.join(r"d:\gramdata", "pr_processed")
+# 出力形式: "bin"（カテゴリごとの <category>.prix。prindex.PrefixIndex で読む）,
+# "json"（プレフィックスごとの JSON ツリー。まだツリーを読む利用者向け）, "both"
+OUTPUT_FORMAT = "bin"
+# 入力ファイルの内容ハッシュを記録するファイル（変更のないカテゴリは再生成しない）
+STATE_FILE = os.path.join(OUTPUT_BASE_DIR, ".prgen_state.json")
+FORCE_REBUILD = False  # True なら状態ファイルを無視して全カテゴリを作り直す
+WORKERS = os.cpu_count() or 1  # カテゴリを並列に処理するプロセス数
+# 頻度順に並べた <n>gm.top.json も書く（json 出力時）。TOP_K 件で打ち切る（None なら全件）。
+# 同じものは .prix の PrefixIndex.top() / total() で引けるので、既定では書かない
+WRITE_RANKED = False
+TOP_K = 100
 
 # --- ローマ字変換マップ ---
 basic_roma_map = {
@@ -143,60 +169,208 @@ def process_json_file(file_path):
     
     return category, output_data
 
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for b in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(b)
+    return h.hexdigest()
+
+def config_hash():
+    """出力に影響する設定（プレフィックス用ローマ字マップと出力形式）のハッシュ"""
+    blob = json.dumps([sorted(roma_map_1char.items()), OUTPUT_FORMAT, WRITE_RANKED, TOP_K], ensure_ascii=False)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+def load_state():
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(state):
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, STATE_FILE)
+
+def rank_entries(text_data, top_k=TOP_K):
+    """{gram: freq} を頻度降順の配列にする。total は打ち切り前の合計"""
+    items = sorted(text_data.items(), key=lambda kv: (-kv[1], kv[0]))
+    total = sum(text_data.values())
+    if top_k is not None:
+        items = items[:top_k]
+    grams, freqs, cum = [], [], []
+    acc = 0
+    for gram, freq in items:
+        acc += freq
+        grams.append(gram)
+        freqs.append(freq)
+        cum.append(acc)
+    return {"total": total, "grams": grams, "freqs": freqs, "cum": cum}
+
+def build_category(category, json_files, prev_outputs):
+    """1 カテゴリ分の入力を処理して出力を書く（ワーカープロセスで実行）。
+
+    prev_outputs は前回書いた {相対パス: 内容ハッシュ}。内容が変わらない
+    ファイルは書き直さず、今回出なくなったファイルは削除する。
+    戻りは (category, 今回の出力ハッシュ, 書いた数, 削除した数)。
+    """
+    # カテゴリごとにデータを蓄積（重複する場合は後のファイルの値で上書き）
+    prefix_data = defaultdict(lambda: defaultdict(dict))
+    for json_file in json_files:
+        _, data = process_json_file(json_file)
+        if not data:
+            continue
+        for prefix, n_gram_data in data.items():
+            for n_gram_len, text_data in n_gram_data.items():
+                prefix_data[prefix][n_gram_len].update(text_data)
+
+    outputs = {}
+    written = 0
+
+    def emit(rel_path, payload):
+        nonlocal written
+        digest = hashlib.sha1(payload).hexdigest()
+        outputs[rel_path] = digest
+        out_path = os.path.join(OUTPUT_BASE_DIR, rel_path)
+        if prev_outputs.get(rel_path) == digest and os.path.exists(out_path):
+            return
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        try:
+            with open(out_path, 'wb') as f_out:
+                f_out.write(payload)
+            written += 1
+        except Exception as e:
+            print(f"  Error writing to {out_path}: {e}")
+
+    if OUTPUT_FORMAT in ("bin", "both"):
+        # 一時ファイルに書いてハッシュを比べ、変わったときだけ置き換える
+        rel_path = f"{category}.prix"
+        index_file = os.path.join(OUTPUT_BASE_DIR, rel_path)
+        tmp_file = index_file + '.tmp'
+        n_grams, n_prefixes = write_index(tmp_file, prefix_data)
+        digest = file_hash(tmp_file)
+        outputs[rel_path] = digest
+        if prev_outputs.get(rel_path) == digest and os.path.exists(index_file):
+            os.remove(tmp_file)
+        else:
+            os.replace(tmp_file, index_file)
+            written += 1
+            print(f"Created {index_file} ({n_grams} grams, {n_prefixes} prefixes)")
+    if OUTPUT_FORMAT in ("json", "both"):
+        print(f"Creating files for category: {category}")
+        # プレフィックスごと・N-gram長ごとの JSON
+        for prefix, n_gram_data in prefix_data.items():
+            for n_gram_len, text_data in n_gram_data.items():
+                rel_path = os.path.join(category, prefix, f"{n_gram_len}gm.json")
+                emit(rel_path, json.dumps(text_data, ensure_ascii=False, indent=2).encode('utf-8'))
+                if WRITE_RANKED:
+                    # 先頭から k 件取るだけで済むよう、頻度降順と累積頻度を事前に計算しておく
+                    rel_path = os.path.join(category, prefix, f"{n_gram_len}gm.top.json")
+                    ranked = rank_entries(text_data)
+                    emit(rel_path, json.dumps(ranked, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    removed = remove_outputs(p for p in prev_outputs if p not in outputs)
+    return category, outputs, written, removed
+
+def remove_outputs(rel_paths):
+    """OUTPUT_BASE_DIR からの相対パスのファイルを消し、空になったディレクトリも消す。戻りは消した数"""
+    removed = 0
+    for rel_path in rel_paths:
+        path = os.path.join(OUTPUT_BASE_DIR, rel_path)
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+        d = os.path.dirname(path)
+        while os.path.normpath(d) != os.path.normpath(OUTPUT_BASE_DIR):
+            try:
+                os.rmdir(d)
+            except OSError:
+                break
+            d = os.path.dirname(d)
+    return removed
+
+# prgen が書く出力ファイル（<category>.prix と <category>/<prefix>/<n>gm.json, <n>gm.top.json）
+_OUTPUT_RE = re.compile(r'[^/\\]+\.prix|[^/\\]+[/\\][^/\\]+[/\\]\d+gm(\.top)?\.json')
+
+def sweep_untracked(tracked):
+    """状態ファイルに記録されていない prgen の出力を消す（以前の実行の取り残しを掃除する）"""
+    stale = []
+    for root, _, files in os.walk(OUTPUT_BASE_DIR):
+        for name in files:
+            rel_path = os.path.relpath(os.path.join(root, name), OUTPUT_BASE_DIR)
+            if _OUTPUT_RE.fullmatch(rel_path) and rel_path not in tracked:
+                stale.append(rel_path)
+    return remove_outputs(stale)
+
 def main():
     # 出力ベースディレクトリを作成
     os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
     
-    # カテゴリごとのデータを格納する辞書
-    category_data = {}
-    
-    # prディレクトリ内のすべてのJSONファイルを処理
-    json_files = glob.glob(os.path.join(INPUT_DIR, "*.json"))
+    # prディレクトリ内のすべてのJSONファイルをカテゴリごとにまとめる
+    json_files = sorted(glob.glob(os.path.join(INPUT_DIR, "*.json")))
     
     if not json_files:
         print(f"No JSON files found in {INPUT_DIR}")
         return
-    
+
+    files_by_category = defaultdict(list)
     for json_file in json_files:
-        category, data = process_json_file(json_file)
-        
-        if category and data:
-            if category not in category_data:
-                category_data[category] = defaultdict(lambda: defaultdict(dict))
-            
-            # カテゴリごとにデータを蓄積（重複する場合は後のファイルの値で上書き）
-            for prefix, n_gram_data in data.items():
-                for n_gram_len, text_data in n_gram_data.items():
-                    for text, freq in text_data.items():
-                        category_data[category][prefix][n_gram_len][text] = freq
-    
-    # カテゴリごとに出力処理
-    for category, prefix_data in category_data.items():
-        # カテゴリのディレクトリを作成
-        category_dir = os.path.join(OUTPUT_BASE_DIR, category)
-        os.makedirs(category_dir, exist_ok=True)
-        
-        print(f"Creating files for category: {category}")
-        
-        # プレフィックスごとのディレクトリとファイルを作成
-        for prefix, n_gram_data in prefix_data.items():
-            # プレフィックスディレクトリを作成
-            prefix_dir = os.path.join(category_dir, prefix)
-            os.makedirs(prefix_dir, exist_ok=True)
-            
-            # N-gram長ごとのJSONファイルを作成
-            for n_gram_len, text_data in n_gram_data.items():
-                # 出力ファイル名
-                output_file = os.path.join(prefix_dir, f"{n_gram_len}gm.json")
-                
-                try:
-                    with open(output_file, 'w', encoding='utf-8') as f_out:
-                        json.dump(text_data, f_out, ensure_ascii=False, indent=2)
-                    # print(f"  Created {output_file}")
-                except Exception as e:
-                    print(f"  Error writing to {output_file}: {e}")
-    
+        category, _ = get_file_category(json_file)
+        if category:
+            files_by_category[category].append(json_file)
+        else:
+            print(f"Skipping unknown format file: {json_file}")
+
+    # 前回書いたファイルの一覧は、設定が変わっても作り直すときでも必ず引き継ぐ（消すため）
+    state = load_state()
+    cfg = config_hash()
+    prev_outputs = state.get("outputs", {})
+    prev_inputs = {} if FORCE_REBUILD or state.get("config") != cfg else state.get("inputs", {})
+    new_state = {"config": cfg, "inputs": {}, "outputs": {}}
+
+    # 入力ハッシュが前回と同じカテゴリはスキップ
+    todo = {}
+    for category, files in files_by_category.items():
+        hashes = {os.path.basename(f): file_hash(f) for f in files}
+        if hashes == prev_inputs.get(category) and category in prev_outputs:
+            print(f"Unchanged: {category}")
+            new_state["inputs"][category] = hashes
+            new_state["outputs"][category] = prev_outputs[category]
+        else:
+            todo[category] = (files, hashes)
+
+    # 入力がなくなったカテゴリの出力を消す
+    for category in prev_outputs.keys() - files_by_category.keys():
+        removed = remove_outputs(prev_outputs[category])
+        print(f"Removed {category}: {removed} outputs (no inputs)")
+
+    with ProcessPoolExecutor(max_workers=max(1, min(WORKERS, len(todo) or 1))) as ex:
+        futures = {ex.submit(build_category, category, files, prev_outputs.get(category, {})): category
+                   for category, (files, _) in todo.items()}
+        for fut in as_completed(futures):
+            category = futures[fut]
+            try:
+                _, outputs, written, removed = fut.result()
+            except Exception as e:
+                print(f"Error processing category {category}: {e}")
+                # 前回の出力は残っているので記録し続ける（入力は記録しないので次回作り直す）
+                if category in prev_outputs:
+                    new_state["outputs"][category] = prev_outputs[category]
+                continue
+            new_state["inputs"][category] = todo[category][1]
+            new_state["outputs"][category] = outputs
+            print(f"Done {category}: {len(outputs)} outputs, {written} written, {removed} removed")
+
+    tracked = {p for outputs in new_state["outputs"].values() for p in outputs}
+    swept = sweep_untracked(tracked)
+    if swept:
+        print(f"Removed {swept} untracked outputs")
+    save_state(new_state)
     print("Processing completed.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
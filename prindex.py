@@ -0,0 +1,308 @@
+"""
+prgen.py の出力（カテゴリ → ローマ字プレフィックス → n → {gram: freq}）を
+カテゴリごとに 1 つのバイナリファイルにまとめる / 読み出すためのモジュール。
+
+JSON ツリーでは同じ gram が含まれるプレフィックスの数だけコピーされるが、
+このファイルでは gram 表を 1 回だけ持ち、プレフィックスごとには
+gram ID の posting list だけを持つ。mmap でそのまま読めるので、
+ロードはヘッダを読むだけで終わる。posting list は文字数ごとに頻度降順で
+並べ、累積頻度の列も持つので、上位 k 件はソートなしの切り出しで返せる。
+
+ファイル形式（リトルエンディアン前提、各セクションは 8 バイト境界に揃える）:
+  header        : magic "PRIX", version, gram 数 G, prefix 数 P, 各セクションのオフセット
+  gram_offsets  : uint32[G+1]   gram_pool 内の開始位置
+  gram_pool     : UTF-8 の gram 文字列を連結したもの（gram は文字列順 = ID 順）
+  gram_freq     : uint64[G]
+  gram_len      : uint16[G]     gram の文字数（= JSON ファイル名の n）
+  prefix_offsets: uint32[P+1]   prefix_pool 内の開始位置
+  prefix_pool   : ASCII のプレフィックスを文字列順に連結したもの
+  post_offsets  : uint32[P+1]   postings 内の開始位置
+  postings      : uint32[...]   プレフィックスごとの gram ID（(文字数, 頻度降順, ID) 順）
+  post_cum      : uint64[...]   postings と並行。同じ (プレフィックス, 文字数) 内での累積頻度
+
+convert.py 用に、プレフィックスを持たない gram 表だけのファイル（magic "PRGT"）も
+扱う。gram 順に並んだ (gram, freq) を流し込んで書き、GramTable で二分探索して引く。
+  header        : magic "PRGT", version, gram 数 G, 予約, 各セクションのオフセット
+  gram_offsets  : uint32[G+1]
+  gram_freq     : uint64[G]
+  gram_pool     : UTF-8 の gram 文字列を連結したもの（gram 順）
+
+使い方:
+  with PrefixIndex("pr_processed/wikikana.prix") as idx:
+      idx.get("ka", 2)     # pr_processed/wikikana/ka/2gm.json と同じ dict
+      idx.lookup("ka")     # {1: {...}, 2: {...}, 3: {...}}
+      idx.top("ka", 2, 10) # [(gram, freq, 累積頻度), ...] 頻度降順の上位 10 件
+"""
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+
+MAGIC = b"PRIX"
+VERSION = 2
+_HEADER = struct.Struct("<4sIII9Q")
+TABLE_MAGIC = b"PRGT"
+TABLE_VERSION = 1
+_TABLE_HEADER = struct.Struct("<4sIII3Q")
+
+
+def _pad(buf: bytearray):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def write_index(path, prefix_data):
+    """prefix_data: {prefix: {n: {gram: freq}}} を path に書き出す"""
+    freqs = {}
+    for n_gram_data in prefix_data.values():
+        for text_data in n_gram_data.values():
+            freqs.update(text_data)
+    grams = sorted(freqs)
+    gram_id = {g: i for i, g in enumerate(grams)}
+
+    gram_offsets = array("I", [0])
+    gram_pool = bytearray()
+    for g in grams:
+        gram_pool.extend(g.encode("utf-8"))
+        gram_offsets.append(len(gram_pool))
+    gram_freq = array("Q", (int(freqs[g]) for g in grams))
+    gram_len = array("H", (len(g) for g in grams))
+
+    prefixes = sorted(prefix_data)
+    prefix_offsets = array("I", [0])
+    prefix_pool = bytearray()
+    post_offsets = array("I", [0])
+    postings = array("I")
+    post_cum = array("Q")
+    for prefix in prefixes:
+        prefix_pool.extend(prefix.encode("ascii"))
+        prefix_offsets.append(len(prefix_pool))
+        ids = set()
+        for text_data in prefix_data[prefix].values():
+            ids.update(gram_id[g] for g in text_data)
+        cum = 0
+        last_len = None
+        for i in sorted(ids, key=lambda i: (gram_len[i], -gram_freq[i], i)):
+            if gram_len[i] != last_len:
+                cum = 0
+                last_len = gram_len[i]
+            cum += gram_freq[i]
+            postings.append(i)
+            post_cum.append(cum)
+        post_offsets.append(len(postings))
+
+    body = bytearray()
+    offsets = []
+    for section in (gram_offsets, gram_pool, gram_freq, gram_len,
+                    prefix_offsets, prefix_pool, post_offsets, postings, post_cum):
+        offsets.append(_HEADER.size + len(body))
+        body.extend(section.tobytes() if isinstance(section, array) else section)
+        _pad(body)
+    header = _HEADER.pack(MAGIC, VERSION, len(grams), len(prefixes), *offsets)
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(body)
+    return len(grams), len(prefixes)
+
+
+class PrefixIndex:
+    """write_index で作ったファイルを mmap して読む"""
+
+    def __init__(self, path):
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_grams, self.n_prefixes, *offs = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a prefix index (v{VERSION}): {path}")
+        G, P = self.n_grams, self.n_prefixes
+        mv = memoryview(self._mm)
+        self._gram_offsets = mv[offs[0]:offs[0] + 4 * (G + 1)].cast("I")
+        self._gram_pool = mv[offs[1]:offs[2]]
+        self._gram_freq = mv[offs[2]:offs[2] + 8 * G].cast("Q")
+        self._gram_len = mv[offs[3]:offs[3] + 2 * G].cast("H")
+        self._prefix_offsets = mv[offs[4]:offs[4] + 4 * (P + 1)].cast("I")
+        self._prefix_pool = mv[offs[5]:offs[6]]
+        self._post_offsets = mv[offs[6]:offs[6] + 4 * (P + 1)].cast("I")
+        n_post = self._post_offsets[P] if P else 0
+        self._postings = mv[offs[7]:offs[7] + 4 * n_post].cast("I")
+        self._post_cum = mv[offs[8]:offs[8] + 8 * n_post].cast("Q")
+        self._views = [self._gram_offsets, self._gram_pool, self._gram_freq, self._gram_len,
+                       self._prefix_offsets, self._prefix_pool, self._post_offsets, self._postings,
+                       self._post_cum]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for v in self._views:
+            v.release()
+        self._views = []
+        self._mm.close()
+        self._f.close()
+
+    def _prefix(self, i):
+        return bytes(self._prefix_pool[self._prefix_offsets[i]:self._prefix_offsets[i + 1]]).decode("ascii")
+
+    def gram(self, gid):
+        return bytes(self._gram_pool[self._gram_offsets[gid]:self._gram_offsets[gid + 1]]).decode("utf-8")
+
+    def freq(self, gid):
+        return self._gram_freq[gid]
+
+    def prefixes(self):
+        return [self._prefix(i) for i in range(self.n_prefixes)]
+
+    def _find(self, prefix):
+        keys = _PrefixKeys(self)
+        i = bisect_left(keys, prefix)
+        if i < self.n_prefixes and self._prefix(i) == prefix:
+            return i
+        return None
+
+    def __contains__(self, prefix):
+        return self._find(prefix) is not None
+
+    def _group(self, i, n):
+        """プレフィックス i の posting list のうち文字数 n の範囲 [lo, hi) を二分探索で返す"""
+        lo, hi = self._post_offsets[i], self._post_offsets[i + 1]
+
+        def first_at_least(length, a, b):
+            while a < b:
+                mid = (a + b) // 2
+                if self._gram_len[self._postings[mid]] < length:
+                    a = mid + 1
+                else:
+                    b = mid
+            return a
+
+        start = first_at_least(n, lo, hi)
+        return start, first_at_least(n + 1, start, hi)
+
+    def postings(self, prefix, n=None):
+        """prefix の gram ID を (文字数, 頻度降順) で返す。n を指定するとその文字数だけ"""
+        i = self._find(prefix)
+        if i is None:
+            return []
+        if n is None:
+            lo, hi = self._post_offsets[i], self._post_offsets[i + 1]
+        else:
+            lo, hi = self._group(i, n)
+        return self._postings[lo:hi].tolist()
+
+    def top(self, prefix, n, k=None):
+        """prefix・文字数 n の上位 k 件を [(gram, freq, 累積頻度)] で返す（k=None なら全件）"""
+        i = self._find(prefix)
+        if i is None:
+            return []
+        lo, hi = self._group(i, n)
+        if k is not None:
+            hi = min(hi, lo + k)
+        return [(self.gram(g), self._gram_freq[g], self._post_cum[j])
+                for j, g in zip(range(lo, hi), self._postings[lo:hi].tolist())]
+
+    def total(self, prefix, n):
+        """prefix・文字数 n の頻度合計"""
+        i = self._find(prefix)
+        if i is None:
+            return 0
+        lo, hi = self._group(i, n)
+        return self._post_cum[hi - 1] if hi > lo else 0
+
+    def get(self, prefix, n):
+        """pr_processed/<category>/<prefix>/<n>gm.json と同じ {gram: freq} を返す"""
+        return {self.gram(g): self._gram_freq[g] for g in self.postings(prefix, n)}
+
+    def lookup(self, prefix):
+        """{n: {gram: freq}} を返す"""
+        out = {}
+        for g in self.postings(prefix):
+            out.setdefault(self._gram_len[g], {})[self.gram(g)] = self._gram_freq[g]
+        return out
+
+
+class _PrefixKeys:
+    """bisect 用にプレフィックス列をシーケンスとして見せる"""
+
+    def __init__(self, idx):
+        self.idx = idx
+
+    def __len__(self):
+        return self.idx.n_prefixes
+
+    def __getitem__(self, i):
+        return self.idx._prefix(i)
+
+
+def write_table(path, rows):
+    """gram 順の (gram, freq) の列を gram 表ファイルに書く。戻りは gram 数"""
+    gram_offsets = array("I", [0])
+    gram_freq = array("Q")
+    gram_pool = bytearray()
+    for gram, freq in rows:
+        gram_pool.extend(gram.encode("utf-8"))
+        gram_offsets.append(len(gram_pool))
+        gram_freq.append(int(freq))
+    body = bytearray()
+    offsets = []
+    for section in (gram_offsets, gram_freq, gram_pool):
+        offsets.append(_TABLE_HEADER.size + len(body))
+        body.extend(section.tobytes() if isinstance(section, array) else section)
+        _pad(body)
+    with open(path, "wb") as f:
+        f.write(_TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, len(gram_freq), 0, *offsets))
+        f.write(body)
+    return len(gram_freq)
+
+
+class GramTable:
+    """write_table で作ったファイルを mmap して読む"""
+
+    def __init__(self, path):
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.n_grams, _, *offs = _TABLE_HEADER.unpack_from(self._mm, 0)
+        if magic != TABLE_MAGIC or version != TABLE_VERSION:
+            raise ValueError(f"not a gram table (v{TABLE_VERSION}): {path}")
+        G = self.n_grams
+        mv = memoryview(self._mm)
+        self._gram_offsets = mv[offs[0]:offs[0] + 4 * (G + 1)].cast("I")
+        self._gram_freq = mv[offs[1]:offs[1] + 8 * G].cast("Q")
+        self._gram_pool = mv[offs[2]:offs[2] + self._gram_offsets[G]]
+        self._views = [self._gram_offsets, self._gram_freq, self._gram_pool]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for v in self._views:
+            v.release()
+        self._views = []
+        self._mm.close()
+        self._f.close()
+
+    def __len__(self):
+        return self.n_grams
+
+    def gram(self, gid):
+        return bytes(self._gram_pool[self._gram_offsets[gid]:self._gram_offsets[gid + 1]]).decode("utf-8")
+
+    def get(self, gram, default=None):
+        lo, hi = 0, self.n_grams
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.gram(mid) < gram:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_grams and self.gram(lo) == gram:
+            return self._gram_freq[lo]
+        return default
+
+    def items(self):
+        for gid in range(self.n_grams):
+            yield self.gram(gid), self._gram_freq[gid]
@@ -0,0 +1,235 @@
+"""
+仮名の n-gram 頻度表（pr/<source>{n}gram.json や hplt の読みの TSV）から、
+ローマ字入力したときの打鍵 k-gram 頻度表を作る。
+
+- 変換表（ROMA_TABLE + 拗音 + 小書き仮名）は起動時に 1 度だけ最長一致の正規表現に
+  まとめる。gram を仮名単位（「きゃ」「ふぁ」などは 1 単位）に切って表を引き、
+  「っ」は次の単位の子音を重ねる（母音・記号の前や末尾では xtu）、
+  「ん」は母音・y・n の前と末尾では nn、それ以外では n にする。
+- 同じ打鍵を何度も数えないよう、各 gram からは「gram の先頭の 1 要素の中で始まる」
+  打鍵 k-gram だけを数える。要素は文字 n-gram（pr/ の JSON）なら最初の仮名単位、
+  トークン n-gram（--tsv。gram は空白区切りのトークン列）なら最初のトークン全体。
+  コーパスの各要素の位置はちょうど 1 つの gram の先頭なので、全 gram の分を足すと
+  コーパス全体の打鍵 k-gram 頻度になる（文書の末尾の数要素は短い gram の先頭にしか
+  ならないので、そこから始まる打鍵はわずかに少なく数えられる）。
+  小書きの「ゃ」などで始まる gram は前の単位の続きなので数えない。
+- gram の最後の単位は、後ろに続く文字で綴りが変わりうる（き → きゃ、っ、ん）ので、
+  そういう単位にかかる k-gram は数えない。長い k-gram が欲しければ次数の高い
+  仮名 n-gram を入力にする。
+
+出力: roma/<name>roma{k}gram.json（打鍵列 → 頻度、頻度降順）
+
+使い方:
+  python romagen.py --source wikikana               # pr/wikikana3gram.json から 1〜3 打鍵
+  python romagen.py --source tsukimiso --k 1 2 3 4
+  python romagen.py --tsv "D:\\gramdata\\hplt\\reading\\3hplt*.txt" --name hpltreading
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+from collections import Counter
+
+# --- 設定 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PR_DIR = os.path.join(BASE_DIR, "pr")
+OUT_DIR = os.path.join(BASE_DIR, "roma")
+KEY_ORDERS = (1, 2, 3)
+
+ROMA_TABLE = {
+    'あ': 'a', 'い': 'i', 'う': 'u', 'え': 'e', 'お': 'o',
+    'か': 'ka', 'き': 'ki', 'く': 'ku', 'け': 'ke', 'こ': 'ko',
+    'さ': 'sa', 'し': 'shi', 'す': 'su', 'せ': 'se', 'そ': 'so',
+    'た': 'ta', 'ち': 'chi', 'つ': 'tsu', 'て': 'te', 'と': 'to',
+    'な': 'na', 'に': 'ni', 'ぬ': 'nu', 'ね': 'ne', 'の': 'no',
+    'は': 'ha', 'ひ': 'hi', 'ふ': 'fu', 'へ': 'he', 'ほ': 'ho',
+    'ま': 'ma', 'み': 'mi', 'む': 'mu', 'め': 'me', 'も': 'mo',
+    'や': 'ya', 'ゆ': 'yu', 'よ': 'yo',
+    'ら': 'ra', 'り': 'ri', 'る': 'ru', 'れ': 're', 'ろ': 'ro',
+    'わ': 'wa', 'を': 'wo', 'ゐ': 'wi', 'ゑ': 'we',
+    'が': 'ga', 'ぎ': 'gi', 'ぐ': 'gu', 'げ': 'ge', 'ご': 'go',
+    'ざ': 'za', 'じ': 'ji', 'ず': 'zu', 'ぜ': 'ze', 'ぞ': 'zo',
+    'だ': 'da', 'ぢ': 'di', 'づ': 'du', 'で': 'de', 'ど': 'do',
+    'ば': 'ba', 'び': 'bi', 'ぶ': 'bu', 'べ': 'be', 'ぼ': 'bo',
+    'ぱ': 'pa', 'ぴ': 'pi', 'ぷ': 'pu', 'ぺ': 'pe', 'ぽ': 'po',
+    'ゔ': 'vu',
+    # 単独の小書き仮名
+    'ぁ': 'xa', 'ぃ': 'xi', 'ぅ': 'xu', 'ぇ': 'xe', 'ぉ': 'xo',
+    'ゃ': 'xya', 'ゅ': 'xyu', 'ょ': 'xyo', 'ゎ': 'xwa',
+    # 記号（IME での打ち方）
+    'ー': '-', '、': ',', '。': '.', '・': '/', '「': '[', '」': ']',
+    '？': '?', '！': '!',
+}
+# 拗音: 子音部分 + や/ゆ/よ の母音部分
+YOON_HEADS = {
+    'き': 'ky', 'ぎ': 'gy', 'し': 'sh', 'じ': 'j', 'ち': 'ch', 'に': 'ny',
+    'ひ': 'hy', 'び': 'by', 'ぴ': 'py', 'み': 'my', 'り': 'ry',
+}
+# 小書きの母音と組む外来音
+EXTRA_DIGRAPHS = {
+    'ふぁ': 'fa', 'ふぃ': 'fi', 'ふぇ': 'fe', 'ふぉ': 'fo',
+    'てぃ': 'thi', 'でぃ': 'dhi', 'とぅ': 'twu', 'どぅ': 'dwu',
+    'うぃ': 'whi', 'うぇ': 'whe', 'うぉ': 'who',
+    'しぇ': 'she', 'じぇ': 'je', 'ちぇ': 'che',
+    'ゔぁ': 'va', 'ゔぃ': 'vi', 'ゔぇ': 've', 'ゔぉ': 'vo',
+}
+SMALL_KANA = set('ぁぃぅぇぉゃゅょゎ')
+# -------------
+
+_CONSONANTS = set('bcdfghjklmpqrstvwxyz')
+_KATA_TO_HIRA = str.maketrans({chr(c): chr(c - 0x60) for c in range(0x30A1, 0x30F5)})
+
+
+def compile_table():
+    """変換表を作り、(単位の正規表現, {単位: ローマ字}, 後ろの文字で綴りが変わる単位) を返す"""
+    table = dict(ROMA_TABLE)
+    for head, cons in YOON_HEADS.items():
+        for small, vowel in (('ゃ', 'a'), ('ゅ', 'u'), ('ょ', 'o')):
+            table[head + small] = cons + vowel
+    table.update(EXTRA_DIGRAPHS)
+    # 2 文字の単位の先頭になりうる仮名と、っ・ん は gram の末尾では綴りが確定しない
+    open_units = {k[0] for k in table if len(k) == 2} | {'っ', 'ん'}
+    keys = sorted(list(table) + ['っ', 'ん'], key=len, reverse=True)
+    pattern = re.compile('|'.join(map(re.escape, keys)) + '|.', re.S)
+    return pattern, table, open_units
+
+
+_UNIT_RE, _TABLE, _OPEN_UNITS = compile_table()
+
+
+def to_units(kana):
+    """仮名列を単位ごとのローマ字のリストにする。変換できない文字があれば None"""
+    units = _UNIT_RE.findall(kana.translate(_KATA_TO_HIRA))
+    roma = []
+    for u in units:
+        r = _TABLE.get(u)
+        if r is None and u not in ('っ', 'ん'):
+            return None, units
+        roma.append(r)
+    # っ と ん は次の単位を見て決める
+    for i in range(len(units) - 1, -1, -1):
+        nxt = roma[i + 1] if i + 1 < len(roma) else ''
+        if units[i] == 'っ':
+            roma[i] = nxt[0] if nxt and nxt[0] in _CONSONANTS else 'xtu'
+        elif units[i] == 'ん':
+            roma[i] = 'nn' if not nxt or nxt[0] in 'aiueoyn' else 'n'
+    return roma, units
+
+
+def to_romaji(kana):
+    roma, _ = to_units(kana)
+    return None if roma is None else ''.join(roma)
+
+
+def count_keys(rows, key_orders=KEY_ORDERS, tokens=False):
+    """(仮名 gram, 頻度) の列から {k: Counter(打鍵 k-gram)} を作る。戻りは (結果, 統計)。
+    tokens が True なら gram は空白区切りのトークン列で、最初のトークン全体の中で始まる打鍵を数える"""
+    counters = {k: Counter() for k in key_orders}
+    stats = {'grams': 0, 'skipped': 0, 'continuation': 0}
+    for gram, freq in rows:
+        head_chars = len(gram.split(' ', 1)[0]) if tokens else None
+        gram = gram.replace(' ', '')
+        if not gram:
+            continue
+        if gram[0] in SMALL_KANA:
+            stats['continuation'] += 1
+            continue
+        roma, units = to_units(gram)
+        if roma is None:
+            stats['skipped'] += 1
+            continue
+        stats['grams'] += 1
+        text = ''.join(roma)
+        end = len(text)
+        if len(units) > 1 and units[-1] in _OPEN_UNITS:
+            end -= len(roma[-1])
+        if tokens:
+            # 最初のトークンにかかる単位（トークンの境目をまたぐ単位も含める）のローマ字の長さ
+            head = chars = 0
+            for r, u in zip(roma, units):
+                if chars >= head_chars:
+                    break
+                head += len(r)
+                chars += len(u)
+        else:
+            head = len(roma[0])
+        for start in range(head):
+            for k in key_orders:
+                if start + k > end:
+                    break
+                counters[k][text[start:start + k]] += freq
+    return counters, stats
+
+
+def iter_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    yield from data.items()
+
+
+def iter_tsv(paths):
+    """gram<TAB>count の TSV（hplt の出力形式。gram は空白区切りのトークン列）"""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for ln in f:
+                ln = ln.rstrip('\n')
+                if not ln:
+                    continue
+                try:
+                    gram, cnt = ln.rsplit('\t', 1)
+                    yield gram, int(cnt)
+                except ValueError:
+                    continue
+
+
+def write_tables(counters, name, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    for k, counter in counters.items():
+        path = os.path.join(out_dir, f"{name}roma{k}gram.json")
+        data = dict(sorted(counter.items(), key=lambda kv: (-kv[1], kv[0])))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"書き出し: {path} ({len(data)} 件)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="仮名 n-gram 頻度からローマ字打鍵 k-gram 頻度を作る")
+    parser.add_argument('--source', help="pr/ の頻度データ名（wikikana, tsukimiso, ...）")
+    parser.add_argument('--order', type=int, default=None, help="使う仮名 n-gram の次数（既定: ある中で最大）")
+    parser.add_argument('--tsv', action='append', help="gram<TAB>count の TSV（glob 可、複数指定可）")
+    parser.add_argument('--name', default=None, help="出力名（既定: --source の名前）")
+    parser.add_argument('--k', type=int, nargs='+', default=list(KEY_ORDERS), help="打鍵 k-gram の k")
+    parser.add_argument('--out', default=OUT_DIR, help="出力先ディレクトリ")
+    args = parser.parse_args()
+
+    if args.source:
+        orders = [args.order] if args.order else [3, 2, 1]
+        paths = [os.path.join(PR_DIR, f"{args.source}{n}gram.json") for n in orders]
+        paths = [p for p in paths if os.path.exists(p)]
+        if not paths:
+            print(f"エラー: {PR_DIR} に {args.source} の n-gram JSON がありません", file=sys.stderr)
+            sys.exit(1)
+        print(f"入力: {paths[0]}")
+        rows = iter_json(paths[0])
+        name = args.name or args.source
+    elif args.tsv:
+        paths = sorted(p for pattern in args.tsv for p in glob.glob(pattern))
+        if not paths:
+            print("エラー: TSV が見つかりません", file=sys.stderr)
+            sys.exit(1)
+        print(f"入力: TSV {len(paths)} ファイル")
+        rows = iter_tsv(paths)
+        name = args.name or 'tsv'
+    else:
+        parser.error("--source か --tsv を指定してください")
+
+    counters, stats = count_keys(rows, sorted(set(args.k)), tokens=bool(args.tsv) and not args.source)
+    print(f"gram {stats['grams']} 件を変換 (変換できない文字を含む {stats['skipped']} 件, "
+          f"小書き仮名で始まる {stats['continuation']} 件を除外)")
+    write_tables(counters, name, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
 from pathlib import Path
 from datasets import load_dataset
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import re
 
+from process import DROP_PATTERN, SKIP_PATTERN, strip_tokens
+
 # ----- 設定（引数ではなくここに全て固定） -----
 DATASET = "range3/wiki40b-ja"
 SPLITS = ["train", "validation", "test"]
@@ -9,6 +14,10 @@ OUT_DIR = Path(r"D:\gramdata\wiki\data")
 PREFIX = "wiki40b-ja_"
 CHUNK_MB = 50  # 50 MiB ごとにファイルをローテート
 PROGRESS_INTERVAL = 10000  # 何件ごとに進捗出力するか
+MODE = "batch"  # "batch": Arrow のレコードバッチ単位で列ごとに処理 / "row": 1 行ずつ処理（旧方式）
+BATCH_SIZE = 10000  # batch モードで 1 度に読む行数
+STREAMING = False  # True なら全データをキャッシュせずストリーミングで読む（batch モードのみ）
+STRIP_TOKENS = True  # True なら書き出し時に _START_ARTICLE_ 等を除去する（process.py の処理が不要になる）
 # -----------------------------------------------
 
 def find_next_index(out_dir: Path, prefix: str):
@@ -77,6 +86,8 @@ def write_texts(dataset_name: str, splits, out_dir: Path, prefix: str, chunk_mb:
 
                 text = ex.get("text", "")
                 line = sanitize_line(text)
+                if STRIP_TOKENS:
+                    line = strip_tokens(line)
                 if not line:
                     continue
                 encoded = line.encode("utf-8")
@@ -100,6 +111,108 @@ def write_texts(dataset_name: str, splits, out_dir: Path, prefix: str, chunk_mb:
     print(f"[DONE] total items processed: {total_items:,}, total bytes written: {total_written:,}")
     print(f"[DONE] last index: {current_index:04d}")
 
+def sanitize_column(col, strip: bool = STRIP_TOKENS):
+    """sanitize_line（と strip なら strip_tokens）を列全体にまとめて適用し、空行を除いた列を返す"""
+    col = pc.replace_substring(col, "\r", " ")
+    col = pc.replace_substring(col, "\n", " ")
+    if strip:
+        col = pc.replace_substring_regex(col, SKIP_PATTERN, "")
+        col = pc.replace_substring_regex(col, DROP_PATTERN, "")
+    col = pc.utf8_trim_whitespace(col)
+    return col.filter(pc.and_(pc.is_valid(col), pc.greater(pc.utf8_length(col), 0)))
+
+def column_to_buffer(col):
+    """文字列列を "行\n" の連結バイト列とその行境界オフセット（int64, len+1）に変換する"""
+    lines = pc.binary_join_element_wise(col, "", "\n").cast(pa.large_string())
+    bufs = lines.buffers()
+    offsets = np.frombuffer(bufs[1], dtype=np.int64)[lines.offset:lines.offset + len(lines) + 1]
+    data = memoryview(bufs[2]) if bufs[2] is not None else memoryview(b"")
+    return data, offsets
+
+class RotatingWriter:
+    """{prefix}{idx:04d}.txt に書き、chunk_bytes を超える前に次のファイルへ移る（行は分割しない）"""
+
+    def __init__(self, out_dir: Path, prefix: str, chunk_bytes: int):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.chunk_bytes = chunk_bytes
+        self.index = find_next_index(out_dir, prefix)
+        self.file = None
+        self.written = 0
+        self.total = 0
+        self._open()
+
+    def _open(self):
+        if self.file:
+            self.file.close()
+        fname = self.out_dir / f"{self.prefix}{self.index:04d}.txt"
+        self.file = open(fname, "wb")
+        self.written = 0
+        print(f"[INFO] opened {fname}")
+
+    def write_lines(self, data, offsets):
+        """data[offsets[i]:offsets[i+1]] が 1 行。ファイル境界をまたがないように区切って書く"""
+        i = 0
+        n = len(offsets) - 1
+        while i < n:
+            room = self.chunk_bytes - self.written
+            # offsets[i] から room バイトに収まる最後の行境界
+            j = int(np.searchsorted(offsets, offsets[i] + room, side="right")) - 1
+            if j <= i:
+                if self.written > 0:
+                    self.index += 1
+                    self._open()
+                    continue
+                j = i + 1  # 1 行だけで上限を超える場合もそのまま書く
+            lo, hi = int(offsets[i]), int(offsets[j])
+            self.file.write(data[lo:hi])
+            self.written += hi - lo
+            self.total += hi - lo
+            i = j
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def iter_text_batches(dataset_name: str, split: str, batch_size: int, streaming: bool):
+    """split の "text" 列を pyarrow の配列としてバッチごとに返す"""
+    if streaming:
+        ds = load_dataset(dataset_name, split=split, streaming=True)
+        for batch in ds.iter(batch_size=batch_size):
+            yield pa.array(batch["text"], type=pa.string())
+    else:
+        ds = load_dataset(dataset_name, split=split)
+        print(f"[INFO] split {split} has {len(ds)} rows")
+        for table in ds.with_format("arrow").iter(batch_size=batch_size):
+            yield table.column("text").combine_chunks()
+
+def write_texts_batched(dataset_name: str, splits, out_dir: Path, prefix: str, chunk_mb: int,
+                        batch_size: int = BATCH_SIZE, streaming: bool = STREAMING):
+    """write_texts と同じ出力を、Arrow のレコードバッチ単位・列単位の処理で書く"""
+    ensure_out_dir(out_dir)
+    writer = RotatingWriter(out_dir, prefix, chunk_mb * 1024 * 1024)
+    total_items = 0
+    next_report = PROGRESS_INTERVAL
+    try:
+        for split in splits:
+            print(f"[INFO] processing split: {split} ({'streaming' if streaming else 'cached'}, batch={batch_size})")
+            count = 0
+            for col in iter_text_batches(dataset_name, split, batch_size, streaming):
+                count += len(col)
+                total_items += len(col)
+                data, offsets = column_to_buffer(sanitize_column(col))
+                writer.write_lines(data, offsets)
+                if total_items >= next_report:
+                    next_report = (total_items // PROGRESS_INTERVAL + 1) * PROGRESS_INTERVAL
+                    print(f"[PROGRESS] items={total_items:,}, current_file_bytes={writer.written:,}, total_written={writer.total:,}")
+            print(f"[INFO] finished split {split}: iterated {count} items")
+    finally:
+        writer.close()
+
+    print(f"[DONE] total items processed: {total_items:,}, total bytes written: {writer.total:,}")
+    print(f"[DONE] last index: {writer.index:04d}")
+
 def main():
     print("[CONFIG] fixed configuration:")
     print(f"  DATASET = {DATASET}")
@@ -107,8 +220,15 @@ def main():
     print(f"  OUT_DIR = {OUT_DIR}")
     print(f"  PREFIX  = {PREFIX}")
     print(f"  CHUNK_MB = {CHUNK_MB}")
+    print(f"  MODE = {MODE} (BATCH_SIZE = {BATCH_SIZE}, STREAMING = {STREAMING})")
+    print(f"  STRIP_TOKENS = {STRIP_TOKENS}")
     print()
 
+    if MODE == "batch":
+        # split ごとに Arrow のバッチを読みながら直接書き出す（STREAMING なら全体をキャッシュしない）
+        write_texts_batched(DATASET, SPLITS, OUT_DIR, PREFIX, CHUNK_MB, BATCH_SIZE, STREAMING)
+        return
+
     # 1) まず全データをダウンロード（キャッシュ）しておく
     download_all_dataset(DATASET)
 
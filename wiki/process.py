@@ -8,8 +8,15 @@ Behavior:
   The following _START_PARAGRAPH_ is also removed.
 - Process each file streamingly and write to a temporary file, then atomically
   replace the original. No backup of the original will be kept (MAKE_BACKUP=False).
+- Files are processed in a process pool (WORKERS).
+
+The same cleanup is available per text as strip_tokens() (and as SKIP_PATTERN /
+DROP_PATTERN for regex engines), which wiki/dl.py applies during export so
+freshly exported files do not need this in-place pass.
 """
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 import re
 import shutil
 
@@ -20,6 +27,7 @@ GLOB_PATTERN = f"{PREFIX}*.txt"
 ENCODING = "utf-8"
 MAKE_BACKUP = False  # バックアップを取らない
 BACKUP_DIR = IN_DIR / "backup_originals"
+WORKERS = os.cpu_count() or 1  # 並列に処理するファイル数
 # -------------------------------
 
 TOK_START_PARAGRAPH = "_START_PARAGRAPH_"
@@ -30,6 +38,21 @@ TOK_NEWLINE = "_NEWLINE_"
 ALL_TOKENS = [TOK_START_ARTICLE, TOK_START_SECTION, TOK_START_PARAGRAPH, TOK_NEWLINE]
 TOKEN_REGEX = re.compile("(" + "|".join(re.escape(t) for t in ALL_TOKENS) + ")")
 
+# Single-line equivalent of process_line_stream: an ARTICLE/SECTION token and
+# everything up to and including the next START_PARAGRAPH (or end of text) is
+# dropped, then the remaining PARAGRAPH/NEWLINE tokens are removed.
+SKIP_PATTERN = (
+    "(?:" + re.escape(TOK_START_ARTICLE) + "|" + re.escape(TOK_START_SECTION) + ")"
+    ".*?(?:" + re.escape(TOK_START_PARAGRAPH) + "|$)"
+)
+DROP_PATTERN = re.escape(TOK_START_PARAGRAPH) + "|" + re.escape(TOK_NEWLINE)
+SKIP_REGEX = re.compile(SKIP_PATTERN, re.S)
+DROP_REGEX = re.compile(DROP_PATTERN)
+
+def strip_tokens(text: str) -> str:
+    """Clean one text (e.g. one wiki40b article) the way process_line_stream cleans a line."""
+    return DROP_REGEX.sub("", SKIP_REGEX.sub("", text)).strip()
+
 def process_line_stream(lines):
     """
     Generator: process input lines and yield output lines (no trailing newline).
@@ -136,11 +159,15 @@ def main():
         print(f"[WARN] no files matching {GLOB_PATTERN} in {IN_DIR}")
         return
 
-    for p in files:
-        try:
-            process_file_inplace(p, make_backup=MAKE_BACKUP, backup_dir=BACKUP_DIR if MAKE_BACKUP else None)
-        except Exception as e:
-            print(f"[ERROR] failed processing {p.name}: {e}")
+    backup_dir = BACKUP_DIR if MAKE_BACKUP else None
+    with ProcessPoolExecutor(max_workers=max(1, WORKERS)) as ex:
+        futures = {ex.submit(process_file_inplace, p, MAKE_BACKUP, backup_dir): p for p in files}
+        for fut in as_completed(futures):
+            p = futures[fut]
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"[ERROR] failed processing {p.name}: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file